@@ -31,6 +31,15 @@ from flask.json import JSONEncoder
 import calendar
 from datetime import datetime, date
 import dateutil.parser as dateparser
+from dateutil.relativedelta import relativedelta
+from functools import lru_cache, wraps
+from collections import OrderedDict
+import threading
+import time
+
+from response_cache import ResponseCache
+import raw_tables
+from point_index import PointIndex
 
 #######################
 # Setup
@@ -86,6 +95,63 @@ application.logger.debug('Tables available: {}'.format(tables))
 conn.close()
 logging.info(tables)
 
+
+##########################################
+# Response cache
+##########################################
+
+#The data only changes when LoadData loads a file, so responses are cached
+#until one of the tables they were built from is loaded again (see
+#response_cache.py)
+response_cache = ResponseCache(engine)
+
+
+def no_store(response):
+    '''
+    Marks a response as not to be cached, by cached_response or by browsers.
+    Used for responses that report a failed query, so the failure isn't
+    served again until the cache expires.
+    '''
+    response.cache_control.no_store = True
+    return response
+
+
+def cached_response(tables=None, vary=None):
+    '''
+    Decorator for endpoints whose output only depends on the url and the data
+    in the database.
+
+    tables: the destination_tables the endpoint reads, either a list or a
+    function that takes the endpoint's keyword arguments and returns one.
+    None means the response is invalidated when any table is loaded.
+
+    vary: optional function that takes the endpoint's keyword arguments and
+    returns anything else the output depends on (e.g. a default date of
+    today), which is added to the cache key.
+
+    Only 200 responses not marked with no_store are cached.
+    '''
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            dependencies = tables(**kwargs) if callable(tables) else tables
+            key = (request.path, tuple(sorted(request.args.items(multi=True))),
+                   vary(**kwargs) if vary is not None else None)
+
+            cached = response_cache.get(key, dependencies)
+            if cached is not None:
+                data, status, mimetype = cached
+                return Response(data, status=status, mimetype=mimetype)
+
+            response = application.make_response(view(**kwargs))
+            if response.status_code == 200 and not response.cache_control.no_store:
+                response_cache.set(key, dependencies,
+                                   (response.get_data(), response.status_code,
+                                    response.mimetype))
+            return response
+        return wrapper
+    return decorator
+
 ##########################################
 # API Endpoints
 ##########################################
@@ -95,6 +161,7 @@ def hello():
     return("The Housing Insights API Rules!")
 
 @application.route('/api/filter/', methods=['GET'])
+@cached_response(tables=['project', 'census', 'subsidy'])
 def filter_data():
     q = """
         select p.nlihc_id
@@ -128,27 +195,74 @@ def filter_data():
     return jsonify(output)
 
 
+RAW_PAGE_SIZE = 1000
+RAW_MAX_PAGE_SIZE = 10000
+
+#table: (load_date, unique key columns) - see raw_tables.unique_key
+_raw_table_keys = {}
+
+
+def get_raw_table_key(table):
+    '''
+    Returns the columns /api/raw/<table> pages on, re-checking the table's
+    indexes whenever it is loaded again.
+    '''
+    stamp = response_cache.load_dates().get(table)
+    cached = _raw_table_keys.get(table)
+    if cached is None or cached[0] != stamp:
+        conn = engine.connect()
+        cached = _raw_table_keys[table] = (stamp, raw_tables.unique_key(conn, table))
+        conn.close()
+    return cached[1]
+
+
 @application.route('/api/raw/<table>', methods=['GET'])
 @cross_origin()
 def list_all(table):
-    """ Generate endpoint to list all data in the tables. """
+    """
+    Generate endpoint to list all data in the tables.
+
+    Optional params:
+    limit: number of rows to return, default 1000 (max 10000)
+    after: the 'next' value from the previous page, to get the following page.
+           Only tables with a unique index (e.g. those files are merged into on
+           their natural_key) can be paged; for others 'next' is always null.
+    format: 'ndjson' to stream every row (after 'after', if given) as one
+            json object per line instead of returning a single page
+    """
 
     application.logger.debug('Table selected: {}'.format(table))
     if table not in tables:
         application.logger.error('Error:  Table does not exist.')
         abort(404)
 
-    #Query the database
-    conn = engine.connect()
-    q = 'SELECT row_to_json({}) from {} limit 1000;'.format(table, table)
-    proxy = conn.execute(q)
-    results = [x[0] for x in proxy.fetchmany(1000)] # Only fetching 1000 for now, need to implement scrolling
-    #print(results)
-    conn.close()
+    key = get_raw_table_key(table)
+    after = request.args.get('after')
+    if after is not None:
+        try:
+            if not key:
+                raise ValueError("Table {} can't be paged".format(table))
+            after = raw_tables.parse_after(after, key)
+        except ValueError:
+            abort(400)
+
+    if request.args.get('format') == 'ndjson':
+        rows = raw_tables.raw_rows(engine, table, key, after=after)
+        return Response(raw_tables.ndjson(rows), mimetype='application/x-ndjson')
 
-    return jsonify(items=results)
+    try:
+        limit = int(request.args.get('limit', RAW_PAGE_SIZE))
+    except ValueError:
+        abort(400)
+    limit = max(1, min(limit, RAW_MAX_PAGE_SIZE))
+
+    #Query the database
+    rows = raw_tables.raw_rows(engine, table, key, after=after, limit=limit)
+    results, next_key = raw_tables.page(rows, limit)
+    return jsonify(items=results, next=next_key)
 
 @application.route('/api/meta', methods=['GET'])
+@cached_response()
 def get_meta():
     '''
     Outputs the meta.json to the front end
@@ -160,6 +274,12 @@ def get_meta():
     return row[0]
 
 @application.route('/api/<method>/<table_name>/<filter_name>/<months>/<grouping>', methods=['GET'])
+#The rollup rows of table_name are written in the same transaction as its rows
+#and its SQL manifest load_date (see rollups.py), so table_name's load_date
+#also stamps the rollups the response was counted from
+@cached_response(tables=lambda table_name, grouping, **kwargs: [
+    table_name, 'census', 'census_tract_to_{}'.format(grouping)],
+    vary=lambda months, **kwargs: requested_date_range(months))
 def summarize_observations(method,table_name,filter_name,months,grouping):
     '''
     This endpoint takes a table that has each record as list of observations 
@@ -221,18 +341,7 @@ def summarize_observations(method,table_name,filter_name,months,grouping):
     #method currently not implemented. 'count' or 'rate'
 
 
-    start_date = request.args.get('start')
-    print("Start_date found: {}".format(start_date))
-    if start_date == None:
-        start_date = "now()"
-    else:
-        start_date = dateparser.parse(start_date,dayfirst=False,yearfirst=False)
-        start_date = datetime.strftime(start_date,'%Y-%m-%d')
-        start_date = "'" + start_date + "'"
-
-    date_range_sql = ("({start_date}::TIMESTAMP - INTERVAL '{months} months')"
-                      " AND {start_date}::TIMESTAMP"
-                      ).format(start_date=start_date, months=months)
+    date_range = requested_date_range(months)
 
 
     #########################
@@ -245,7 +354,9 @@ def summarize_observations(method,table_name,filter_name,months,grouping):
     ###############
     #Get results
     ###############
-    api_results = count_observations(table_name, grouping, date_field, date_range_sql, additional_wheres)
+    api_results = count_rollup_observations(table_name, filter_name, grouping, date_range)
+    if api_results is None:
+        api_results = count_observations(table_name, grouping, date_field, date_range, additional_wheres)
 
     #Edit the data_id. TODO this is not specific enough, need univeral system for handling unique data ids to be used on front end. 
     #Is this better handled here in the API or front end exclusively?
@@ -264,9 +375,64 @@ def summarize_observations(method,table_name,filter_name,months,grouping):
             api_results = scale(api_results, 100000) #crime incidents per 100,000 people
     
     #Output as JSON
+    if api_results['items'] is None:
+        return no_store(jsonify(api_results))
     return jsonify(api_results)
 
 
+def requested_date_range(months):
+    '''
+    Returns the observation_date_range of summarize_observations' months and
+    optional 'start' param, aborting with a 400 if either is invalid. Without
+    'start' the range ends today, so it is part of the cache key too.
+    '''
+    start_date = request.args.get('start')
+    print("Start_date found: {}".format(start_date))
+    try:
+        if start_date is not None:
+            start_date = datetime.strptime(format_start_date(start_date),
+                                           '%Y-%m-%d').date()
+        return observation_date_range(int(months), start_date)
+    except ValueError:
+        abort(400)
+
+
+def observation_date_range(months, start_date=None):
+    '''
+    Returns (first_day, end_day) covering the given number of months up to
+    and including start_date (default today). end_day is exclusive, so the
+    observations in range are those with first_day <= date_field < end_day.
+
+    Whole days are used so that the raw tables and the daily rollups
+    (housinginsights/ingestion/rollups.py) always count the same records.
+    '''
+    if months < 0:
+        raise ValueError("months must not be negative")
+    if start_date is None:
+        start_date = date.today()
+    end_day = start_date + relativedelta(days=1)
+    return start_date - relativedelta(months=months), end_day
+
+
+@lru_cache(maxsize=1024)
+def format_start_date(value):
+    '''
+    Returns the 'start' query parameter as YYYY-MM-DD. The documented
+    YYYYMMDD format (and YYYY-MM-DD) are read with strptime; anything else
+    goes through dateutil. The front end asks for the same few dates over and
+    over, so results are memoized.
+
+    This mirrors housinginsights.tools.dates.DateParser.
+    '''
+    for fmt in ('%Y%m%d', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            pass
+    _date = dateparser.parse(value, dayfirst=False, yearfirst=False)
+    return datetime.strftime(_date, '%Y-%m-%d')
+
+
 def items_divide(numerator_data, denominator_data):
     '''
     Divides items in the numerator by items in the denominator by matching
@@ -280,9 +446,12 @@ def items_divide(numerator_data, denominator_data):
     if numerator_data['items'] == None:
         items=None
     else:
+        denominators = {}
+        for item in denominator_data['items'] or []:
+            denominators.setdefault(item['group'], item)
         for n in numerator_data['items']:
             #TODO what should we do when a matching item isn't found?
-            matching_d = next((item for item in denominator_data['items'] if item['group'] == n['group']),{'group':'_unknown','count':None})
+            matching_d = denominators.get(n['group'], {'group':'_unknown','count':None})
             if matching_d['count'] == None or n['count']== None:
                 divided = None
             else:
@@ -321,7 +490,74 @@ def get_residential_units(grouping):
     #TODO implement me
     return None
 
-def count_observations(table_name, grouping, date_field, date_range_sql, additional_wheres=''):
+#Pre-aggregated counts by file, day and zone, rebuilt as each file is loaded
+#(see housinginsights/ingestion/rollups.py). Both these and the raw tables
+#are filtered on whole days from observation_date_range.
+ROLLUP_TABLE = 'observation_rollup'
+_rollups_available = {'checked': False, 'stamp': None, 'keys': frozenset()}
+
+
+def available_rollups():
+    '''
+    Returns the set of (source_table, filter_name, grouping) that have been
+    rolled up, re-checking after any table is loaded.
+    '''
+    stamp = response_cache.stamp()
+    if not _rollups_available['checked'] or _rollups_available['stamp'] != stamp:
+        keys = frozenset()
+        try:
+            conn = engine.connect()
+            proxy = conn.execute("SELECT DISTINCT source_table, filter_name, grouping "
+                                 "FROM {}".format(ROLLUP_TABLE))
+            keys = frozenset(tuple(x) for x in proxy.fetchall())
+            conn.close()
+        except Exception as e:
+            logging.info("Rollups not available: {}".format(e))
+        _rollups_available.update(checked=True, stamp=stamp, keys=keys)
+    return _rollups_available['keys']
+
+
+def count_rollup_observations(table_name, filter_name, grouping, date_range):
+    '''
+    Same as count_observations, but sums the daily counts in the rollup table
+    instead of grouping the raw observations. Returns None if that table,
+    filter and grouping haven't been rolled up.
+    '''
+    if (table_name, filter_name, grouping) not in available_rollups():
+        return None
+
+    fallback = "'Unknown'"
+    try:
+        conn = engine.connect()
+        q = """
+            SELECT COALESCE(zone,{fallback}) --'Unknown'
+            ,sum(records)::bigint AS records
+            FROM {rollup_table}
+            WHERE source_table = %(table_name)s
+            AND filter_name = %(filter_name)s
+            AND grouping = %(grouping)s
+            AND day >= %(first_day)s AND day < %(end_day)s
+            GROUP BY zone
+            ORDER BY zone
+            """.format(fallback=fallback, rollup_table=ROLLUP_TABLE)
+        proxy = conn.execute(q, {'table_name': table_name,
+                                 'filter_name': filter_name,
+                                 'grouping': grouping,
+                                 'first_day': date_range[0],
+                                 'end_day': date_range[1]})
+        formatted = [dict({'group':x[0], 'count':x[1]}) for x in proxy.fetchall()]
+        conn.close()
+        return {'items': formatted, 'grouping':grouping, 'data_id':table_name}
+    except Exception as e:
+        logging.warning("Rollup query failed, using raw table: {}".format(e))
+        return None
+
+
+def count_observations(table_name, grouping, date_field, date_range, additional_wheres=''):
+    '''
+    Counts the observations of table_name per grouping whose date_field is
+    in date_range, a (first_day, end_day) pair from observation_date_range.
+    '''
     fallback = "'Unknown'"
 
     try:
@@ -331,14 +567,14 @@ def count_observations(table_name, grouping, date_field, date_range_sql, additio
             SELECT COALESCE({grouping},{fallback}) --'Unknown'
             ,count(*) AS records
             FROM {table_name}
-            where {date_field} between {date_range_sql}
+            where {date_field} >= %(first_day)s AND {date_field} < %(end_day)s
             {additional_wheres}
             GROUP BY {grouping}
             ORDER BY {grouping}
             """.format(grouping=grouping,fallback=fallback,table_name=table_name,
-                date_field=date_field,date_range_sql=date_range_sql,additional_wheres=additional_wheres)
+                date_field=date_field,additional_wheres=additional_wheres)
 
-        proxy = conn.execute(q)
+        proxy = conn.execute(q, {'first_day': date_range[0], 'end_day': date_range[1]})
         results = proxy.fetchall()
 
         #transform the results.
@@ -387,15 +623,16 @@ def count_all(table_name,grouping):
     date_fields = {'building_permits': 'issue_date', 'crime': 'report_date'}
     date_field = date_fields[table_name]
 
-    date_range_sql = "'2016-01-01' and '2016-12-31'"
+    date_range = (date(2016, 1, 1), date(2017, 1, 1))
 
-    api_results = count_observations(table_name, grouping, date_field, date_range_sql)
+    api_results = count_observations(table_name, grouping, date_field, date_range)
     return jsonify(api_results)
 
 
 
 
 @application.route('/api/wmata/<nlihc_id>',  methods=['GET'])
+@cached_response(tables=['wmata_dist', 'wmata_info'])
 def nearby_transit(nlihc_id):
     '''
     Returns the nearby bus and metro routes and stops.
@@ -407,26 +644,29 @@ def nearby_transit(nlihc_id):
 
     conn = engine.connect()
     try:
+        #Get the stops and the lines serving each stop in a single query
         q = """
-            SELECT dist_in_miles, type, stop_id_or_station_code
-            FROM wmata_dist
-            WHERE nlihc_id = '{}'
-            """.format(nlihc_id)
-
-        proxy = conn.execute(q)
+            SELECT d.dist_in_miles, d.type, d.stop_id_or_station_code
+              , (SELECT string_agg(i.lines, ':') FROM wmata_info AS i
+                 WHERE i.stop_id_or_station_code = d.stop_id_or_station_code
+                ) AS lines
+            FROM wmata_dist AS d
+            WHERE d.nlihc_id = %(nlihc_id)s
+            """
+
+        proxy = conn.execute(q, {'nlihc_id': nlihc_id})
         results = proxy.fetchall()
 
         #transform the results.
-        stops = {'bus':[],'rail':[]};
-        rail_stops = []; bus_stops = [];
-        bus_routes = {}; rail_routes = {};
+        stops = {'bus':[],'rail':[]}
+        routes_by_type = {'bus':{}, 'rail':{}}
 
         for x in results:
             #reformat the data into appropriate json
             dist = str(x[0])
             typ = x[1]
             stop_id = x[2]
-            routes = unique_transit_routes([stop_id])
+            routes = parse_transit_routes(x[3])
 
             stop_dict = dict({'dist_in_miles':dist,
                             'type':typ,
@@ -434,59 +674,24 @@ def nearby_transit(nlihc_id):
                             'routes':routes
                             })
 
-            #Calculate summary statistics for ease of use
-            if typ == 'bus':
-                stops['bus'].append(stop_dict)
-                bus_stops.append(stop_id)
-
-                #Add all unique routes to a master list, with the shortest walking distance to that route
-                for route in routes:
-                    if route not in bus_routes:
-                        bus_routes[route] = {'route':route,'shortest_dist':10000}
-                    if float(dist) < float(bus_routes[route]['shortest_dist']):
-                        bus_routes[route]['shortest_dist'] = dist
-
-            if typ == 'rail':
-                stops['rail'].append(stop_dict)
-                rail_stops.append(stop_id)
+            if typ in stops:
+                stops[typ].append(stop_dict)
 
                 #Add all unique routes to a master list, with the shortest walking distance to that route
-                #TODO refactor this into reusable function
+                type_routes = routes_by_type[typ]
                 for route in routes:
-                    if route not in rail_routes:
-                        rail_routes[route] = {'route':route,'shortest_dist':10000}
-                    if float(dist) < float(rail_routes[route]['shortest_dist']):
-                        rail_routes[route]['shortest_dist'] = dist
-
-        #TODO - might be easier to approach this by using separate variables and then repackaging into the desired output format at the end?
-        #Rearrange the bus routes into a groups of shortest distance for easier display on front end
-        bus_routes_grouped = []
-        for key in bus_routes:
-            dist = bus_routes[key]['shortest_dist']
-            idx = idx_from_ld(bus_routes_grouped,'shortest_dist',dist)
-            if idx == None:
-                bus_routes_grouped.append({"shortest_dist":dist, "routes":[]})
-                idx = idx_from_ld(bus_routes_grouped,'shortest_dist',dist)
-            bus_routes_grouped[idx]['routes'].append(key)
-
-        #Rearrange rail
-        rail_routes_grouped = []
-        for key in rail_routes:
-            dist = rail_routes[key]['shortest_dist']
-            idx = idx_from_ld(rail_routes_grouped,'shortest_dist',dist)
-            if idx == None:
-                rail_routes_grouped.append({"shortest_dist":dist, "routes":[]})
-                idx = idx_from_ld(rail_routes_grouped,'shortest_dist',dist)
-            rail_routes_grouped[idx]['routes'].append(key)
-
-        #TODO would be good to sort rail_routes_grouped and bus_routes_grouped before delivery (currently sorting on the front end)
+                    if route not in type_routes:
+                        type_routes[route] = {'route':route,'shortest_dist':10000}
+                    if float(dist) < float(type_routes[route]['shortest_dist']):
+                        type_routes[route]['shortest_dist'] = dist
 
         conn.close()
+        #TODO would be good to sort rail_routes_grouped and bus_routes_grouped before delivery (currently sorting on the front end)
         return jsonify({'stops':stops,
-                        'bus_routes':bus_routes,
-                        'rail_routes':rail_routes,
-                        'bus_routes_grouped':bus_routes_grouped,
-                        'rail_routes_grouped':rail_routes_grouped
+                        'bus_routes':routes_by_type['bus'],
+                        'rail_routes':routes_by_type['rail'],
+                        'bus_routes_grouped':group_routes_by_distance(routes_by_type['bus']),
+                        'rail_routes_grouped':group_routes_by_distance(routes_by_type['rail'])
                         })
 
     except Exception as e:
@@ -494,61 +699,36 @@ def nearby_transit(nlihc_id):
         return "Query failed: {}".format(e)
 
 
-def idx_from_ld(lst,key,value):
+def parse_transit_routes(lines):
     '''
-    Takes a list of dictionaries and returns the dictionary
-    entry matching the key and value supplied
-    Used for data forms like this: [{'foo':'bar'},{'foo':'asdf'}]
+    Returns the unique routes in the : separated list of lines from wmata_info
     '''
-    for idx, dic in enumerate(lst):
-        if dic[key] == value:
-            return idx
-    return None
-
-def unique_transit_routes(stop_ids):
-    if len(stop_ids) == 0:
+    if not lines:
         return []
-    else:
-        #Second query to get the unique transit lines
-        q_list = str(stop_ids).replace('[','(').replace(']',')')
-        q = """
-            SELECT lines FROM wmata_info
-            WHERE stop_id_or_station_code in {}
-            """.format(q_list)
-        conn = engine.connect()
-        proxy = conn.execute(q)
-        routes = [x[0] for x in proxy.fetchall()]
-        conn.close()
-
-        #Parse the : separated items
-        routes = ':'.join(routes)
-        routes = routes.split(':')
-        unique = list(set(routes))
-        return unique
+    return list(set(lines.split(':')))
 
 
-@application.route('/api/building_permits/<dist>', methods=['GET'])
-def nearby_building_permits(dist):
-
-    conn = engine.connect()
-    #Get our params
-    dist = float(dist)
-    latitude = request.args.get('latitude',None)
-    longitude = request.args.get('longitude',None)
-    if latitude == None or longitude==None:
-        return "Please supply latitude and longitude"
-    else:
-        latitude=float(latitude)
-        longitude=float(longitude)
+def group_routes_by_distance(routes):
+    '''
+    Rearranges the routes into groups of shortest distance for easier display
+    on the front end, e.g. [{'shortest_dist': '0.2', 'routes': ['70', '79']}]
+    '''
+    groups = OrderedDict()
+    for key, route in routes.items():
+        dist = route['shortest_dist']
+        groups.setdefault(dist, []).append(key)
+    return [{"shortest_dist":dist, "routes":keys} for dist, keys in groups.items()]
 
-    latitude_tolerance, longitude_tolerance = bounding_box(dist, latitude, longitude)
 
+#name: (table, query, seconds before rebuilding regardless of loads)
+POINT_INDEX_SOURCES = {
+    'project': ('project', "SELECT * FROM project WHERE status = 'Active'", None),
     #Return just a subset of columns to lighten the data load. TODO do we want user option for short/all?
-    q = '''
+    #Keeps a little over a year of permits; the endpoint filters on the exact
+    #window and the index is rebuilt daily so the window keeps moving.
+    'building_permits': ('building_permits', '''
         SELECT
-        (latitude - {latitude} ) AS lat_diff
-        ,(longitude - {longitude} ) AS lon_diff
-        ,latitude
+        latitude
         ,longitude
         ,ward
         ,neighborhood_cluster
@@ -559,27 +739,118 @@ def nearby_building_permits(dist):
         ,permit_subtype_name
         ,full_address
         ,objectid
-
+        ,issue_date
         FROM building_permits
+        WHERE issue_date > (now()::TIMESTAMP - INTERVAL '13 months')
+        ''', 24 * 60 * 60)
+}
+_point_indexes = {}
+_point_index_lock = threading.Lock()
 
-        WHERE latitude < ({latitude} + {latitude_tolerance})::DECIMAL
-        AND   latitude > ({latitude} - {latitude_tolerance})::DECIMAL
-        AND   longitude < ({longitude} + {longitude_tolerance})::DECIMAL
-        AND   longitude > ({longitude} - {longitude_tolerance})::DECIMAL
 
-        AND issue_date BETWEEN (now()::TIMESTAMP - INTERVAL '1 year') AND now()::TIMESTAMP
+def get_point_index(name):
+    '''
+    Returns the PointIndex for one of the POINT_INDEX_SOURCES, building it
+    the first time and again whenever its table is reloaded.
+    '''
+    table, q, max_age = POINT_INDEX_SOURCES[name]
+    stamp = response_cache.load_dates().get(table)
+    with _point_index_lock:
+        cached = _point_indexes.get(name)
+        if cached is not None:
+            cached_stamp, built, index = cached
+            if cached_stamp == stamp and (max_age is None or time.time() - built < max_age):
+                return index
 
-    '''.format(
-        latitude=latitude,
-        longitude=longitude,
-        latitude_tolerance=latitude_tolerance,
-        longitude_tolerance=longitude_tolerance
-    )
+        conn = engine.connect()
+        proxy = conn.execute(q)
+        rows = [dict(r) for r in proxy.fetchall()]
+        conn.close()
+        index = PointIndex(rows)
+        _point_indexes[name] = (stamp, time.time(), index)
+        return index
 
-    proxy = conn.execute(q)
-    results = proxy.fetchall()
 
-    good_results = [dict(r) for r in results if haversine(latitude, longitude, float(r.latitude), float(r.longitude)) <= dist]
+#Bounds of the nearby endpoints' parameters; DC is about 10 miles across
+NEARBY_MAX_DISTANCE = 10.0    #miles
+NEARBY_MAX_RESULTS = 1000     #largest k
+
+
+def _nearby_distance(dist):
+    '''
+    Returns the <dist> of a nearby endpoint as miles, at most
+    NEARBY_MAX_DISTANCE. Aborts with a 400 if it isn't a non-negative number.
+    '''
+    try:
+        dist = float(dist)
+    except ValueError:
+        abort(400)
+    if not 0 <= dist:   #also catches nan
+        abort(400)
+    return min(dist, NEARBY_MAX_DISTANCE)
+
+
+def _nearby(index, dist, where=None):
+    '''
+    Shared request handling of the nearby endpoints. Returns the matching
+    rows with their lat_diff/lon_diff from the requested point, or None if
+    latitude or longitude weren't given.
+
+    Optional params:
+    k: only return the k nearest rows (within dist), at most
+       NEARBY_MAX_RESULTS. Must be a positive integer.
+    '''
+    latitude = request.args.get('latitude',None)
+    longitude = request.args.get('longitude',None)
+    if latitude == None or longitude==None:
+        return None
+    try:
+        latitude=float(latitude)
+        longitude=float(longitude)
+    except ValueError:
+        abort(400)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        abort(400)
+
+    k = request.args.get('k')
+    if k is not None:
+        try:
+            k = int(k)
+        except ValueError:
+            abort(400)
+        if k < 1:
+            abort(400)
+        k = min(k, NEARBY_MAX_RESULTS)
+        found = index.nearest(latitude, longitude, k, dist, where)
+    else:
+        found = index.within(latitude, longitude, dist, where)
+
+    results = []
+    for d, row in found:
+        item = dict(row)
+        item['lat_diff'] = float(row['latitude']) - latitude
+        item['lon_diff'] = float(row['longitude']) - longitude
+        results.append(item)
+    return results
+
+
+@application.route('/api/building_permits/<dist>', methods=['GET'])
+def nearby_building_permits(dist):
+
+    #Get our params
+    dist = _nearby_distance(dist)
+
+    #same window as 'issue_date BETWEEN now() - INTERVAL '1 year' AND now()'
+    now = datetime.now()
+    year_ago = now - relativedelta(years=1)
+    def in_last_year(row):
+        return row['issue_date'] is not None and year_ago <= row['issue_date'] <= now
+
+    good_results = _nearby(get_point_index('building_permits'), dist, in_last_year)
+    if good_results is None:
+        return "Please supply latitude and longitude"
+    for item in good_results:
+        del item['issue_date']
 
     tot_permits = len(good_results)
 
@@ -590,8 +861,6 @@ def nearby_building_permits(dist):
     }
 
     output_json = jsonify(output)
-
-    conn.close()
     return output_json
 
 
@@ -599,44 +868,11 @@ def nearby_building_permits(dist):
 @application.route('/api/projects/<dist>', methods=['GET'])
 def nearby_projects(dist):
 
-    conn = engine.connect()
-    dist = float(dist)
+    dist = _nearby_distance(dist)
     #Get our params
-    latitude = request.args.get('latitude',None)
-    longitude = request.args.get('longitude',None)
-    if latitude == None or longitude==None:
+    good_results = _nearby(get_point_index('project'), dist)
+    if good_results is None:
         return "Please supply latitude and longitude"
-    else:
-        latitude=float(latitude)
-        longitude=float(longitude)
-
-    latitude_tolerance, longitude_tolerance = bounding_box(dist, latitude, longitude)
-
-    q = '''
-        SELECT
-        (latitude - {latitude} ) AS lat_diff
-        ,(longitude - {longitude} ) AS lon_diff
-        ,*
-        FROM project
-
-        WHERE latitude < ({latitude} + {latitude_tolerance})::DECIMAL
-        AND   latitude > ({latitude} - {latitude_tolerance})::DECIMAL
-        AND   longitude < ({longitude} + {longitude_tolerance})::DECIMAL
-        AND   longitude > ({longitude} - {longitude_tolerance})::DECIMAL
-
-        AND status = 'Active'
-
-    '''.format(
-        latitude=latitude,
-        longitude=longitude,
-        latitude_tolerance=latitude_tolerance,
-        longitude_tolerance=longitude_tolerance
-    )
-
-    proxy = conn.execute(q)
-    results = proxy.fetchall()
-
-    good_results = [dict(r) for r in results if haversine(latitude, longitude, float(r.latitude), float(r.longitude)) <= dist]
 
     unit_counts = [r['proj_units_assist_max'] for r in good_results]
     unit_counts = filter(None,unit_counts) #can't sum None
@@ -651,47 +887,10 @@ def nearby_projects(dist):
         , 'distance': dist
     }
 
-    conn.close()
     output_json = jsonify(output)
     return output_json
 
 
-#def haversine(lat1, long1, lat2, long2):
-from math import radians, cos, sin, asin, sqrt
-
-def haversine(lat1, lon1, lat2,lon2):
-    """
-    Calculate the great circle distance between two points
-    on the earth (specified in decimal degrees)
-    """
-    # convert decimal degrees to radians
-    original_coords = (lat1,lon1,lat2,lon2) #for debugging
-    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-
-    # haversine formula
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * asin(sqrt(a))
-    r = 3956 # Radius of earth in miles
-    d = c * r
-    #print("Haversine for {} = {}".format(original_coords,d))
-    return c * r
-
-
-def bounding_box(dist, latitude, longitude):
-    """ Cribbed from https://gis.stackexchange.com/questions/142326/calculating-longitude-length-in-miles """
-
-    radius = 3959 # miles, from google
-
-    dlat_rad = 69 * dist / radius  # google again
-
-    latitude_tolerance = dist / 69
-    longitude_tolerance = dist / (math.cos(latitude) * 69.172)
-
-    return (latitude_tolerance, longitude_tolerance)
-
-
 @application.route('/api/project/<nlihc_id>/subsidies/', methods=['GET'])
 def project_subsidies(nlihc_id):
     q = """
@@ -707,6 +906,8 @@ def project_subsidies(nlihc_id):
     return jsonify(output)
 
 @application.route('/api/census/<data_id>/<grouping>', methods=['GET'])
+@cached_response(tables=lambda grouping, **kwargs: [
+    'census', 'census_tract_to_{}'.format(grouping)])
 def census_with_weighting(data_id,grouping):
     '''
     API Endpoint to get data from our census table. data_id can either be a column
@@ -717,29 +918,22 @@ def census_with_weighting(data_id,grouping):
 
     grouping: one of 'census_tract', 'ward', or 'neighborhood_cluster'
     '''
-    if data_id in ['poverty_rate','fraction_black','income_per_capita',
-                    'labor_participation','fraction_foreign','fraction_single_mothers']:
-
-        if data_id == 'poverty_rate':
-            denominator = get_weighted_census_results(grouping, 'population')
-            numerator = get_weighted_census_results(grouping, 'population_poverty')
-        if data_id == 'fraction_black':
-            numerator = get_weighted_census_results(grouping, 'population_black')
-            denominator = get_weighted_census_results(grouping, 'population')
-        if data_id == 'income_per_capita':
-            denominator = get_weighted_census_results(grouping, 'population')
-            numerator = get_weighted_census_results(grouping, 'aggregate_income')
-        if data_id == 'labor_participation':
-            denominator = get_weighted_census_results(grouping, 'population')
-            numerator = get_weighted_census_results(grouping,'population_working')
-        if data_id == 'fraction_foreign':
-            denominator = get_weighted_census_results(grouping, 'population')
-            numerator = get_weighted_census_results(grouping, 'population_foreign')
-        if data_id == 'fraction_single_mothers':
-            denominator = get_weighted_census_results(grouping, 'population')
-            numerator = get_weighted_census_results(grouping, 'population_single_mother')
+    #numerator and denominator fields of the custom calculated values
+    calculated_fields = {
+        'poverty_rate': ('population_poverty', 'population'),
+        'fraction_black': ('population_black', 'population'),
+        'income_per_capita': ('aggregate_income', 'population'),
+        'labor_participation': ('population_working', 'population'),
+        'fraction_foreign': ('population_foreign', 'population'),
+        'fraction_single_mothers': ('population_single_mother', 'population')
+    }
 
-        api_results = items_divide(numerator,denominator)
+    if data_id in calculated_fields:
+        numerator_field, denominator_field = calculated_fields[data_id]
+        results = get_weighted_census_fields(grouping, [numerator_field,
+                                                        denominator_field])
+        api_results = items_divide(results[numerator_field],
+                                   results[denominator_field])
         #api_results = scale(api_results)
         api_results['data_id'] = 'poverty_rate'
 
@@ -747,8 +941,36 @@ def census_with_weighting(data_id,grouping):
     else:
         api_results = get_weighted_census_results(grouping, data_id)
     
+    if api_results['items'] is None:
+        return no_store(jsonify(api_results))
     return jsonify(api_results)
 
+#grouping: (load_date of census_tract_to_<grouping>, weights) - see get_census_weights
+_census_weights = {}
+
+
+def get_census_weights(conn, grouping):
+    '''
+    Returns the census_tract_to_<grouping> crosswalk as a sparse weight
+    matrix: an OrderedDict of group: [(census_tract, population_weight_counts)].
+
+    The crosswalk is loaded once and kept until the table is reloaded.
+    '''
+    table = 'census_tract_to_{}'.format(grouping)
+    stamp = response_cache.load_dates().get(table)
+    cached = _census_weights.get(grouping)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    proxy = conn.execute("SELECT {grouping}, census_tract, population_weight_counts "
+                         "FROM {table}".format(grouping=grouping, table=table))
+    weights = OrderedDict()
+    for group, tract, factor in proxy.fetchall():
+        weights.setdefault(group, []).append((tract, factor))
+    _census_weights[grouping] = (stamp, weights)
+    return weights
+
+
 def get_weighted_census_results(grouping, field):
     '''
     queries the census table for the relevant field and returns the results as a weighted count
@@ -756,49 +978,56 @@ def get_weighted_census_results(grouping, field):
 
     Currently only implemented for the 'counts' weighting factor not for the proportion version
     '''
-    q = "SELECT census_tract, {field} FROM census".format(field=field) #TODO need to add 'year' column for multiple census years when this is added to the data
+    return get_weighted_census_fields(grouping, [field])[field]
+
+
+def get_weighted_census_fields(grouping, fields):
+    '''
+    Like get_weighted_census_results, but for several fields at once using a
+    single query of the census table. Returns a dict of field: results.
+    '''
+    q = "SELECT census_tract, {fields} FROM census".format(fields=', '.join(fields)) #TODO need to add 'year' column for multiple census years when this is added to the data
     conn = engine.connect()
     proxy = conn.execute(q)
-    census_results = [dict(x) for x in proxy.fetchall()]
+
+    #census_tract: row of values, keeping the first row for each tract
+    census_results = OrderedDict()
+    for x in proxy.fetchall():
+        census_results.setdefault(x[0], list(x[1:]))
 
     #Transform the results
-    items = []  #For storing results as we go
+    items = {field: [] for field in fields}  #For storing results as we go
 
     if grouping == 'census_tract':
         #No weighting required, data already in proper format
-        for r in census_results:
-            output = dict({'group':r['census_tract'], 'count':r[field]})
-            items.append(output)
+        for tract, values in census_results.items():
+            for field, value in zip(fields, values):
+                items[field].append(dict({'group':tract, 'count':value}))
 
     elif grouping in ['ward', 'neighborhood_cluster']:
-        proxy = conn.execute("SELECT DISTINCT {grouping} FROM census_tract_to_{grouping}".format(grouping=grouping))
-        groups = [x[0] for x in proxy.fetchall()]
-
-        
-        for group in groups:
-            proxy = conn.execute("SELECT * FROM census_tract_to_{grouping} WHERE {grouping} = '{group}'".format(grouping=grouping, group=group))
-            results = [dict(x) for x in proxy.fetchall()]
-
-            count = 0
-            for result in results:
-                tract = result['census_tract']
-                factor = result['population_weight_counts']
-                matching_data = next((item for item in census_results if item["census_tract"] == tract),{field:None})
-                if matching_data[field] == None:
-                    logging.warning("Missing data for census tract when calculating weightings: {}".format(tract))
-                    matching_data[field] = 0
-                    
-                value = matching_data[field]
-                count += (value * factor)
-
-            output = dict({'group':group, 'count':round(count,0)})
-            items.append(output)
+        weights = get_census_weights(conn, grouping)
+
+        for group, tract_weights in weights.items():
+            counts = [0] * len(fields)
+            for tract, factor in tract_weights:
+                values = census_results.get(tract)
+                if values is None:
+                    values = census_results[tract] = [None] * len(fields)
+                for idx, value in enumerate(values):
+                    if value == None:
+                        logging.warning("Missing data for census tract when calculating weightings: {}".format(tract))
+                        value = values[idx] = 0
+                    counts[idx] += (value * factor)
+
+            for field, count in zip(fields, counts):
+                items[field].append(dict({'group':group, 'count':round(count,0)}))
     else:
         #Invalid grouping
-        items = None
+        items = {field: None for field in fields}
 
     conn.close()
-    return {'items': items, 'grouping':grouping, 'data_id':field}
+    return {field: {'items': items[field], 'grouping':grouping, 'data_id':field}
+            for field in fields}
 
 
 ##########################################
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+"""
+Nearest neighbor lookups of the flask api
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+Grid index of rows by latitude/longitude used by the nearby projects and
+building permits endpoints, kept separate from application.py so it can be
+tested on its own.
+
+"""
+
+import math
+import os
+import sys
+
+#the distance helpers are shared with the ingestion code in the
+#housinginsights package next to this folder
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                             os.pardir)))
+from housinginsights.tools.spatial import haversine, degree_extents
+
+
+class PointIndex(object):
+    '''
+    Rows bucketed into a grid by latitude/longitude, so the rows near a point
+    can be found by checking only the surrounding grid cells.
+    '''
+
+    CELL_SIZE = 0.01 #degrees, roughly half a mile in DC
+
+    def __init__(self, rows):
+        self._cells = {}
+        for row in rows:
+            if row['latitude'] is None or row['longitude'] is None:
+                continue
+            lat = float(row['latitude'])
+            lon = float(row['longitude'])
+            self._cells.setdefault(self._cell(lat, lon), []).append((lat, lon, row))
+        self._bounds = None
+        if self._cells:
+            cells = list(self._cells)
+            self._bounds = (min(c[0] for c in cells), max(c[0] for c in cells),
+                            min(c[1] for c in cells), max(c[1] for c in cells))
+
+    def _cell(self, lat, lon):
+        return (int(math.floor(lat / self.CELL_SIZE)),
+                int(math.floor(lon / self.CELL_SIZE)))
+
+    def within(self, latitude, longitude, dist, where=None):
+        '''
+        Returns a list of (distance, row) for rows within dist miles of the
+        point, nearest first. where is an optional function of the row to
+        filter on.
+        '''
+        if self._bounds is None:
+            return []
+        longitude_tolerance, latitude_tolerance = degree_extents(latitude, dist)
+        min_row, min_col = self._cell(latitude - latitude_tolerance, longitude - longitude_tolerance)
+        max_row, max_col = self._cell(latitude + latitude_tolerance, longitude + longitude_tolerance)
+        #never look at more cells than the grid has
+        min_row = max(min_row, self._bounds[0])
+        max_row = min(max_row, self._bounds[1])
+        min_col = max(min_col, self._bounds[2])
+        max_col = min(max_col, self._bounds[3])
+
+        found = []
+        for cell_row in range(min_row, max_row + 1):
+            for cell_col in range(min_col, max_col + 1):
+                for lat, lon, row in self._cells.get((cell_row, cell_col), ()):
+                    d = haversine(latitude, longitude, lat, lon)
+                    if d <= dist and (where is None or where(row)):
+                        found.append((d, row))
+        found.sort(key=lambda x: x[0])
+        return found
+
+    def nearest(self, latitude, longitude, k, max_dist, where=None):
+        '''
+        Returns the k rows nearest to the point, limited to those within
+        max_dist miles, as a list of (distance, row). Searches a growing
+        radius so that only the cells near the point are checked.
+        '''
+        radius = min(0.25, max_dist)
+        while True:
+            found = self.within(latitude, longitude, radius, where)
+            #every row closer than the k-th found one is within the radius
+            if len(found) >= k or radius >= max_dist:
+                return found[:k]
+            radius = min(radius * 2, max_dist)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+"""
+Paging and streaming of whole tables for /api/raw/<table>
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+Pages are keyset paginated on the columns of a unique index of the table,
+e.g. the (unique_data_id, natural_key) index that LoadData creates for
+tables it merges files into (update_method 'merge' in manifest.csv):
+
+    WHERE (key columns) > (last key of the previous page)
+    ORDER BY key columns LIMIT n
+
+so every page is an index range scan and a row is never skipped or repeated
+when other rows are updated or deleted between pages. Tables without a
+unique index can only be read whole (as ndjson) or as a single first page.
+
+"""
+
+import json
+
+
+RAW_FETCH_SIZE = 1000   #rows pulled from the server-side cursor at a time
+
+
+def unique_key(conn, table):
+    '''
+    Returns the columns of the primary key or smallest unique index of the
+    table, in index order, or None if it has neither. Partial and
+    expression indexes are ignored since they don't cover every row.
+    '''
+    q = """
+        SELECT array_agg(a.attname::text ORDER BY k.ord)
+        FROM pg_index AS i
+        CROSS JOIN LATERAL unnest(i.indkey) WITH ORDINALITY AS k(attnum, ord)
+        JOIN pg_attribute AS a
+          ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+        WHERE i.indrelid = %(table)s::regclass
+        AND i.indisunique
+        AND i.indpred IS NULL
+        AND i.indexprs IS NULL
+        GROUP BY i.indexrelid, i.indisprimary
+        ORDER BY i.indisprimary DESC, count(*), i.indexrelid
+        LIMIT 1
+        """
+    row = conn.execute(q, {'table': table}).fetchone()
+    return list(row[0]) if row is not None else None
+
+
+def format_after(key_values):
+    '''
+    Returns the 'next' token of a page, given the key of its last row.
+    '''
+    return json.dumps(list(key_values), default=str)
+
+
+def parse_after(after, key):
+    '''
+    Returns the key values in the 'after' token, or raises ValueError if it
+    isn't one made by format_after for this key.
+    '''
+    values = json.loads(after)
+    if not isinstance(values, list) or len(values) != len(key):
+        raise ValueError("'after' should be a list of {} values".format(len(key)))
+    return values
+
+
+def raw_query(table, key=None, after=None, limit=None):
+    '''
+    Returns (query, params) selecting the key values and row_to_json of
+    each row of table, ordered by key and starting after the key values
+    'after'. Without a key the rows come in no particular order and 'after'
+    isn't allowed.
+    '''
+    key = key or []
+    columns = ''.join('t.{}, '.format(column) for column in key)
+    q = 'SELECT {}row_to_json(t) FROM {} AS t'.format(columns, table)
+    params = {}
+    if after is not None:
+        if not key:
+            raise ValueError("Table {} has no key to page on".format(table))
+        names = ['after_{}'.format(i) for i in range(len(key))]
+        q += ' WHERE ({}) > ({})'.format(
+            ', '.join('t.{}'.format(column) for column in key),
+            ', '.join('%({})s'.format(name) for name in names))
+        params.update(zip(names, after))
+    if key:
+        q += ' ORDER BY {}'.format(', '.join('t.{}'.format(c) for c in key))
+    if limit is not None:
+        q += ' LIMIT %(limit)s'
+        params['limit'] = limit
+    return q, params
+
+
+def raw_rows(engine, table, key=None, after=None, limit=None):
+    '''
+    Yields (key_values, row_json) for the rows of raw_query.
+
+    Rows are read through a named (server-side) cursor, so only
+    RAW_FETCH_SIZE rows are held in memory at once, however many rows the
+    query returns.
+    '''
+    q, params = raw_query(table, key, after, limit)
+    width = len(key or [])
+
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor(name='raw_{}'.format(table))
+        cursor.itersize = RAW_FETCH_SIZE
+        try:
+            cursor.execute(q, params)
+            for row in cursor:
+                yield tuple(row[:width]), row[width]
+        finally:
+            cursor.close()
+    finally:
+        #the named cursor only lives in its transaction
+        conn.rollback()
+        conn.close()
+
+
+def ndjson(rows):
+    '''
+    Yields the row_json of the (key_values, row_json) pairs of raw_rows as
+    lines of newline delimited json.
+    '''
+    for key_values, row in rows:
+        yield json.dumps(row) + '\n'
+
+
+def page(rows, limit):
+    '''
+    Returns (items, next) for the rows of raw_rows(..., limit=limit). next
+    is the 'after' token of the following page, or None on the last page.
+    '''
+    items = []
+    last_key = None
+    for last_key, row in rows:
+        items.append(row)
+    if len(items) < limit or not last_key:
+        return items, None
+    return items, format_after(last_key)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+"""
+Response cache of the flask api
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+Kept separate from application.py (which connects to the database when it is
+imported) so it can be tested on its own.
+
+"""
+
+from collections import OrderedDict
+import logging
+import threading
+import time
+
+
+#The data only changes when LoadData loads a file, which always updates the
+#load_date of the file's row in the SQL manifest. Cached responses remember the
+#latest load_date of each table they were built from and are thrown out once
+#one of those tables is loaded again.
+RESPONSE_CACHE_TTL = 6 * 60 * 60           # seconds
+RESPONSE_CACHE_MAX_ENTRIES = 512
+MANIFEST_POLL_SECONDS = 60                 # how often to re-check load_dates
+
+
+class ResponseCache(object):
+    '''
+    In-process LRU cache of endpoint responses, keyed on the request path and
+    its sorted query arguments. Each gunicorn/uwsgi worker keeps its own copy.
+    '''
+
+    def __init__(self, engine, ttl=RESPONSE_CACHE_TTL,
+                 max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+                 poll_seconds=MANIFEST_POLL_SECONDS):
+        self.engine = engine
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.poll_seconds = poll_seconds
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_dates = {}
+        self._load_dates_checked = None
+
+    def load_dates(self):
+        '''
+        Returns a dict of destination_table: latest load_date from the SQL
+        manifest, querying it at most once every poll_seconds.
+        '''
+        now = time.time()
+        checked = self._load_dates_checked
+        if checked is None or now - checked > self.poll_seconds:
+            try:
+                conn = self.engine.connect()
+                proxy = conn.execute("SELECT destination_table, max(load_date) "
+                                     "FROM manifest GROUP BY destination_table")
+                self._load_dates = {x[0]: x[1] for x in proxy.fetchall()}
+                conn.close()
+            except Exception as e:
+                #without load dates, fall back to relying on the ttl
+                logging.warning("Unable to read manifest load dates: {}".format(e))
+            self._load_dates_checked = now
+        return self._load_dates
+
+    def stamp(self, dependencies=None):
+        '''
+        Returns a value that changes whenever one of the dependencies (a list
+        of destination_tables, or None for every table) is loaded again.
+        '''
+        load_dates = self.load_dates()
+        if dependencies is None:
+            #depends on every table
+            return max((d for d in load_dates.values() if d is not None),
+                       default=None)
+        return tuple(load_dates.get(table) for table in dependencies)
+
+    def get(self, key, dependencies):
+        stamp = self.stamp(dependencies)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            created, entry_stamp, response = entry
+            if time.time() - created > self.ttl or entry_stamp != stamp:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return response
+
+    def set(self, key, dependencies, response):
+        stamp = self.stamp(dependencies)
+        with self._lock:
+            self._entries[key] = (time.time(), stamp, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
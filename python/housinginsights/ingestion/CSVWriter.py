@@ -4,6 +4,7 @@ file that can later be used to load to the database.
 """
 
 from csv import DictWriter
+import io
 import os
 import copy
 
@@ -49,6 +50,7 @@ class CSVWriter(object):
         # By default, creates a temp csv file wherever the calling module was
         #  located
         self.filename = 'temp_{}.psv'.format(self.unique_data_id) if filename == None else filename
+        self.row_count = 0
         
         # remove any existing copy of the file so we are starting clean
         self.remove_file()
@@ -60,8 +62,7 @@ class CSVWriter(object):
             #self.file.close()
             #print("header written")
 
-        self.file = open(self.filename, 'a', newline='', encoding='utf-8')
-        self.writer = DictWriter(self.file, fieldnames=self.dictwriter_fields, delimiter="|")
+        self.open()
 
     def write(self, row):
         """
@@ -76,12 +77,16 @@ class CSVWriter(object):
         # optional column, it means you need to have your cleaner add a 'null'
         # value for that optional column.
         self.writer.writerow(row)
+        self.row_count += 1
 
     def open(self):
         """
         Opens the file for writing. Normally called by init, but can be called
         again by the user if they want to re-open the file for writing
         """
+        self.file = open(self.filename, 'a', newline='', encoding='utf-8')
+        self.writer = DictWriter(self.file, fieldnames=self.dictwriter_fields,
+                                 delimiter="|")
 
     def close(self):
         """
@@ -96,3 +101,100 @@ class CSVWriter(object):
             os.remove(self.filename)
         except OSError:
             pass
+
+
+class CSVStream(CSVWriter):
+    """
+    Read-only file-like view of cleaned rows in the same pipe-delimited
+    format CSVWriter produces. Rows are pulled from the given iterable and
+    formatted only as psycopg2's copy_from asks for more data, so a file can
+    be streamed into the database without first landing on disk.
+
+    If archive_filename is given, every chunk handed to the database is
+    also written to that file, giving the same PSV archive as CSVWriter.
+    """
+
+    def __init__(self, meta, manifest_row, rows, archive_filename=None):
+        """
+        :param meta: the parsed json from the meta data containing the format
+        expected of each SQL table.
+        :param manifest_row: a dictionary from manifest.csv for the source file
+        currently being acted on.
+        :param rows: iterable of clean rows (dicts keyed by source_name)
+        :param archive_filename: optional, path of a PSV copy of the data
+        """
+        self._rows = iter(rows)
+        self._archive_filename = archive_filename
+        self._pending = ''
+        self._exhausted = False
+        super().__init__(meta, manifest_row, filename=archive_filename)
+
+    def open(self):
+        """
+        Sets up the in-memory buffer the rows are formatted into and, if
+        requested, the archive file.
+        """
+        self.buffer = io.StringIO()
+        self.writer = DictWriter(self.buffer, fieldnames=self.dictwriter_fields,
+                                 delimiter="|")
+        self.file = None
+        if self._archive_filename is not None:
+            self.file = open(self._archive_filename, 'a', newline='',
+                             encoding='utf-8')
+
+    def _fill(self, size):
+        """
+        Formats rows until at least size characters (or a full line when size
+        is None) are pending, or the rows run out.
+        """
+        while not self._exhausted:
+            if size is None and '\n' in self._pending:
+                break
+            if size is not None and 0 <= size <= len(self._pending):
+                break
+            try:
+                row = next(self._rows)
+            except StopIteration:
+                self._exhausted = True
+                break
+            self.write(row)
+
+            chunk = self.buffer.getvalue()
+            self.buffer.seek(0)
+            self.buffer.truncate()
+            if self.file is not None:
+                self.file.write(chunk)
+            self._pending += chunk
+
+    def read(self, size=-1):
+        """
+        Returns up to size characters of pipe-delimited data, or everything
+        that is left if size is negative. An empty string means the rows are
+        exhausted.
+        """
+        if size is None:
+            size = -1
+        self._fill(size)
+        if size < 0:
+            size = len(self._pending)
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+    def readline(self, size=-1):
+        """
+        Returns the next line of pipe-delimited data.
+        """
+        self._fill(None)
+        end = self._pending.find('\n') + 1 or len(self._pending)
+        if size is not None and 0 <= size < end:
+            end = size
+        data, self._pending = self._pending[:end], self._pending[end:]
+        return data
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+    def remove_file(self):
+        if self._archive_filename is not None:
+            super().remove_file()
@@ -6,20 +6,18 @@ values.
 
 from abc import ABCMeta, abstractclassmethod, abstractmethod
 from datetime import datetime
-import dateutil.parser as dateparser
 import logging
 import os
 
-from housinginsights.ingestion.DataReader import HIReader
 from housinginsights.sources.mar import MarApiConn
+from housinginsights.sources.mar_local import LocalMarConn, find_latest_mar_csv
 from housinginsights.sources.models.pres_cat import CLUSTER_DESC_MAP
+from housinginsights.tools import geography
+from housinginsights.tools.dates import DateParser
 
 
 package_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir,
                                            os.pardir))
-# TODO - add in manifest but don't load in db so the path isn't hard coded?
-mar_path = os.path.join(package_dir, os.pardir, 'data', 'raw', 'apis',
-                        '20170528', 'mar.csv')
 
 '''
 Usage:
@@ -27,6 +25,108 @@ Dynamically import based on name of class in meta.json:
 http://stackoverflow.com/questions/4821104/python-dynamic-instantiation-from-string-name-of-a-class-in-dynamically-imported
 '''
 
+_mar_api = None
+_use_local_mar = False
+
+
+def use_local_mar(enabled=True):
+    """
+    Turns on (or off) answering the MAR lookups of the cleaners in this
+    process from the downloaded 'mar' extract (see LocalMarConn), falling
+    back to the MAR api when the extract has no match. Off by default.
+
+    The extract has no IMAGEURL, IMAGEDIR, IMAGENAME or STREETVIEWURL
+    columns, so projects geocoded from it get no image url and a generated
+    Google street view url instead of the ones the api returns.
+    """
+    global _mar_api, _use_local_mar
+    if enabled != _use_local_mar:
+        _use_local_mar = enabled
+        _mar_api = None
+
+
+def get_mar_api():
+    """
+    Returns the MAR connection shared by all cleaners in this process, so the
+    http session and the geocode cache are reused from row to row.
+
+    This is the MAR api unless use_local_mar() was called and the 'mar'
+    extract has been downloaded (see OpenDataApiConn).
+    """
+    global _mar_api
+    if _mar_api is None:
+        _mar_api = MarApiConn()
+        mar_path = find_latest_mar_csv() if _use_local_mar else None
+        if mar_path is not None:
+            _mar_api = LocalMarConn(path=mar_path, fallback=_mar_api)
+        elif _use_local_mar:
+            logging.warning("No mar.csv extract found, using the MAR api")
+    return _mar_api
+
+
+class CleaningPlan(object):
+    """
+    The parts of meta.json (and of the cleaner methods) that don't change from
+    row to row, worked out once per table when the cleaner is created: which
+    fields hold dates (each with its own DateParser), the null values as
+    sets, the boolean mapping, and memos of values that have already been
+    renamed (e.g. '8' -> 'Ward 8').
+    """
+
+    BOOLEAN_VALUES = {
+        'Yes': True,
+        'No': False,
+        'Y': True,
+        'N': False,
+        'TRUE': True,
+        'FALSE': False,
+        '1': True,
+        '0': False
+    }
+
+    def __init__(self, fields, null_value):
+        """
+        :param fields: the 'fields' list of the table in meta.json
+        :param null_value: what the cleaners write for missing values
+        """
+        self.null_value = null_value
+        self.date_fields = tuple(field['source_name'] for field in fields
+                                 if field['type'] == 'date')
+        self.date_parsers = {source_name: DateParser()
+                             for source_name in self.date_fields}
+        # used by format_date for values that aren't from a date field
+        self.date_parser = DateParser()
+        self.boolean_map = dict(CleaningPlan.BOOLEAN_VALUES)
+        self.boolean_map[''] = null_value
+
+        self._null_sets = {}
+        self._renamed = {}
+
+    def null_set(self, null_values):
+        """
+        Returns null_values as a frozenset so each cell is a single hash
+        lookup. Cleaners pass the same few lists for every row, so the sets
+        are kept.
+        """
+        key = tuple(null_values)
+        nulls = self._null_sets.get(key)
+        if nulls is None:
+            nulls = self._null_sets[key] = frozenset(null_values)
+        return nulls
+
+    def rename(self, rule, value, rename_fn):
+        """
+        Returns rename_fn(value), only calling it the first time a value is
+        seen for the given rule. Columns like ward and cluster repeat a handful
+        of values over hundreds of thousands of rows.
+        """
+        renamed = self._renamed.setdefault(rule, {})
+        try:
+            return renamed[value]
+        except KeyError:
+            result = renamed[value] = rename_fn(value)
+            return result
+
 
 class CleanerBase(object, metaclass=ABCMeta):
     def __init__(self, meta, manifest_row, cleaned_csv='', removed_csv=''):
@@ -39,13 +139,11 @@ class CleanerBase(object, metaclass=ABCMeta):
         self.fields = meta[self.tablename]['fields'] #a list of dicts
 
         self.null_value = 'Null' #what the SQLwriter expects in the temp csv
+        self.plan = CleaningPlan(self.fields, self.null_value)
 
-        #Flatten the census mapping file so that every potential name of a census tract can be translated to its standard format
-        self.census_mapping = {}
-        census_reader = HIReader(os.path.join(package_dir,'housinginsights/config/crosswalks/DC_census_tract_crosswalk.csv'))
-        for row in census_reader:
-            for key, value in row.items():
-                self.census_mapping[value] = row['census_tract']
+        #Every potential name of a census tract mapped to its standard format,
+        #loaded once per process and shared by all cleaners
+        self.census_mapping = geography.census_tract_mapping()
 
 
     @abstractmethod
@@ -60,10 +158,12 @@ class CleanerBase(object, metaclass=ABCMeta):
                 return field_meta
             return None
 
-    def replace_nulls(self, row, null_values=['NA', '-', '+','', None]):
+    def replace_nulls(self, row, null_values=('NA', '-', '+', '', None)):
+        nulls = self.plan.null_set(null_values)
+        null_value = self.null_value
         for key, value in row.items():
-            if value in null_values:
-                row[key] = self.null_value
+            if value in nulls:
+                row[key] = null_value
         return row
 
     def remove_line_breaks(self,row):
@@ -73,12 +173,14 @@ class CleanerBase(object, metaclass=ABCMeta):
             row[key] = row[key].replace('\n','__')
         return row
 
-    def format_date(self, value):
+    def format_date(self, value, date_parser=None):
         date = None
+        if value is None or value == self.null_value:
+            return self.null_value
+        if date_parser is None:
+            date_parser = self.plan.date_parser
         try:
-            _date = dateparser.parse(value, dayfirst=False, yearfirst=False)
-            #_date = datetime.strptime(value, '%m/%d/%Y')
-            date = datetime.strftime(_date, '%Y-%m-%d')
+            date = date_parser.format_date(value)
         except Exception as e:
             if value is None or value == self.null_value:
                 date = self.null_value
@@ -89,57 +191,22 @@ class CleanerBase(object, metaclass=ABCMeta):
         return date
 
     def convert_boolean(self,value):
-        mapping = {
-            'Yes': True,
-            'No': False,
-            'Y': True,
-            'N': False,
-            'TRUE': True,
-            'FALSE': False,
-            '1': True,
-            '0': False,
-            '': self.null_value
-            }
-        return mapping[value]
+        return self.plan.boolean_map[value]
 
     def parse_dates(self, row):
         '''
         Tries to automatically parse all dates that are of type:'date' in the meta
         '''
-        date_fields = []
-        for field in self.fields:
-            if field['type'] == 'date':
-                date_fields.append(field['source_name'])
-
-        for source_name in date_fields:
-            row[source_name] = self.format_date(row[source_name])
+        for source_name, date_parser in self.plan.date_parsers.items():
+            row[source_name] = self.format_date(row[source_name], date_parser)
         return row
 
     def remove_non_dc_tracts(self,row,column_name):
         '''
-        TODO change to use self.census_mapping
+        Returns None for rows whose census tract isn't one of the DC tracts
+        in the census tract crosswalk.
         '''
-        dc_tracts=["11001000100","11001000201","11001000202","11001000300","11001000400","11001000501","11001000502","11001000600",
-        "11001000701","11001000702","11001000801","11001000802","11001000901","11001000902","11001001001","11001001002","11001001100",
-        "11001001200","11001001301","11001001302","11001001401","11001001402","11001001500","11001001600","11001001702","11001001803",
-        "11001001804","11001001901","11001001902","11001002001","11001002002","11001002101","11001002102","11001002201","11001002202",
-        "11001002301","11001002302","11001002400","11001002501","11001002502","11001002600","11001002701","11001002702","11001002801",
-        "11001002802","11001002900","11001003000","11001003100","11001003200","11001003301","11001003302","11001003400","11001003500",
-        "11001003600","11001003700","11001003800","11001003900","11001004001","11001004002","11001004100","11001004201","11001004202",
-        "11001004300","11001004400","11001004600","11001004701","11001004702","11001004801","11001004802","11001004901","11001004902",
-        "11001005001","11001005002","11001005201","11001005301","11001005500","11001005600","11001005800","11001005900","11001006202",
-        "11001006400","11001006500","11001006600","11001006700","11001006801","11001006802","11001006804","11001006900","11001007000",
-        "11001007100","11001007200","11001007301","11001007304","11001007401","11001007403","11001007404","11001007406","11001007407",
-        "11001007408","11001007409","11001007502","11001007503","11001007504","11001007601","11001007603","11001007604","11001007605",
-        "11001007703","11001007707","11001007708","11001007709","11001007803","11001007804","11001007806","11001007807","11001007808",
-        "11001007809","11001007901","11001007903","11001008001","11001008002","11001008100","11001008200","11001008301","11001008302",
-        "11001008402","11001008410","11001008701","11001008702","11001008802","11001008803","11001008804","11001008903","11001008904",
-        "11001009000","11001009102","11001009201","11001009203","11001009204","11001009301","11001009302","11001009400","11001009501",
-        "11001009503","11001009504","11001009505","11001009507","11001009508","11001009509","11001009601","11001009602","11001009603",
-        "11001009604","11001009700","11001009801","11001009802","11001009803","11001009804","11001009807","11001009810","11001009811",
-        "11001009901","11001009902","11001009903","11001009904","11001009905","11001009906","11001009907","11001010100","11001010200",
-        "11001010300","11001010400","11001010500","11001010600","11001010700","11001010800","11001010900","11001011000","11001011100"]
-        if row[column_name] in dc_tracts:
+        if row[column_name] in geography.dc_census_tracts():
             return row
         else:
             return None
@@ -196,11 +263,8 @@ class CleanerBase(object, metaclass=ABCMeta):
         if row[ward_key] == self.null_value:
             return row
         else:
-            ward = row[ward_key]
-            if ward.isnumeric():  # add text if only number
-                row[ward_key] = "Ward " + str(ward)
-            else:  # make sure text is 'Ward #'
-                row[ward_key] = ward.lower().capitalize()
+            row[ward_key] = self.plan.rename('ward', row[ward_key],
+                                             geography.ward_name)
             return row
 
     def rename_status(self, row):
@@ -220,7 +284,7 @@ class CleanerBase(object, metaclass=ABCMeta):
         identify mar equivalent address id.
         """
         # api lookup with lat/lon or x/y coords if address id is null or invalid
-        mar_api = MarApiConn()
+        mar_api = get_mar_api()
         lat = row['Proj_lat']
         lon = row['Proj_lon']
         x_coord = row['Proj_x']
@@ -302,7 +366,7 @@ class CleanerBase(object, metaclass=ABCMeta):
                                neighborhood_cluster_desc, zipcode, anc,
                                census_tract, status, full_address, image_url,
                                street_view_url, psa]:
-            mar_api = MarApiConn()
+            mar_api = get_mar_api()
             result = mar_api.reverse_address_id(aid=row['mar_id'])
             result = result['returnDataset']['Table1'][0]
         else:
@@ -339,7 +403,7 @@ class CleanerBase(object, metaclass=ABCMeta):
             row['Proj_addre'] = result['FULLADDRESS']
 
         if street_view_url == self.null_value:
-            street_view_url = result['STREETVIEWURL']
+            street_view_url = result.get('STREETVIEWURL')
             if street_view_url is not None:
                 row['Proj_streetview_url'] = street_view_url
             else:
@@ -352,10 +416,13 @@ class CleanerBase(object, metaclass=ABCMeta):
                 row['Proj_streetview_url'] = url
 
         if image_url == self.null_value:
-            img_url = result['IMAGEURL']
-            img_dir = result['IMAGEDIR']
-            img_name = result['IMAGENAME']
-            row['Proj_image_url'] = '{}/{}/{}'.format(img_url, img_dir, img_name)
+            img_url = result.get('IMAGEURL')
+            img_dir = result.get('IMAGEDIR')
+            img_name = result.get('IMAGENAME')
+            # the mar.csv extract doesn't include image locations
+            if img_url is not None:
+                row['Proj_image_url'] = '{}/{}/{}'.format(img_url, img_dir,
+                                                          img_name)
 
         if psa == self.null_value:
             psa = result['PSA']
@@ -412,7 +479,8 @@ class BuildingPermitsCleaner(CleanerBase):
         if row['NEIGHBORHOODCLUSTER'] == self.null_value:
             return row
         else:
-            row['NEIGHBORHOODCLUSTER'] = 'Cluster ' + str(row['NEIGHBORHOODCLUSTER'])
+            row['NEIGHBORHOODCLUSTER'] = self.plan.rename(
+                'cluster', row['NEIGHBORHOODCLUSTER'], geography.cluster_name)
             return row
 
 
@@ -5,6 +5,9 @@ Module reads and validates the data that will be used to update the database.
 from collections import Counter
 from csv import DictReader
 import csv
+from functools import lru_cache
+import hashlib
+import json
 from os import path
 import os
 
@@ -24,6 +27,19 @@ import dateutil.parser as dateparser
 # -Renamed DataReader to HIReader (housing insights reader); extended 2 versions of it (ManifestReader and DataReader)
 
 
+@lru_cache(maxsize=256)
+def _file_hash(filepath, mtime_ns, size):
+    """
+    Returns the sha256 of a file. The modification time and size are part of
+    the cache key so a file is only hashed again if it changes.
+    """
+    hasher = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
 # TODO: convert relative path to full path when passed as argument
 class HIReader(object):
     """
@@ -349,6 +365,35 @@ class DataReader(HIReader):
                               "encoding error encountered.")
         return _keys
 
+    def content_hash(self):
+        """
+        Returns a hash of the data file and the meta.json entry of its table,
+        which is stored in the SQL manifest when the file is loaded. If
+        neither has changed, loading the file again gives the same rows.
+
+        :return: hex digest, or None for files read from a url
+        """
+        if self.path_type != "file":
+            return None
+        stat = os.stat(self.path)
+        hasher = hashlib.sha256()
+        hasher.update(_file_hash(self.path, stat.st_mtime_ns,
+                                 stat.st_size).encode('utf-8'))
+        hasher.update(json.dumps(self.meta[self.destination_table],
+                                 sort_keys=True).encode('utf-8'))
+        return hasher.hexdigest()
+
+    def is_unchanged(self, sql_manifest_row):
+        """
+        Returns True if the file is loaded in the database and hasn't changed
+        since, according to the content hash in the sql_manifest_row.
+        """
+        if sql_manifest_row is None or \
+                sql_manifest_row['status'] != 'loaded' or \
+                sql_manifest_row.get('content_hash') is None:
+            return False
+        return sql_manifest_row['content_hash'] == self.content_hash()
+
     def should_file_be_loaded(self, sql_manifest_row):
         """
         Runs all the checks that the file is OK to use.
@@ -369,6 +414,11 @@ class DataReader(HIReader):
         file is not already loaded into the database (as indicated by the
         matching sql_manifest_row), the file will be added.
 
+        A file that is already loaded is added again if its content hash no
+        longer matches the one recorded when it was loaded; the caller is
+        responsible for replacing the old rows. Rows loaded before content
+        hashes were recorded are left alone.
+
         The sql object in charge of getting the sql_manifest_row and writing
         new sql_manifest_row elements to the database is in charge of making
         sure that the sql_manifest_row['status'] field can be trusted as a true
@@ -382,6 +432,12 @@ class DataReader(HIReader):
             if sql_manifest_row['status'] != 'loaded':
                 return True
             if sql_manifest_row['status'] == 'loaded':
+                if sql_manifest_row.get('content_hash') is not None and \
+                        not self.is_unchanged(sql_manifest_row):
+                    logging.info("  {} has changed since it was loaded, "
+                                 "reloading".format(
+                                    self.manifest_row['unique_data_id']))
+                    return True
                 logging.info("  {} is already in the database, skipping".format(
                                 self.manifest_row['unique_data_id']))
                 return False
@@ -22,6 +22,7 @@ import os
 import logging
 import argparse
 import json
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
 from csv import DictWriter
 from sqlalchemy import Table, Column, Integer, String, MetaData
@@ -43,16 +44,19 @@ if __name__ == "__main__":
 
 from housinginsights.tools import dbtools
 
-from housinginsights.ingestion import CSVWriter, DataReader
-from housinginsights.ingestion import HISql, TableWritingError
+from housinginsights.ingestion import CSVWriter, CSVStream, DataReader
+from housinginsights.ingestion import HISql, TableWritingError, get_merge_keys
 from housinginsights.ingestion import functions as ingestionfunctions
 from housinginsights.ingestion.Manifest import Manifest
+from housinginsights.ingestion.Cleaners import use_local_mar
+from housinginsights.ingestion.rollups import delete_file_rollups
 
 
 class LoadData(object):
 
     def __init__(self, database_choice=None, meta_path=None,
-                 manifest_path=None, keep_temp_files=True, drop_tables=False):
+                 manifest_path=None, keep_temp_files=True, drop_tables=False,
+                 workers=1, stream_load=False, local_mar=False):
         """
         Initializes the class with optional arguments. The default behaviour 
         is to load the local database with data tracked from meta.json 
@@ -64,6 +68,17 @@ class LoadData(object):
         :param manifest_path: the path of the manifest_path.csv to be used
         :param keep_temp_files: if True, temp clean pipe-delimited files will be
         archived in the 'python/logs' folder
+        :param workers: number of processes used to read and clean data
+        files. With more than one worker, independent unique_data_ids are
+        cleaned to PSV in a process pool while the COPY into the database
+        stays serialized in this process.
+        :param stream_load: if True, cleaned rows are streamed straight into
+        the database COPY instead of being written to a temp PSV file first;
+        the PSV is then only written when keep_temp_files is True. Only used
+        when files are processed one at a time (workers=1).
+        :param local_mar: if True, the cleaners geocode from the downloaded
+        'mar' extract instead of the MAR api where they can. The extract has
+        no image or street view urls, see Cleaners.use_local_mar.
         """
 
         # load defaults if no arguments passed
@@ -93,6 +108,14 @@ class LoadData(object):
         self._failed_table_count = 0
 
         self.drop_tables = drop_tables
+        self.workers = workers
+        self._stream_load = stream_load
+        if stream_load and workers > 1:
+            logging.warning("stream_load is ignored with more than one "
+                            "worker: clean files are written to temp PSV "
+                            "files by the worker processes")
+        self._local_mar = local_mar
+        use_local_mar(local_mar)
 
     def _drop_tables(self):
         """
@@ -159,7 +182,9 @@ class LoadData(object):
                     " '{}'".format(table_name, uid)
             logging.info("\t\tDeleting {} data from {}!".format(
                 uid, table_name))
-            result = self.engine.execute(query)
+            with self.engine.begin() as conn:
+                result = conn.execute(query)
+                delete_file_rollups(conn, table_name, uid)
 
             # change status = deleted in sql_manifest
             logging.info("\t\tResetting status in sql manifest row!")
@@ -221,11 +246,21 @@ class LoadData(object):
         Reloads only the flat file associated to the unique_data_id in
         unique_data_id_list.
 
+        Files whose content hash matches the one recorded in the SQL manifest
+        when they were loaded are skipped, since reloading them would give
+        the same rows. Files with update_method 'merge' are merged into their
+        existing rows instead of replacing them.
+
+        The existing rows of each file are replaced in the same transaction
+        that loads the new ones, so a file that fails to load keeps its old
+        rows and the other files are unaffected.
+
         Returns a list of unique_data_ids that were successfully updated.
         """
         logging.info("update_only(): attempting to update {} data".format(
             unique_data_id_list))
         processed_data_ids = []
+        manifest_rows = []
 
         for uid in unique_data_id_list:
             manifest_row = self.manifest.get_manifest_row(uid)
@@ -234,19 +269,57 @@ class LoadData(object):
             if manifest_row is None:
                 logging.info("\tSkipping: {} not found in manifest!".format(
                     uid))
+            elif self._is_unchanged(manifest_row=manifest_row):
+                logging.info("\tSkipping: {} is unchanged since it was "
+                             "loaded!".format(uid))
             else:
-                logging.info("\tManifest row found for {} - preparing to "
-                             "remove data.".format(uid))
-                self._remove_existing_data(uid=uid, manifest_row=manifest_row)
-
-                # follow normal workflow and load data_id
-                logging.info(
-                    "\tLoading {} data!".format(uid))
-                self._process_data_file(manifest_row=manifest_row)
+                if get_merge_keys(self.meta, manifest_row) is not None:
+                    logging.info("\tManifest row found for {} - preparing to "
+                                 "merge data.".format(uid))
+                else:
+                    logging.info("\tManifest row found for {} - preparing to "
+                                 "replace data.".format(uid))
+                # the rows stay in place until the file is loaded, only the
+                # status changes so the file isn't skipped as already loaded
+                sql_interface = self._configure_db_interface(
+                    manifest_row=manifest_row,
+                    temp_filepath=self._get_temp_filepath(
+                        manifest_row=manifest_row))
+                if sql_interface.get_sql_manifest_row() is not None:
+                    sql_interface.update_manifest_row(conn=self.engine,
+                                                      status='reloading')
+                manifest_rows.append(manifest_row)
                 processed_data_ids.append(uid)
 
+        # follow normal workflow and load the data_ids
+        logging.info("\tLoading {} data!".format(processed_data_ids))
+        self._process_data_files(manifest_rows=manifest_rows)
+
         return processed_data_ids
 
+    def _is_unchanged(self, manifest_row):
+        """
+        Returns True if the data file of the manifest row is loaded in the
+        database with the same content hash it has now.
+        """
+        temp_filepath = self._get_temp_filepath(manifest_row=manifest_row)
+        sql_interface = self._configure_db_interface(
+            manifest_row=manifest_row, temp_filepath=temp_filepath)
+        csv_reader = DataReader(meta=self.meta, manifest_row=manifest_row,
+                                load_from="file")
+        return csv_reader.is_unchanged(sql_interface.get_sql_manifest_row())
+
+    def _prepare_reload(self, manifest_row, csv_reader, sql_interface,
+                        sql_manifest_row):
+        """
+        Records the content hash of the file on the sql_interface and, if the
+        file was loaded before, has its old rows replaced when the new version
+        is loaded. The delete runs in the load's transaction, so the old rows
+        stay if the load fails. Files that are merged keep their rows.
+        """
+        sql_interface.content_hash = csv_reader.content_hash()
+        sql_interface.replace_existing = sql_manifest_row is not None
+
     def _get_temp_filepath(self, manifest_row):
         """
         Returns a file path where intermediary clean psv file will be saved.
@@ -268,29 +341,94 @@ class LoadData(object):
         self._meta_json_to_database()
 
         processed_data_ids = []
+        manifest_rows = []
 
-        # Iterate through each row in the manifest then clean and validate
-        for manifest_row in self.manifest:
+        # Iterate through each row in the manifest flagged for use in the
+        # database then clean and validate
+        for manifest_row in self.manifest.rows(include_flag='use'):
             # Note: Incompletely filled out rows in the manifest can break the
             # other code
             # TODO: figure out a way to flag this issue early in loading
             # TODO: of manifest
+            logging.info("{}: preparing to load row {} from the manifest".
+                         format(manifest_row['unique_data_id'],
+                                len(self.manifest)))
+            manifest_rows.append(manifest_row)
+            processed_data_ids.append(manifest_row['unique_data_id'])
 
-            # only clean and validate data files flagged for use in database
-            if manifest_row['include_flag'] == 'use':
-                logging.info("{}: preparing to load row {} from the manifest".
-                             format(manifest_row['unique_data_id'],
-                                    len(self.manifest)))
+        self._process_data_files(manifest_rows=manifest_rows)
 
-                self._process_data_file(manifest_row=manifest_row)
+        return processed_data_ids
 
-            processed_data_ids.append(manifest_row['unique_data_id'])
+    def _process_data_files(self, manifest_rows):
+        """
+        Processes the data files for the given manifest rows, either one at a
+        time or in a process pool depending on self.workers.
+        """
+        if self.workers > 1 and len(manifest_rows) > 1:
+            self._process_data_files_in_parallel(manifest_rows=manifest_rows)
+        else:
+            for manifest_row in manifest_rows:
+                self._process_data_file(manifest_row=manifest_row)
 
-        return processed_data_ids
+    def _process_data_files_in_parallel(self, manifest_rows):
+        """
+        Reads, cleans and writes each data file to PSV in a pool of worker
+        processes. Workers never touch the database - as each clean file
+        becomes available it is copied into the database from this process,
+        so only one COPY runs at a time.
+        """
+        logging.info("Cleaning {} data files with {} workers".format(
+            len(manifest_rows), self.workers))
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            pending = {}
+            for manifest_row in manifest_rows:
+                csv_reader = DataReader(meta=self.meta,
+                                        manifest_row=manifest_row,
+                                        load_from="file")
+                temp_filepath = self._get_temp_filepath(
+                    manifest_row=manifest_row)
+                sql_interface = self._configure_db_interface(
+                    manifest_row=manifest_row, temp_filepath=temp_filepath)
+                sql_manifest_row = sql_interface.get_sql_manifest_row()
+
+                if not csv_reader.should_file_be_loaded(
+                        sql_manifest_row=sql_manifest_row):
+                    continue
+                self._prepare_reload(manifest_row=manifest_row,
+                                     csv_reader=csv_reader,
+                                     sql_interface=sql_interface,
+                                     sql_manifest_row=sql_manifest_row)
+
+                future = executor.submit(clean_data_file, meta=self.meta,
+                                         manifest_row=manifest_row,
+                                         temp_filepath=temp_filepath,
+                                         local_mar=self._local_mar)
+                pending[future] = (manifest_row, sql_interface)
+
+            for future in as_completed(pending):
+                manifest_row, sql_interface = pending[future]
+                try:
+                    sql_interface.row_count = future.result()
+                except Exception as e:
+                    logging.warning("  FAIL: unable to clean {}: {}".format(
+                        sql_interface.unique_data_id, e))
+                    self._failed_table_count += 1
+                    continue
+
+                logging.info("{}: cleaned, loading into the database".format(
+                    sql_interface.unique_data_id))
+                self._update_database(sql_interface=sql_interface)
+
+                if not self._keep_temp_files:
+                    _remove_temp_file(sql_interface.filename)
 
     def _process_data_file(self, manifest_row):
         """
         Processes the data file for the given manifest row.
+
+        Returns False if the file was skipped.
         """
         # get the file object for the data
         csv_reader = DataReader(meta=self.meta,
@@ -301,7 +439,7 @@ class LoadData(object):
         temp_filepath = self._get_temp_filepath(manifest_row=manifest_row)
 
         # validate and clean
-        self._load_single_file(table_name=manifest_row['destination_table'],
+        return self._load_single_file(table_name=manifest_row['destination_table'],
                                manifest_row=manifest_row,
                                csv_reader=csv_reader,
                                temp_filepath=temp_filepath)
@@ -330,12 +468,8 @@ class LoadData(object):
         :param data_fields: the fields for the data being processed
         :return: additional fields as dict
         """
-        meta_only_fields = {}
-        for field in self.meta[table_name]['fields']:
-            if field['source_name'] not in data_fields:
-                # adds 'sql_name',None as key,value pairs in dict
-                meta_only_fields[field['sql_name']] = None
-        return meta_only_fields
+        return get_meta_only_fields(meta=self.meta, table_name=table_name,
+                                    data_fields=data_fields)
 
     def _configure_db_interface(self, manifest_row, temp_filepath):
         """
@@ -360,6 +494,8 @@ class LoadData(object):
         Cleans the data for the table name in the given manifest row, writes 
         the clean data to PSV file, and then passes on that information so 
         the database can be updated accordingly.
+
+        Returns False if the file was skipped.
         """
         # get database interface and it's equivalent manifest row
         sql_interface = self._configure_db_interface(
@@ -367,42 +503,56 @@ class LoadData(object):
 
         sql_manifest_row = sql_interface.get_sql_manifest_row()
 
-        cleaner = self._get_cleaner(table_name=table_name,
-                                    manifest_row=manifest_row)
-        csv_writer = CSVWriter(meta=self.meta,
-                               manifest_row=manifest_row,
-                               filename=temp_filepath)
-
-        # clean the file and save the output to a local pipe-delimited file
-        # if it doesn't have a 'loaded' status in the database manifest
-        if csv_reader.should_file_be_loaded(sql_manifest_row=sql_manifest_row):
-            print("  Cleaning...")
-            meta_only_fields = self._get_meta_only_fields(
-                table_name=table_name, data_fields=csv_reader.keys)
-            for idx, data_row in enumerate(csv_reader):
-                data_row.update(meta_only_fields)  # insert other field dict
-                clean_data_row = cleaner.clean(data_row, idx)
-                if clean_data_row is not None:
-                    csv_writer.write(clean_data_row)
-
-            csv_writer.close()
+        # skip the file if it has a 'loaded' status in the database manifest
+        # and hasn't changed since
+        if not csv_reader.should_file_be_loaded(
+                sql_manifest_row=sql_manifest_row):
+            return False
+        self._prepare_reload(manifest_row=manifest_row, csv_reader=csv_reader,
+                             sql_interface=sql_interface,
+                             sql_manifest_row=sql_manifest_row)
+
+        if self._stream_load:
+            # feed the cleaned rows directly to the database COPY
+            archive_filepath = temp_filepath if self._keep_temp_files else None
+            csv_stream = CSVStream(meta=self.meta, manifest_row=manifest_row,
+                                   rows=_clean_rows(meta=self.meta,
+                                                    manifest_row=manifest_row,
+                                                    csv_reader=csv_reader),
+                                   archive_filename=archive_filepath)
+            try:
+                self._update_database(sql_interface=sql_interface,
+                                      data_file=csv_stream)
+            finally:
+                csv_stream.close()
+            logging.info("  streamed {} rows".format(csv_stream.row_count))
+
+        # otherwise clean the file and save the output to a local
+        # pipe-delimited file before copying it
+        else:
+            sql_interface.row_count = _write_clean_file(
+                meta=self.meta, manifest_row=manifest_row,
+                csv_reader=csv_reader, temp_filepath=temp_filepath)
 
             # write the data to the database
             self._update_database(sql_interface=sql_interface)
 
             if not self._keep_temp_files:
-                csv_writer.remove_file()
+                _remove_temp_file(temp_filepath)
+
+        return True
 
-    def _update_database(self, sql_interface):
+    def _update_database(self, sql_interface, data_file=None):
         """
-        Load the clean PSV file into the database
+        Load the clean PSV file (or the given file-like data_file) into the
+        database
         """
         print("  Loading...")
 
         # create table if it doesn't exist
         sql_interface.create_table_if_necessary()
         try:
-            sql_interface.write_file_to_sql()
+            sql_interface.write_file_to_sql(data_file=data_file)
         except TableWritingError:
             # TODO: tell user total count of errors.
             # currently write_file_to_sql() just writes in log that file failed
@@ -410,6 +560,82 @@ class LoadData(object):
             pass
 
 
+def get_meta_only_fields(meta, table_name, data_fields):
+    """
+    Returns fields that exist in meta.json but not CSV so we can add
+    them to the row as it is cleaned and written to PSV file.
+
+    :param meta: the meta data as json data
+    :param table_name: the table name for the data being processed
+    :param data_fields: the fields for the data being processed
+    :return: additional fields as dict
+    """
+    meta_only_fields = {}
+    for field in meta[table_name]['fields']:
+        if field['source_name'] not in data_fields:
+            # adds 'sql_name',None as key,value pairs in dict
+            meta_only_fields[field['sql_name']] = None
+    return meta_only_fields
+
+
+def _clean_rows(meta, manifest_row, csv_reader):
+    """
+    Generator that cleans every row of csv_reader with the table's cleaner,
+    skipping rows the cleaner rejects.
+    """
+    table_name = manifest_row['destination_table']
+    cleaner = ingestionfunctions.get_cleaner_from_name(
+        meta=meta, manifest_row=manifest_row,
+        name=meta[table_name]['cleaner'])
+
+    print("  Cleaning {}...".format(manifest_row['unique_data_id']))
+    meta_only_fields = get_meta_only_fields(meta=meta, table_name=table_name,
+                                            data_fields=csv_reader.keys)
+    for idx, data_row in enumerate(csv_reader):
+        data_row.update(meta_only_fields)  # insert other field dict
+        clean_data_row = cleaner.clean(data_row, idx)
+        if clean_data_row is not None:
+            yield clean_data_row
+
+
+def _write_clean_file(meta, manifest_row, csv_reader, temp_filepath):
+    """
+    Cleans every row of csv_reader with the table's cleaner and writes the
+    output to the pipe-delimited file at temp_filepath. Returns the number of
+    rows written.
+    """
+    csv_writer = CSVWriter(meta=meta, manifest_row=manifest_row,
+                           filename=temp_filepath)
+    for clean_data_row in _clean_rows(meta=meta, manifest_row=manifest_row,
+                                      csv_reader=csv_reader):
+        csv_writer.write(clean_data_row)
+
+    csv_writer.close()
+    return csv_writer.row_count
+
+
+def clean_data_file(meta, manifest_row, temp_filepath, local_mar=False):
+    """
+    Process pool entry point used by LoadData when workers > 1. Only module
+    level, picklable arguments are passed in so the worker can rebuild its
+    own reader and cleaner; it returns the number of rows written to the
+    clean PSV file at temp_filepath.
+    """
+    use_local_mar(local_mar)
+    csv_reader = DataReader(meta=meta, manifest_row=manifest_row,
+                            load_from="file")
+    return _write_clean_file(meta=meta, manifest_row=manifest_row,
+                             csv_reader=csv_reader,
+                             temp_filepath=temp_filepath)
+
+
+def _remove_temp_file(temp_filepath):
+    try:
+        os.remove(temp_filepath)
+    except OSError:
+        pass
+
+
 def main(passed_arguments):
     """
     Initializes load procedure based on passed command line arguments and
@@ -461,7 +687,9 @@ def main(passed_arguments):
     #Instantiate and run the loader
     loader = LoadData(database_choice=database_choice, meta_path=meta_path,
                       manifest_path=manifest_path, keep_temp_files=keep_temp_files,
-                      drop_tables=drop_tables)
+                      drop_tables=drop_tables, workers=passed_arguments.workers,
+                      stream_load=passed_arguments.stream,
+                      local_mar=passed_arguments.local_mar)
 
     if passed_arguments.update_only:
         loader.update_database(passed_arguments.update_only)
@@ -496,6 +724,21 @@ if __name__ == '__main__':
     parser.add_argument('--update-only', nargs='+',
                         help='only update tables with these unique_data_id '
                              'values')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes used to clean data files '
+                             'in parallel')
+    parser.add_argument('--stream', action='store_true',
+                        help='stream cleaned rows straight into the database '
+                             'instead of writing temp PSV files first; not '
+                             'supported with --workers')
+    parser.add_argument('--local-mar', action='store_true',
+                        help='geocode from the downloaded mar.csv extract '
+                             'where possible instead of the MAR api; the '
+                             'extract has no project image or street view '
+                             'urls')
 
     # handle passed arguments and options
-    main(parser.parse_args())
+    passed_arguments = parser.parse_args()
+    if passed_arguments.stream and passed_arguments.workers > 1:
+        parser.error('--stream can only be used with --workers 1')
+    main(passed_arguments)
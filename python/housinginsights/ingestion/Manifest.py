@@ -8,13 +8,18 @@ from csv import DictWriter, DictReader
 from housinginsights.ingestion.DataReader import HIReader
 
 from datetime import datetime
-import dateutil.parser as dateparser
+
+from housinginsights.tools.dates import DateParser
 
 
 class Manifest(HIReader):
     """
     Adds extra functions specific to manifest.csv. This is the class that
     should be used to read the manifest and return it row-by-row.
+
+    The file is parsed once into memory, indexed by unique_data_id, by
+    destination_table and by include_flag, and only parsed again if it
+    changes on disk.
     """
 
     _include_flags_positive = ['use']
@@ -24,29 +29,98 @@ class Manifest(HIReader):
         super().__init__(path)
         self.unique_ids = {}  # from the unique_id column in the manifest
 
+        self._rows = []
+        self._by_uid = {}
+        self._by_table = {}
+        self._by_flag = {}
+        self._duplicate_ids = set()
+        self._stamp = None
+
         # validate the manifest
         if not self.has_unique_ids():
             raise ValueError('Manifest has duplicate unique_data_id!')
 
-    def __iter__(self):
-        self._length = 0
-        self._counter = Counter()
+    def _file_stamp(self):
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _load(self):
+        """
+        Parses the manifest into self._rows and the lookup indexes, unless it
+        hasn't changed since it was last parsed.
+        """
+        stamp = self._file_stamp()
+        if stamp == self._stamp:
+            return
+
+        rows = []
+        by_uid = {}
+        by_table = {}
+        by_flag = {}
+        duplicate_ids = set()
+        date_parser = DateParser()
         with open(self.path, 'r', newline='') as data:
             reader = DictReader(data)
-            self._keys = reader.fieldnames
+            keys = reader.fieldnames
             for row in reader:
-                self._length += 1
-
                 #parse the date into proper format for sql
                 try:
-                    _date = dateparser.parse(row['data_date'],dayfirst=False,
-                                             yearfirst=False)
-                    row['data_date'] = datetime.strftime(_date, '%Y-%m-%d')
+                    row['data_date'] = date_parser.format_date(row['data_date'])
                 except ValueError:
                     row['data_date'] = 'Null'
 
-                #return the row
-                yield row
+                uid = row['unique_data_id']
+                if uid in by_uid:
+                    duplicate_ids.add(uid)
+                else:
+                    by_uid[uid] = row
+                by_table.setdefault(row['destination_table'], []).append(row)
+                by_flag.setdefault(row['include_flag'], []).append(row)
+                rows.append(row)
+
+        self._keys = keys
+        self._rows = rows
+        self._by_uid = by_uid
+        self._by_table = by_table
+        self._by_flag = by_flag
+        self._duplicate_ids = duplicate_ids
+        self._stamp = stamp
+
+    def __iter__(self):
+        """
+        Yields a copy of each row in the manifest, so callers can change the
+        rows they are given without changing the index.
+        """
+        self._load()
+        self._length = len(self._rows)
+        self._counter = Counter()
+        for row in self._rows:
+            yield dict(row)
+
+    def __len__(self):
+        self._load()
+        return len(self._rows)
+
+    @property
+    def keys(self):
+        self._load()
+        return self._keys
+
+    def rows(self, include_flag=None, destination_table=None):
+        """
+        Yields a copy of each row matching the given include_flag and/or
+        destination_table, using the index instead of scanning the file.
+        """
+        self._load()
+        if destination_table is not None:
+            rows = self._by_table.get(destination_table, [])
+        elif include_flag is not None:
+            rows = self._by_flag.get(include_flag, [])
+        else:
+            rows = self._rows
+        for row in rows:
+            if include_flag is None or row['include_flag'] == include_flag:
+                yield dict(row)
 
     def has_unique_ids(self):
         """
@@ -57,27 +131,23 @@ class Manifest(HIReader):
 
         :return: true if passes validation; false otherwise
         """
-        self.unique_ids = {}
-
-        for row in self:
-            if row['unique_data_id'] in self.unique_ids:
-                return False
-            else:
-                #don't add flags that won't make it into the SQL database
-                if row['include_flag'] in Manifest._include_flags_positive:
-                    self.unique_ids[row['unique_data_id']] = 'found'
-        return True
+        self._load()
+        #don't add flags that won't make it into the SQL database
+        self.unique_ids = {row['unique_data_id']: 'found'
+                           for flag in Manifest._include_flags_positive
+                           for row in self._by_flag.get(flag, [])}
+        return not self._duplicate_ids
 
     def get_manifest_row(self, unique_data_id):
         """
         Returns the row for the given unique_data_id else 'None' if not in
         manifest.
         """
-        for row in self:
-            use = row['include_flag'] == 'use'
-            if row['unique_data_id'] == unique_data_id and use:
-                return row
-        return None
+        self._load()
+        row = self._by_uid.get(unique_data_id)
+        if row is None or row['include_flag'] != 'use':
+            return None
+        return dict(row)
 
     def create_list(self, folder_path):
         """
@@ -86,11 +156,14 @@ class Manifest(HIReader):
         with filename that matches unique_data_id used in manifest.
         """
         unique_data_ids = list()
+        # the folder isn't created if none of the downloads changed
+        if not os.path.isdir(folder_path):
+            return unique_data_ids
         files_in_folder = os.listdir(folder_path)
         for file in files_in_folder:
             file_path = os.path.join(folder_path, file)
-            uid, file_ext = file.split(sep='.')
-            if os.path.isfile(file_path) and file_ext == 'csv':
+            uid, file_ext = os.path.splitext(file)
+            if os.path.isfile(file_path) and file_ext == '.csv':
                 unique_data_ids.append(uid)
 
         return unique_data_ids
@@ -130,4 +203,6 @@ class Manifest(HIReader):
             writer.writeheader()
             writer.writerows(data)
 
+        # make sure the new file is parsed even if its mtime didn't change
+        self._stamp = None
         return self.path
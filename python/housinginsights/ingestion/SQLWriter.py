@@ -58,9 +58,10 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
                                              os.pardir, os.pardir)))
 # TODO: clean up unused imports
 from housinginsights.tools import dbtools
+from housinginsights.ingestion.rollups import refresh_file_rollups
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import ProgrammingError
-from psycopg2 import DataError
+from psycopg2 import DataError, IntegrityError
 import copy
 import datetime
 
@@ -70,6 +71,30 @@ class TableWritingError(Exception):
     pass
 
 
+def get_merge_keys(meta, manifest_row):
+    """
+    Returns the natural key columns the data file of the manifest row should
+    be merged on, or None if it should be loaded by replacing its rows.
+
+    A file is merged when its update_method in the manifest is 'merge' and
+    meta.json declares a natural_key for its table.
+
+    :param meta: meta data as json data
+    :param manifest_row: a given row in manifest.csv file
+    :return: list of sql_names, or None
+    """
+    if manifest_row.get('update_method') != 'merge':
+        return None
+    keys = meta[manifest_row['destination_table']].get('natural_key')
+    if not keys:
+        logging.warning("  {} has update_method 'merge' but {} has no "
+                        "natural_key in meta.json, replacing its rows "
+                        "instead".format(manifest_row['unique_data_id'],
+                                         manifest_row['destination_table']))
+        return None
+    return list(keys)
+
+
 class HISql(object):
     def __init__(self, meta, manifest_row, engine, filename=None):
         """
@@ -95,6 +120,17 @@ class HISql(object):
         self.filename = 'temp_{}.psv'.format(manifest_row['unique_data_id']) \
             if filename is None else filename
 
+        # recorded in the SQL manifest once the file is loaded, so unchanged
+        # files can be skipped next time (see DataReader.content_hash)
+        self.content_hash = None
+        self.row_count = None
+
+        # natural key to merge on, None to replace the rows of the file
+        self.merge_keys = get_merge_keys(meta, manifest_row)
+        # if True, rows already loaded from this file are deleted in the same
+        # transaction that copies the new ones (see LoadData._prepare_reload)
+        self.replace_existing = False
+
         # get list of 'sql_name' and 'type' from fields for database updating
         self.sql_fields = []
         self.sql_field_types = []
@@ -102,7 +138,14 @@ class HISql(object):
             self.sql_fields.append(field['sql_name'])
             self.sql_field_types.append(field['type'])
 
-    def write_file_to_sql(self):
+    def write_file_to_sql(self, data_file=None):
+        """
+        Copies the clean pipe-delimited data into the table and marks it as
+        loaded in the SQL manifest.
+
+        :param data_file: optional file-like object (e.g. a CSVStream) to
+        copy from instead of opening self.filename
+        """
         #TODO let this use existing session/connection/engine instead?
         #engine = dbtools.get_database_engine("local_database")
 
@@ -110,28 +153,20 @@ class HISql(object):
         trans = conn.begin()
 
         try:
-
-            print("  opening {}".format(self.filename))
-            with open(self.filename, 'r', encoding='utf-8') as f:
-                #copy_from is only available on the psycopg2 object, we need to dig in to get it
-                dbapi_conn = conn.connection
-                dbapi_conn.set_client_encoding("UTF8")
-                dbapi_cur = dbapi_conn.cursor()
-
-                dbapi_cur.copy_from(f, self.tablename, sep='|', null='Null', columns=None)
-
-                self.update_manifest_row(conn=conn, status="loaded")
-
-                #used for debugging, keep commented in real usage
-                #raise ProgrammingError(statement="test", params="test", orig="test")
-
-                dbapi_conn.commit()
+            if data_file is None:
+                print("  opening {}".format(self.filename))
+                with open(self.filename, 'r', encoding='utf-8') as f:
+                    self._copy_from_file(conn=conn, data_file=f)
+            else:
+                print("  streaming {}".format(self.unique_data_id))
+                self._copy_from_file(conn=conn, data_file=data_file)
             trans.commit()
             logging.info("  data file loaded into database")
         
         #TODO need to find out what types of expected errors might actually occur here  
         #For now, assume that SQLAlchemy will raise a programmingerror
-        except (ProgrammingError, DataError) as e:
+        except (ProgrammingError, DataError, IntegrityError,
+                TableWritingError) as e:
             trans.rollback()
 
             logging.warning("  FAIL: something went wrong loading {}".format(self.unique_data_id))
@@ -139,7 +174,120 @@ class HISql(object):
             raise TableWritingError
 
         conn.close()
-            
+
+    def _copy_from_file(self, conn, data_file):
+        #copy_from is only available on the psycopg2 object, we need to dig in to get it
+        dbapi_conn = conn.connection
+        dbapi_conn.set_client_encoding("UTF8")
+        dbapi_cur = dbapi_conn.cursor()
+
+        if self.merge_keys is None:
+            if self.replace_existing:
+                # if the copy fails the old rows are rolled back into place
+                dbapi_cur.execute("DELETE FROM {} WHERE unique_data_id = "
+                                  "%(uid)s;".format(self.tablename),
+                                  {'uid': self.unique_data_id})
+            dbapi_cur.copy_from(data_file, self.tablename, sep='|',
+                                null='Null', columns=None)
+        else:
+            self._merge_from_file(cursor=dbapi_cur, data_file=data_file)
+
+        # a CSVStream only knows how many rows it held once it is consumed
+        if getattr(data_file, 'row_count', None) is not None:
+            self.row_count = data_file.row_count
+
+        # the api's pre-aggregated counts change with the rows and the
+        # load_date, or not at all if the load fails
+        refresh_file_rollups(conn, self.meta, self.tablename,
+                             self.unique_data_id)
+
+        self.update_manifest_row(conn=conn, status="loaded")
+
+        #used for debugging, keep commented in real usage
+        #raise ProgrammingError(statement="test", params="test", orig="test")
+
+        dbapi_conn.commit()
+
+    def _merge_from_file(self, cursor, data_file):
+        """
+        Copies the data into a temporary staging table and merges it into the
+        table on (unique_data_id, natural key): rows whose key is no longer
+        in the file are deleted, new keys are inserted and existing rows are
+        only updated if one of their values changed.
+
+        A unique index on the key columns is created the first time a table
+        is merged into; every file loaded into the table after that must
+        have unique keys too.
+
+        A file with a NULL in a key column, or with two rows sharing a key,
+        can't be matched to the table row by row, so it is rejected with a
+        TableWritingError before anything is changed.
+        """
+        staging = "{}_staging".format(self.tablename)
+        keys = ['unique_data_id'] + self.merge_keys
+        values = [field for field in self.sql_fields if field not in keys]
+        key_columns = ",".join(keys)
+        columns = ",".join(self.sql_fields)
+
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS {table}_natural_key "
+                       "ON {table} ({keys});".format(table=self.tablename,
+                                                     keys=key_columns))
+        cursor.execute("CREATE TEMP TABLE {staging} (LIKE {table}) "
+                       "ON COMMIT DROP;".format(staging=staging,
+                                                table=self.tablename))
+        cursor.copy_from(data_file, staging, sep='|', null='Null',
+                         columns=None)
+
+        cursor.execute("SELECT count(*), count(*) FILTER (WHERE {nulls}), "
+                       "(SELECT count(*) FROM (SELECT DISTINCT {keys} "
+                       "FROM {staging}) AS d) FROM {staging};".format(
+                           nulls=" OR ".join("{} IS NULL".format(key)
+                                             for key in keys),
+                           keys=key_columns, staging=staging))
+        row_count, null_keys, distinct_keys = cursor.fetchone()
+        if null_keys:
+            logging.warning("  {} of {} rows of {} have a NULL in {}".format(
+                null_keys, row_count, self.unique_data_id, keys))
+            raise TableWritingError("{} rows with a NULL natural key".format(
+                null_keys))
+        if row_count > distinct_keys:
+            logging.warning("  {} of {} rows of {} repeat a key in {}".format(
+                row_count - distinct_keys, row_count, self.unique_data_id,
+                keys))
+            raise TableWritingError("{} rows with a duplicate natural "
+                                    "key".format(row_count - distinct_keys))
+
+        key_matches = " AND ".join("s.{key} = t.{key}".format(key=key)
+                                   for key in keys)
+        cursor.execute("DELETE FROM {table} AS t WHERE t.unique_data_id = "
+                       "%(uid)s AND NOT EXISTS (SELECT 1 FROM {staging} AS s "
+                       "WHERE {key_matches});".format(
+                           table=self.tablename, staging=staging,
+                           key_matches=key_matches),
+                       {'uid': self.unique_data_id})
+        deleted = cursor.rowcount
+
+        if values:
+            on_conflict = "DO UPDATE SET {updates} WHERE ({old}) IS " \
+                          "DISTINCT FROM ({new})".format(
+                            updates=",".join("{0} = EXCLUDED.{0}".format(v)
+                                             for v in values),
+                            old=",".join("{}.{}".format(self.tablename, v)
+                                         for v in values),
+                            new=",".join("EXCLUDED.{}".format(v)
+                                         for v in values))
+        else:
+            on_conflict = "DO NOTHING"
+        cursor.execute("INSERT INTO {table} ({columns}) "
+                       "SELECT {columns} FROM {staging} "
+                       "ON CONFLICT ({keys}) {on_conflict};".format(
+                           table=self.tablename, columns=columns,
+                           keys=key_columns, staging=staging,
+                           on_conflict=on_conflict))
+        logging.info("  merged on {}: {} rows deleted, {} rows inserted or "
+                     "updated".format(self.merge_keys, deleted,
+                                      cursor.rowcount))
+
     def update_manifest_row(self, conn, status="unknown"):
         """
         Adds self.manifest_row associated with this table to the SQL manifest
@@ -150,6 +298,11 @@ class HISql(object):
         manifest_row = copy.copy(self.manifest_row)
         manifest_row['status'] = status
         manifest_row['load_date'] = datetime.datetime.now().isoformat()
+        if status == 'loaded':
+            if self.content_hash is not None:
+                manifest_row['content_hash'] = self.content_hash
+            if self.row_count is not None:
+                manifest_row['row_count'] = str(self.row_count)
 
         # Remove the row if it exists
         # TODO make sure data is synced or appended properly
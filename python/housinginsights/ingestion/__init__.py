@@ -4,8 +4,8 @@ from .DataReader import DataReader
 #from .functions import load_meta_data, check_or_create_sql_manifest
 
 #Replace this method?
-from .CSVWriter import CSVWriter
-from .SQLWriter import HISql, TableWritingError
+from .CSVWriter import CSVWriter, CSVStream
+from .SQLWriter import HISql, TableWritingError, get_merge_keys
 
 
 #TODO add to this
@@ -17,6 +17,8 @@ __all__ = [	'Manifest',
 			'GenericCleaner', 
 			'BuildingCleaner',
 			'CSVWriter',
+			'CSVStream',
 			'HISql',
-			'TableWritingError'
+			'TableWritingError',
+			'get_merge_keys'
 			]
@@ -31,7 +31,8 @@ def load_meta_data(filename='meta.json'):
                 "sql_name": "nlihc_id",
                 "type": "object"
             }
-            ]}
+            ],
+            "natural_key": ["nlihc_id"]     (optional, see SQLWriter.get_merge_keys)
         }
     """
     with open(filename) as fh:
@@ -47,6 +48,11 @@ def load_meta_data(filename='meta.json'):
                         json_is_valid = False
                         first_json_error = "Location: table: {}, section: {}, attribute: {}".format(table, field, key)
                         raise ValueError("Error found in JSON, check expected format. {}".format(first_json_error))
+            sql_names = [field['sql_name'] for field in meta[table]['fields']]
+            for key in meta[table].get('natural_key', []):
+                if key not in sql_names:
+                    json_is_valid = False
+                    raise ValueError("natural_key {} of table {} is not a sql_name".format(key, table))
     except:
         raise ValueError("Error found in JSON, check expected format.")
 
@@ -55,6 +61,26 @@ def load_meta_data(filename='meta.json'):
     return meta
 
 
+# columns of the SQL manifest; content_hash and row_count are only filled in
+# for files that are loaded
+SQL_MANIFEST_FIELDS = [
+    ("status", "text"),
+    ("load_date", "timestamp"),
+    ("include_flag", "text"),
+    ("destination_table", "text"),
+    ("unique_data_id", "text"),
+    ("update_method", "text"),
+    ("data_date", "date"),
+    ("encoding", "text"),
+    ("local_folder", "text"),
+    ("s3_folder", "text"),
+    ("filepath", "text"),
+    ("notes", "text"),
+    ("content_hash", "text"),
+    ("row_count", "integer")
+]
+
+
 def check_or_create_sql_manifest(engine, rebuild=False):
     '''
     Makes sure we have a manifest table in the database. 
@@ -71,36 +97,30 @@ def check_or_create_sql_manifest(engine, rebuild=False):
     written to the database, and whether they are still there or 
     have been deleted.
 
+    A manifest table made before columns were added to SQL_MANIFEST_FIELDS
+    gets the missing columns added.
+
     engine = the SQLalchemy engine to get to the database
     rebuild = Boolean as to whether to drop the table first. 
     '''
     try:
         db_conn = engine.connect()
-        sql_query = "SELECT * FROM manifest"
+        sql_query = "SELECT * FROM manifest LIMIT 0"
         query_result = db_conn.execute(sql_query)
-        results = [dict(row.items()) for row in query_result]
+        existing_columns = set(query_result.keys())
+        for column, data_type in SQL_MANIFEST_FIELDS:
+            if column not in existing_columns:
+                db_conn.execute("ALTER TABLE manifest ADD COLUMN {} {};".format(
+                    column, data_type))
+                logging.info("Added {} to the SQL manifest".format(column))
         db_conn.close()
         return True
     except ProgrammingError as e:
         try:
             #Create the query with appropriate fields and datatypes
             db_conn = engine.connect()
-            fields = [
-                ("status","text"),
-                ("load_date", "timestamp"),
-                ("include_flag","text"),
-                ("destination_table","text"),
-                ("unique_data_id","text"),
-                ("update_method", "text"),
-                ("data_date","date"),
-                ("encoding", "text"),
-                ("local_folder","text"),
-                ("s3_folder","text"),
-                ("filepath","text"),
-                ("notes","text")
-                ]
             field_statements = []
-            for tup in fields:
+            for tup in SQL_MANIFEST_FIELDS:
                 field_statements.append(tup[0] + " " + tup[1])
             field_command = ",".join(field_statements)
             create_command = "CREATE TABLE manifest({});".format(field_command)
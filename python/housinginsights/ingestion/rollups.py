@@ -0,0 +1,132 @@
+"""
+Pre-aggregated counts of our observation tables (crime, building_permits)
+that the api's summarize_observations endpoint reads instead of grouping the
+raw tables on every request.
+
+For each data file (unique_data_id) of a source table, filter and zone
+grouping the observation_rollup table holds the number of records per zone
+per day, where the day is date({date_field}). The date fields are timestamps, so the api matches the raw
+tables on whole days too: a range of days [first_day, end_day) is
+{date_field} >= first_day AND {date_field} < end_day on the raw table and
+day >= first_day AND day < end_day here, which count the same records.
+
+The rollups are per day rather than per month because the api's 'start'
+parameter can be any day, and month buckets could only answer ranges that
+start and end on a month boundary.
+
+A file's rollup rows are rebuilt by HISql in the transaction that loads the
+file, so they are never out of step with the table: the api sees the new
+rows, the new rollups and the new load_date in the SQL manifest together, and
+a load that fails leaves all three as they were.
+"""
+
+from sqlalchemy import text
+
+ROLLUP_TABLE = 'observation_rollup'
+
+ROLLUP_GROUPINGS = ['ward', 'neighborhood_cluster', 'anc', 'zip',
+                    'census_tract']
+
+_VIOLENT_OFFENSES = "('ROBBERY','HOMICIDE','ASSAULT W/DANGEROUS WEAPON'," \
+                    "'SEX ABUSE')"
+
+# The filters must match the ones in api/application.py
+# summarize_observations, which falls back to the raw tables for any table,
+# filter or grouping not rolled up here.
+ROLLUP_SOURCES = {
+    'crime': {
+        'date_field': 'report_date',
+        'filters': {
+            'all': '',
+            'violent': " AND OFFENSE IN {}".format(_VIOLENT_OFFENSES),
+            'nonviolent': " AND OFFENSE NOT IN {}".format(_VIOLENT_OFFENSES)
+        }
+    },
+    'building_permits': {
+        'date_field': 'issue_date',
+        'filters': {
+            'all': '',
+            'construction': " AND permit_type_name = 'CONSTRUCTION' "
+        }
+    }
+}
+
+
+def create_rollup_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS {table} (
+            source_table text,
+            unique_data_id text,
+            filter_name text,
+            grouping text,
+            zone text,
+            day date,
+            records integer
+        )""".format(table=ROLLUP_TABLE))
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS {table}_lookup
+        ON {table} (source_table, filter_name, grouping, day)
+        """.format(table=ROLLUP_TABLE))
+
+
+def rollup_groupings(meta, table_name):
+    """
+    Returns the zone groupings that exist as columns of the table.
+    """
+    sql_names = set(field['sql_name'] for field in meta[table_name]['fields'])
+    return [grouping for grouping in ROLLUP_GROUPINGS
+            if grouping in sql_names]
+
+
+def delete_file_rollups(conn, table_name, unique_data_id):
+    """
+    Deletes the rollup rows of one data file of the table, if the table is
+    rolled up. Runs in the transaction of conn, which is not committed.
+    """
+    if table_name not in ROLLUP_SOURCES:
+        return
+    create_rollup_table(conn)
+    conn.execute(text("DELETE FROM {} WHERE source_table = :table "
+                      "AND unique_data_id = :uid".format(ROLLUP_TABLE)),
+                 table=table_name, uid=unique_data_id)
+
+
+def refresh_file_rollups(conn, meta, table_name, unique_data_id):
+    """
+    Rebuilds the rollup rows of one data file of the table from the rows of
+    the file now in the table, if the table has a rollup defined in
+    ROLLUP_SOURCES. Runs in the transaction of conn, which is not committed,
+    so callers can make it part of loading the file.
+
+    :param conn: SQLAlchemy connection to the database
+    :param meta: the meta data as json data
+    :param table_name: destination table of the file
+    :param unique_data_id: the file whose rows were just loaded
+    :return: True if the table is rolled up
+    """
+    source = ROLLUP_SOURCES.get(table_name)
+    if source is None or table_name not in meta:
+        return False
+
+    delete_file_rollups(conn, table_name, unique_data_id)
+    for grouping in rollup_groupings(meta, table_name):
+        for filter_name, additional_wheres in source['filters'].items():
+            conn.execute(text("""
+                INSERT INTO {rollup_table}
+                    (source_table, unique_data_id, filter_name, grouping,
+                     zone, day, records)
+                SELECT :table, :uid, :filter_name, :grouping,
+                    {grouping}, date({date_field}), count(*)
+                FROM {table_name}
+                WHERE unique_data_id = :uid
+                AND {date_field} IS NOT NULL
+                {additional_wheres}
+                GROUP BY {grouping}, date({date_field})
+                """.format(rollup_table=ROLLUP_TABLE,
+                           grouping=grouping,
+                           date_field=source['date_field'],
+                           table_name=table_name,
+                           additional_wheres=additional_wheres)),
+                         table=table_name, uid=unique_data_id,
+                         filter_name=filter_name, grouping=grouping)
+    return True
@@ -3,6 +3,7 @@ Module provides the api connection class for DCHousing data in opendata.dc.gov
 web site.
 """
 
+from functools import partial
 from pprint import pprint
 import logging
 
@@ -34,6 +35,7 @@ class DCHousingApiConn(BaseApiConn):
         super().__init__(DCHousingApiConn.BASEURL)
 
         self._available_unique_data_ids = ['dchousing']
+        self._unchanged = set()
 
     def get_data(self, unique_data_ids=None, sample=False, output_type='csv',
                  **kwargs):
@@ -52,19 +54,64 @@ class DCHousingApiConn(BaseApiConn):
                 logging.info("  The unique_data_id '{}' is not supported by the DCHousingApiConn".format(u))
 
             else:
-                result = self.get(DCHousingApiConn.DATA_URL)
-                if result.status_code != 200:
-                    err = "An error occurred during request: status {0}"
-                    raise Exception(err.format(result.status_code))
-
-                content = result.text
-
-                if output_type == 'stdout':
-                    print(content)
-                elif output_type == 'csv':
-                    self.directly_to_file(data=content,
-                                          filepath=self.output_paths[u])
-                    self.create_project_subsidy_csv(
-                        self._available_unique_data_ids[0], PROJECT_FIELDS_MAP,
-                        SUBSIDY_FIELDS_MAP, db)
+                self._download(u, output_type)
+                if output_type == 'csv':
+                    self.split_project_subsidy(db)
+
+    def _download(self, unique_data_id, output_type='csv'):
+        if output_type == 'csv':
+            changed = self.download_if_changed(
+                unique_data_id, DCHousingApiConn.DATA_URL,
+                self.output_paths[unique_data_id])
+            if changed:
+                self._unchanged.discard(unique_data_id)
+            else:
+                self._unchanged.add(unique_data_id)
+            return
+
+        result = self.get(DCHousingApiConn.DATA_URL)
+        if result.status_code != 200:
+            err = "An error occurred during request: status {0}"
+            raise Exception(err.format(result.status_code))
+
+        content = result.text
+
+        if output_type == 'stdout':
+            print(content)
+
+    def split_project_subsidy(self, db=None):
+        """
+        Splits the downloaded dchousing file into the project and subsidy
+        files. Buildings are matched to the project table in the database,
+        so this needs the project table to be loaded.
+
+        Skipped if the dchousing download was unchanged, since there is no
+        new file to split.
+        """
+        if self._available_unique_data_ids[0] in self._unchanged:
+            logging.info("  Skipping the project/subsidy split of unchanged "
+                         "dchousing data")
+            return
+        self.create_project_subsidy_csv(
+            self._available_unique_data_ids[0], PROJECT_FIELDS_MAP,
+            SUBSIDY_FIELDS_MAP, db)
+
+    def download_tasks(self, unique_data_ids=None, sample=False,
+                       output_type='csv', db=None):
+        """
+        Splits get_data into the download and the project/subsidy split,
+        which has to wait for the download.
+        """
+        if unique_data_ids is None:
+            unique_data_ids = self._available_unique_data_ids
+        if 'dchousing' not in unique_data_ids:
+            return []
+
+        tasks = [('dchousing', partial(self._download, 'dchousing',
+                                       output_type), [])]
+        if output_type == 'csv':
+            tasks.append(('dchousing_split',
+                          partial(self.split_project_subsidy, db),
+                          ['dchousing']))
+        return tasks
 
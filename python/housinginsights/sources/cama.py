@@ -3,14 +3,18 @@ import os
 import sys
 import requests
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import csv
 import datetime
 import logging
+import threading
+import time
 
 PYTHON_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir))
 sys.path.append(PYTHON_PATH)
 
 from housinginsights.sources.base import BaseApiConn
+from housinginsights.tools.ratelimit import RateLimiter
 
 
 class MarApiConn_2(BaseApiConn):
@@ -66,6 +70,48 @@ class MarApiConn_2(BaseApiConn):
 
         return mar_returns
 
+class ZoneUnitCounts(object):
+    """
+    Housing unit and bedroom totals keyed by (zone_type, zone), e.g.
+    ('anc', 'ANC 8A'). Adding a property is a single dict update, and
+    partial counts (for example from separate workers each counting a
+    slice of the properties) can be combined with merge().
+    """
+
+    def __init__(self):
+        self._counts = OrderedDict()
+
+    def add(self, zone_type, zone, housing_units, bedrooms):
+        counts = self._counts.get((zone_type, zone))
+        if counts is None:
+            self._counts[(zone_type, zone)] = [housing_units, bedrooms]
+        else:
+            counts[0] += housing_units
+            counts[1] += bedrooms
+
+    def merge(self, other):
+        """
+        Adds the totals of another ZoneUnitCounts into this one.
+        """
+        for (zone_type, zone), (housing_units, bedrooms) in other._counts.items():
+            self.add(zone_type, zone, housing_units, bedrooms)
+        return self
+
+    def rows(self, zone_type):
+        """
+        Returns the totals for one zone type as a list of OrderedDicts with
+        zone_type, zone, housing_unit_count and bedroom_unit_count keys.
+        """
+        return [OrderedDict([('zone_type', key[0]), ('zone', key[1]),
+                             ('housing_unit_count', counts[0]),
+                             ('bedroom_unit_count', counts[1])])
+                for key, counts in self._counts.items()
+                if key[0] == zone_type]
+
+    def __len__(self):
+        return len(self._counts)
+
+
 class CamaApiConn(BaseApiConn):
     """
     API Interface to the Computer Assisted Mass Appraisal - Residential (CAMA)
@@ -74,8 +120,90 @@ class CamaApiConn(BaseApiConn):
     """
 
     BASEURL = 'https://opendata.arcgis.com/datasets'
-    def __init__(self):
+    ZONE_TYPES = ['anc', 'census_tract', 'neighborhood_cluster', 'ward', 'zip']
+
+    def __init__(self, max_workers=8, requests_per_second=10, retries=3):
+        """
+        :param max_workers: number of MAR lookups made concurrently
+        :type max_workers: int
+
+        :param requests_per_second: average MAR request rate shared by all
+        the workers
+        :type requests_per_second: float
+
+        :param retries: number of attempts made for each SSL before giving up
+        :type retries: int
+        """
         super().__init__(CamaApiConn.BASEURL)
+        self.max_workers = max_workers
+        self.retries = retries
+        self._rate_limiter = RateLimiter(requests_per_second)
+        self._thread_data = threading.local()
+
+    def _get_mar_api(self):
+        # requests sessions aren't guaranteed to be thread safe, so every
+        # worker thread gets its own connection
+        if not hasattr(self._thread_data, 'mar_api'):
+            self._thread_data.mar_api = MarApiConn_2()
+        return self._thread_data.mar_api
+
+    def _lookup_zones(self, ssl_key):
+        """
+        Returns the MAR zones for a (square, lot, suffix) key, retrying
+        failed requests with an increasing delay.
+        """
+        square, lot, suffix = ssl_key
+        for attempt in range(1, self.retries + 1):
+            self._rate_limiter.acquire()
+            try:
+                return self._get_mar_api().get_data(square, lot, suffix)
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                logging.info("  MAR lookup failed for {} (attempt {}): {}"
+                             .format(ssl_key, attempt, e))
+                time.sleep(2 ** attempt)
+
+    def _lookup_all_zones(self, ssl_keys):
+        """
+        Resolves every unique (square, lot, suffix) key to its MAR zones
+        using a pool of threads. Keys that still fail after retrying are
+        left out of the returned dict.
+        """
+        zones = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self._lookup_zones, key): key
+                       for key in ssl_keys}
+            for index, future in enumerate(futures):
+                if index % 1000 == 0:
+                    print("  currently at MAR lookup {}".format(index))
+                key = futures[future]
+                try:
+                    zones[key] = future.result()
+                except Exception as e:
+                    logging.warning("  Error! MAR lookup failed for SSL {}: {}"
+                                    .format(key, e))
+        return zones
+
+    @staticmethod
+    def _parse_ssl(ssl):
+        """
+        Returns the (square, lot, suffix) parts of a CAMA SSL.
+
+        Certain square values have four digits + a letter. (ex. 8888E)
+        Square would be the first four digits and suffix would be the letter.
+        SSL sometimes comes as 8 digit string without spacing in the middle.
+        """
+        if len(ssl) == 8:
+            square = ssl[:4]
+            lot = ssl[4:]
+        else:
+            square, lot = ssl.split()
+        suffix = ' '
+        if len(square) > 4:
+            suffix = square[4:]
+            square = square[:4]
+        return square, lot, suffix
 
     def get_data(self):
         """
@@ -85,8 +213,7 @@ class CamaApiConn(BaseApiConn):
         by get_csv() method.
         """
         logging.info("Starting CAMA")
-        
-        mar_api = MarApiConn_2()
+
         result = self.get(urlpath='/c5fb3fbe4c694a59a6eef7bf5f8bc49a_25.geojson', params=None)
 
         if result.status_code != 200:
@@ -95,52 +222,20 @@ class CamaApiConn(BaseApiConn):
         cama_data = result.json()
         logging.info("  Got cama_data. Length:{}".format(len(cama_data['features'])))
 
-        """
-        Example of: anc_count = [OrderedDict([('zone_type', 'anc'), ('zone', 'ANC 2B'),
-                                ('housing_unit_count', 10), ('bedroom_unit_count', 10)], etc)]
-        """
-        zone_types = ['anc', 'census_tract', 'neighborhood_cluster', 'ward', 'zip']
-        anc_count = []
-        census_count = []
-        cluster_count = []
-        ward_count = []
-        zipcode_count = []
-
-
-        """
-        Take each CAMA property data and retrieve the MAR data.
-        """
-        """
-        Certain square values have four digits + a letter. (ex. 8888E)
-        Square would be the first four digits and suffix would be the letter.
-        SSL sometimes comes as 8 digit string without spacing in the middle.
-        """
         """
         CAMA data includes bldgs under construction. CAMA's data includes AYB of 2018
         as of June 2017. We eliminate all data points that are under construction and
         don't provide any housing units and bedrm at this time.
         """
-        for index, row in enumerate(cama_data['features']):
-            if (index % 1000 == 0):
-                print("  currently at index {}".format(index))
+        current_year = int(datetime.date.today().strftime('%Y'))
+        properties = []
+        for row in cama_data['features']:
             try:
-                current_year = int(datetime.date.today().strftime('%Y'))
                 #Skipping none values for units under construction
                 if row['properties']['AYB'] is not None and int(row['properties']['AYB']) > current_year:
                     continue
 
-                objectid = row['properties']['OBJECTID']
-                if len(row['properties']['SSL']) == 8:
-                    square = row['properties']['SSL'][:4]
-                    lot = row['properties']['SSL'][4:]
-                else:
-                    square, lot = row['properties']['SSL'].split()
-                suffix = ' '
-                if len(square) > 4:
-                    square = square[:4]
-                    suffix = square[-1]
-
-                mar_return = mar_api.get_data(square, lot, suffix)
+                ssl_key = self._parse_ssl(row['properties']['SSL'])
 
                 ''' Count the housing units and bedrooms '''
                 num_units = 0
@@ -152,23 +247,7 @@ class CamaApiConn(BaseApiConn):
                 if bedrm == 0: bedrm = 1
                 if bedrm == None: bedrm = 0
 
-                for zone in zone_types:
-                    if zone == 'anc': zone_count = anc_count
-                    elif zone == 'census_tract': zone_count = census_count
-                    elif zone == 'neighborhood_cluster': zone_count = cluster_count
-                    elif zone == 'ward': zone_count = ward_count
-                    elif zone == 'zip': zone_count = zipcode_count
-
-                    if 'Warning' not in mar_return.keys():
-                        flag = False
-                        for dictionary in zone_count: #dictionary is {'zone_type': 'ANC', 'zone': 'ANC 8A', etc.}
-                            if dictionary['zone'] == mar_return[zone]: #mar_return[ANC] is 'ANC 8A'
-                                dictionary['housing_unit_count'] += num_units
-                                dictionary['bedroom_unit_count'] += bedrm
-                                flag = True
-                                break
-                        if not flag:
-                            zone_count.append( OrderedDict([('zone_type', zone), ('zone', mar_return[zone]), ('housing_unit_count', num_units), ('bedroom_unit_count', bedrm)]) )
+                properties.append((ssl_key, num_units, bedrm))
 
             except Exception as e:
                 exc_type, exc_obj, exc_tb = sys.exc_info()
@@ -176,8 +255,42 @@ class CamaApiConn(BaseApiConn):
                 print("Error! SSL: ", row['properties']['SSL'], row['properties']['AYB'])
                 continue
 
-        return {'anc': anc_count, 'census_tract': census_count, 'neighborhood_cluster': cluster_count, 'ward': ward_count, 'zip': zipcode_count}
+        """
+        Take each CAMA property data and retrieve the MAR data. Many properties
+        share an SSL, so each unique SSL is only looked up once.
+        """
+        unique_keys = set(ssl_key for ssl_key, _, _ in properties)
+        logging.info("  Looking up {} unique SSLs in MAR".format(len(unique_keys)))
+        zones_by_ssl = self._lookup_all_zones(unique_keys)
+
+        zone_counts = self.count_units(properties, zones_by_ssl)
 
+        """
+        Example of: 'anc': [OrderedDict([('zone_type', 'anc'), ('zone', 'ANC 2B'),
+                            ('housing_unit_count', 10), ('bedroom_unit_count', 10)], etc)]
+        """
+        return {zone_type: zone_counts.rows(zone_type)
+                for zone_type in CamaApiConn.ZONE_TYPES}
+
+    @staticmethod
+    def count_units(properties, zones_by_ssl):
+        """
+        Totals the housing units and bedrooms of the properties for every
+        zone they fall in.
+
+        :param properties: list of (ssl_key, num_units, bedrm) tuples
+        :param zones_by_ssl: dict of ssl_key to MarApiConn_2.get_data results
+        :return: ZoneUnitCounts
+        """
+        zone_counts = ZoneUnitCounts()
+        for ssl_key, num_units, bedrm in properties:
+            mar_return = zones_by_ssl.get(ssl_key)
+            if mar_return is None or 'Warning' in mar_return:
+                continue
+            for zone_type in CamaApiConn.ZONE_TYPES:
+                zone_counts.add(zone_type, mar_return[zone_type], num_units,
+                                bedrm)
+        return zone_counts
 
     def get_csv(self):
         """
@@ -93,7 +93,15 @@ class CensusApiConn(BaseApiConn):
                 #We will want the calling function to continue with other data sources instead of erroring out. 
                 logging.info("  The unique_data_id '{}' is not supported by the CensusApiConn".format(u))
             else:
-                result = self.get(self._urls[u], params={'key':self.census_api_key, 'get':self._fields[u], 'for': 'tract:*', 'in': 'state:11'})
+                params = {'key':self.census_api_key, 'get':self._fields[u], 'for': 'tract:*', 'in': 'state:11'}
+
+                if output_type == 'csv':
+                    #Past ACS years don't change, so skip writing (and updating the manifest for) unchanged data
+                    result = self.get_if_changed(u, self._urls[u], params=params)
+                    if result is None:
+                        continue
+                else:
+                    result = self.get(self._urls[u], params=params)
                 
                 if result.status_code != 200:
                     err = "An error occurred during request: status {0}"
@@ -108,6 +116,7 @@ class CensusApiConn(BaseApiConn):
                 elif output_type == 'csv':
                     jsondata=json.loads(content)
                     self.result_to_csv(jsondata[0], jsondata[1:],  self.output_paths[u])
+                    self.record_download(u, self._urls[u], params, result, self.output_paths[u])
                 
                 #Can't yield content if we get multiple sources at once
                 if len(unique_data_ids) == 1:
@@ -1,8 +1,29 @@
 
 from pprint import pprint
+import os
 
 from housinginsights.sources.base import BaseApiConn
 from housinginsights.sources.models.mar import MarResult, FIELDS
+from housinginsights.tools.cache import PersistentCache, cache_folder
+
+# MAR lookups are shared by every MarApiConn in the process and persisted
+# between runs, so reloading a table only hits the api for new addresses.
+MAR_CACHE_PATH = os.path.join(cache_folder, 'mar_cache.sqlite')
+MAR_CACHE_TTL = 60 * 60 * 24 * 30  # seconds; MAR records rarely change
+MAR_CACHE_MAX_ENTRIES = 200000
+
+_mar_cache = None
+
+
+def get_mar_cache():
+    """
+    Returns the process-wide cache used for MAR api results.
+    """
+    global _mar_cache
+    if _mar_cache is None:
+        _mar_cache = PersistentCache(MAR_CACHE_PATH, ttl=MAR_CACHE_TTL,
+                                     max_entries=MAR_CACHE_MAX_ENTRIES)
+    return _mar_cache
 
 
 class MarApiConn(BaseApiConn):
@@ -13,8 +34,54 @@ class MarApiConn(BaseApiConn):
 
     BASEURL = 'http://citizenatlas.dc.gov/newwebservices/locationverifier.asmx'
 
-    def __init__(self):
+    def __init__(self, use_cache=True):
+        """
+        :param use_cache: if True, results of find_location and the reverse
+        lookups are read from and saved to the shared MAR cache.
+        :type use_cache: bool
+        """
         super().__init__(MarApiConn.BASEURL)
+        self.cache = get_mar_cache() if use_cache else None
+
+    def _get_json(self, urlpath, params, key):
+        """
+        Returns the json result of the api call, using the cache when
+        possible.
+
+        :param key: normalized form of the lookup used as the cache key
+        :type key: str
+        """
+        cache_key = '{}:{}'.format(urlpath, key)
+        if self.cache is not None:
+            data = self.cache.get(cache_key)
+            if data is not None:
+                return data
+
+        result = self.get(urlpath, params=params)
+        if result.status_code != 200:
+            err = "An error occurred during request: status {0}"
+            raise Exception(err.format(result.status_code))
+        data = result.json()
+
+        if self.cache is not None:
+            self.cache.set(cache_key, data)
+        return data
+
+    @staticmethod
+    def _normalize_address(location):
+        return ' '.join(str(location).upper().split())
+
+    @staticmethod
+    def _normalize_coords(*coords):
+        # rounding to 6 decimals is ~10cm for lat/lon, which is finer than
+        # the MAR data itself
+        normalized = []
+        for coord in coords:
+            try:
+                normalized.append('{:.6f}'.format(float(coord)))
+            except ValueError:
+                normalized.append(str(coord).strip())
+        return ','.join(normalized)
 
     def find_location(self, location, output_type=None,
                       output_file=None):
@@ -37,17 +104,15 @@ class MarApiConn(BaseApiConn):
             'f': 'json',
             'str': location
         }
-        result = self.get('/findLocation2', params=params)
-        if result.status_code != 200:
-            err = "An error occurred during request: status {0}"
-            raise Exception(err.format(result.status_code))
+        data = self._get_json('/findLocation2', params,
+                              key=self._normalize_address(location))
         if output_type == 'stdout':
-            pprint(result.json())
+            pprint(data)
         elif output_type == 'csv':
-            data = result.json()['returnDataset']['Table1']
-            results = [MarResult(address).data for address in data]
+            table = data['returnDataset']['Table1']
+            results = [MarResult(address).data for address in table]
             self.result_to_csv(FIELDS, results, output_file)
-        return result.json()
+        return data
 
     def reverse_geocode(self, xcoord, ycoord, output_type=None,
                         output_file=None):
@@ -76,17 +141,15 @@ class MarApiConn(BaseApiConn):
             'x': xcoord,
             'y': ycoord
         }
-        result = self.get('/reverseGeocoding2', params=params)
-        if result.status_code != 200:
-            err = "An error occurred during request: status {0}"
-            raise Exception(err.format(result.status_code))
+        data = self._get_json('/reverseGeocoding2', params,
+                              key=self._normalize_coords(xcoord, ycoord))
         if output_type == 'stdout':
-            pprint(result.json())
+            pprint(data)
         elif output_type == 'csv':
-            data = result.json()['Table1']
-            results = [MarResult(address) for address in data]
+            table = data['Table1']
+            results = [MarResult(address) for address in table]
             self.result_to_csv(FIELDS, results, output_file)
-        return result.json()
+        return data
 
     def get_condo_count(self, location, output_type=None,
                         output_file=None):
@@ -179,17 +242,15 @@ class MarApiConn(BaseApiConn):
             'lat': latitude,
             'lng': longitude
         }
-        result = self.get('/reverseLatLngGeocoding2', params=params)
-        if result.status_code != 200:
-            err = "An error occurred during request: status {0}"
-            raise Exception(err.format(result.status_code))
+        data = self._get_json('/reverseLatLngGeocoding2', params,
+                              key=self._normalize_coords(latitude, longitude))
         if output_type == 'stdout':
-            pprint(result.json())
+            pprint(data)
         elif output_type == 'csv':
-            data = result.json()['Table1']
-            results = [MarResult(address) for address in data]
+            table = data['Table1']
+            results = [MarResult(address) for address in table]
             self.result_to_csv(FIELDS, results, output_file)
-        return result.json()
+        return data
 
     def reverse_address_id(self, aid, output_type=None, output_file=None):
         """
@@ -213,14 +274,11 @@ class MarApiConn(BaseApiConn):
             'f': 'json',
             'AID': aid,
         }
-        result = self.get('/findAID2', params=params)
-        if result.status_code != 200:
-            err = "An error occurred during request: status {0}"
-            raise Exception(err.format(result.status_code))
+        data = self._get_json('/findAID2', params, key=str(aid).strip())
         if output_type == 'stdout':
-            pprint(result.json())
+            pprint(data)
         elif output_type == 'csv':
-            data = result.json()['Table1']
-            results = [MarResult(address) for address in data]
+            table = data['Table1']
+            results = [MarResult(address) for address in table]
             self.result_to_csv(FIELDS, results, output_file)
-        return result.json()
+        return data
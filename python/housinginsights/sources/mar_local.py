@@ -0,0 +1,239 @@
+"""
+Offline replacement for the MAR lookups in MarApiConn, answered from the
+'mar' extract downloaded by OpenDataApiConn (data/raw/apis/<date>/mar.csv).
+
+The file is read once into column lists, with a grid index on
+LATITUDE/LONGITUDE and XCOORD/YCOORD and hash indexes on ADDRESS_ID and
+FULLADDRESS. Results are returned in the same json shapes as the
+citizenatlas api so the two can be used interchangeably.
+"""
+
+from array import array
+from csv import DictReader
+import logging
+import os
+
+from housinginsights.sources.models.mar import FIELDS
+from housinginsights.tools.spatial import GridIndex, haversine, \
+    degree_extents, EARTH_RADIUS_METERS
+
+api_folder = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                          os.pardir, os.pardir, os.pardir,
+                                          'data', 'raw', 'apis'))
+
+INT_FIELDS = ['ADDRESS_ID', 'MARID']
+FLOAT_FIELDS = ['LATITUDE', 'LONGITUDE', 'XCOORD', 'YCOORD']
+
+
+def find_latest_mar_csv(folder=api_folder):
+    """
+    Returns the path of mar.csv in the most recent timestamp subfolder of
+    the api data folder, or None if it hasn't been downloaded.
+    """
+    try:
+        subfolders = sorted(os.listdir(folder), reverse=True)
+    except OSError:
+        return None
+    for subfolder in subfolders:
+        path = os.path.join(folder, subfolder, 'mar.csv')
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _normalize_address(address):
+    return ' '.join(str(address).upper().split())
+
+
+class LocalMarConn(object):
+    """
+    In-memory MAR lookups. Use public methods to retrieve data; they mirror
+    MarApiConn so this can be used wherever a MarApiConn is.
+
+    If a fallback connection (e.g. MarApiConn) is given, lookups that find
+    nothing locally are passed on to it.
+    """
+
+    # reverse geocoding searches this far and returns this many results, to
+    # match the behavior of the api
+    SEARCH_RADIUS_METERS = 200
+    RESULT_LIMIT = 5
+
+    def __init__(self, path=None, fields=FIELDS, fallback=None):
+        """
+        :param path: path of the mar.csv extract, defaults to the most
+        recently downloaded one.
+        :type path: str
+
+        :param fields: the MAR columns to keep in memory.
+        :type fields: list
+
+        :param fallback: optional connection used when nothing is found.
+        :type fallback: MarApiConn
+        """
+        self.path = find_latest_mar_csv() if path is None else path
+        if self.path is None:
+            raise FileNotFoundError("No mar.csv found in {}".format(api_folder))
+        self.fallback = fallback
+
+        self._columns = {}
+        self._by_address_id = {}
+        self._by_address = {}
+        self._latlng_index = GridIndex(cell_size=0.002)  # degrees, ~200m
+        self._xy_index = GridIndex(cell_size=self.SEARCH_RADIUS_METERS)
+        self._load(fields)
+
+    def _load(self, fields):
+        logging.info("  Loading MAR extract from {}".format(self.path))
+        with open(self.path, 'r', newline='', encoding='utf-8-sig') as f:
+            reader = DictReader(f)
+            self.fields = [field for field in fields
+                           if field in reader.fieldnames]
+            text_fields = [field for field in self.fields
+                           if field not in INT_FIELDS + FLOAT_FIELDS]
+
+            for field in self.fields:
+                self._columns[field] = array('d') if field in FLOAT_FIELDS \
+                    else []
+            # many columns (ward, anc, city...) repeat a handful of values, so
+            # share one string object per distinct value
+            interned = {field: {} for field in text_fields}
+
+            self._length = 0
+            for idx, row in enumerate(reader):
+                for field in self.fields:
+                    value = row[field]
+                    if field in FLOAT_FIELDS:
+                        value = float(value) if value else float('nan')
+                    elif field in INT_FIELDS:
+                        value = int(float(value)) if value else None
+                    else:
+                        value = interned[field].setdefault(value, value) \
+                            if value else None
+                    self._columns[field].append(value)
+                self._index_row(idx)
+                self._length += 1
+
+        logging.info("  Loaded {} MAR addresses".format(self._length))
+
+    def _index_row(self, idx):
+        columns = self._columns
+        if 'ADDRESS_ID' in columns and columns['ADDRESS_ID'][idx] is not None:
+            self._by_address_id[columns['ADDRESS_ID'][idx]] = idx
+        if 'FULLADDRESS' in columns and columns['FULLADDRESS'][idx] is not None:
+            key = _normalize_address(columns['FULLADDRESS'][idx])
+            self._by_address.setdefault(key, []).append(idx)
+
+        if 'LATITUDE' in columns and 'LONGITUDE' in columns:
+            lat = columns['LATITUDE'][idx]
+            lon = columns['LONGITUDE'][idx]
+            if lat == lat and lon == lon:  # skip NaN
+                self._latlng_index.insert(lon, lat, idx)
+        if 'XCOORD' in columns and 'YCOORD' in columns:
+            x = columns['XCOORD'][idx]
+            y = columns['YCOORD'][idx]
+            if x == x and y == y:
+                self._xy_index.insert(x, y, idx)
+
+    def __len__(self):
+        return self._length
+
+    def _record(self, idx, distance=None):
+        """
+        Returns the row at idx as a dict keyed like the api results.
+        """
+        record = {}
+        for field in self.fields:
+            value = self._columns[field][idx]
+            if field in FLOAT_FIELDS and value != value:
+                value = None
+            record[field] = value
+        if distance is not None:
+            record['distance'] = round(distance, 2)
+        return record
+
+    def _nearest(self, index, distance_fn, extents):
+        matches = []
+        for idx in index.candidates(*extents):
+            distance = distance_fn(idx)
+            if distance <= self.SEARCH_RADIUS_METERS:
+                matches.append((distance, idx))
+        matches.sort()
+        return [self._record(idx, distance)
+                for distance, idx in matches[:self.RESULT_LIMIT]]
+
+    def reverse_lat_lng_geocode(self, latitude, longitude, output_type=None,
+                                output_file=None):
+        """
+        Returns the nearest five MAR addresses within 200 meters of the
+        given latitude and longitude, in the format of
+        MarApiConn.reverse_lat_lng_geocode.
+        """
+        lat = float(latitude)
+        lon = float(longitude)
+        lats = self._columns['LATITUDE']
+        lons = self._columns['LONGITUDE']
+        lon_extent, lat_extent = degree_extents(lat, self.SEARCH_RADIUS_METERS,
+                                                radius=EARTH_RADIUS_METERS)
+
+        table = self._nearest(
+            self._latlng_index,
+            lambda idx: haversine(lat, lon, lats[idx], lons[idx],
+                                  radius=EARTH_RADIUS_METERS),
+            (lon, lat, lon_extent, lat_extent))
+        if not table and self.fallback is not None:
+            return self.fallback.reverse_lat_lng_geocode(
+                latitude, longitude, output_type, output_file)
+        return {'Table1': table}
+
+    def reverse_geocode(self, xcoord, ycoord, output_type=None,
+                        output_file=None):
+        """
+        Returns the nearest five MAR addresses within 200 meters of the
+        given Maryland State Plane coordinates, in the format of
+        MarApiConn.reverse_geocode.
+        """
+        x = float(xcoord)
+        y = float(ycoord)
+        xs = self._columns['XCOORD']
+        ys = self._columns['YCOORD']
+
+        table = self._nearest(
+            self._xy_index,
+            lambda idx: ((xs[idx] - x) ** 2 + (ys[idx] - y) ** 2) ** 0.5,
+            (x, y, self.SEARCH_RADIUS_METERS))
+        if not table and self.fallback is not None:
+            return self.fallback.reverse_geocode(xcoord, ycoord, output_type,
+                                                 output_file)
+        return {'Table1': table}
+
+    def reverse_address_id(self, aid, output_type=None, output_file=None):
+        """
+        Returns the MAR record for the address id, in the format of
+        MarApiConn.reverse_address_id.
+        """
+        try:
+            idx = self._by_address_id.get(int(float(aid)))
+        except ValueError:
+            idx = None
+        if idx is None:
+            if self.fallback is not None:
+                return self.fallback.reverse_address_id(aid, output_type,
+                                                        output_file)
+            return {'returnDataset': {}}
+        return {'returnDataset': {'Table1': [self._record(idx)]}}
+
+    def find_location(self, location, output_type=None, output_file=None):
+        """
+        Returns the MAR records whose full address exactly matches the
+        location, in the format of MarApiConn.find_location. Only exact
+        (case and whitespace insensitive) matches are found locally.
+        """
+        idxs = self._by_address.get(_normalize_address(location), [])
+        if not idxs:
+            if self.fallback is not None:
+                return self.fallback.find_location(location, output_type,
+                                                   output_file)
+            return {'returnCodes': None, 'returnDataset': None}
+        return {'returnDataset': {'Table1': [self._record(idx)
+                                             for idx in idxs]}}
@@ -64,6 +64,12 @@ class OpenDataApiConn(BaseApiConn):
                 #TODO Change this error type to a more specific one that should be handled by calling function inproduction
                 #We will want the calling function to continue with other data sources instead of erroring out. 
                 logging.info("  The unique_data_id '{}' is not supported by the OpenDataApiConn".format(u))
+            elif output_type == 'csv':
+                #Streamed to disk since some of these files (crime, tax) are large.
+                #Files that haven't changed since the last run are not written, so
+                #the manifest keeps pointing to the previous copy.
+                self.download_if_changed(u, self._urls[u], self.output_paths[u])
+
             else:
                 result = self.get(self._urls[u], params=None)
                 
@@ -76,9 +82,6 @@ class OpenDataApiConn(BaseApiConn):
 
                 if output_type == 'stdout':
                     print(content)
-
-                elif output_type == 'csv':
-                    self.directly_to_file(content, self.output_paths[u])
                 
                 #Can't yield content if we get multiple sources at once
                 if len(unique_data_ids) == 1:
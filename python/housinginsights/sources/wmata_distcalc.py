@@ -11,8 +11,24 @@ import traceback
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),os.pardir)))
 from housinginsights.sources.base import BaseApiConn
 import housinginsights.tools.dbtools as dbtools
+from housinginsights.tools.cache import PersistentCache, cache_folder
+from housinginsights.tools.ratelimit import RateLimiter
+from housinginsights.tools.spatial import GridIndex, haversine, \
+    degree_extents
 import sqlalchemy
 
+# walking distances from mapbox, keyed on the rounded coordinates of the
+# building and the stop - see WmataApiConn._distance_key
+WALKING_DISTANCE_CACHE_PATH = os.path.join(cache_folder,
+                                           'walking_distances.sqlite')
+# number of new distances to collect before writing them to the cache file
+WALKING_DISTANCE_BATCH_SIZE = 100
+# mapbox allows 60 walking directions requests per minute
+MAPBOX_REQUESTS_PER_SECOND = 1.0
+
+WMATA_RAIL_STATIONS_URL = "https://api.wmata.com/Rail.svc/json/jStations"
+WMATA_BUS_STOPS_URL = "https://api.wmata.com/Bus.svc/json/jStops"
+
 class WmataApiConn(BaseApiConn):
 
     def __init__(self, proxies=None, use_cached_distance=True):
@@ -34,6 +50,11 @@ class WmataApiConn(BaseApiConn):
                         "wmata_stops",
                         "wmata_dist"]
 
+        self._distance_cache = PersistentCache(WALKING_DISTANCE_CACHE_PATH)
+        self._distances = {}        # key: walking distance in meters
+        self._new_distances = {}    # not yet written to self._distance_cache
+        self._mapbox_limiter = RateLimiter(MAPBOX_REQUESTS_PER_SECOND, burst=1)
+
 
     def get_data(self,unique_data_ids=None, sample=False, output_type ='csv',db='local_database', **kwargs):
         if unique_data_ids == None:
@@ -84,22 +105,24 @@ class WmataApiConn(BaseApiConn):
             self.distHeader = ('nlihc_id','type','stop_id_or_station_code','dist_in_miles','crow_distance','building_lat','building_lon','stop_or_station_lat','stop_or_station_lon')
 
 
+            if self.use_cached_distance:
+                self._load_walking_distances(db=db)
+
             #First, find which projects we should be calculating from
             try:
                 #Configure the connection
                 engine = dbtools.get_database_engine(db)
-                conn = dbtools.get_database_connection(db)
+                conn = engine.connect()
                 logging.info("  Connected to Housing Insights database")
-                columnset = conn.execute('select column_name from INFORMATION_SCHEMA.COLUMNS where TABLE_NAME=\'project\'')
+                columnset = conn.execute('select column_name from INFORMATION_SCHEMA.COLUMNS where TABLE_NAME=\'project\'').fetchall()
 
                 #Get the rows
                 proj_query = 'select * from project'
                 if sample==True:
                     proj_query = proj_query + " limit 1"
-                rows = conn.execute(proj_query)
+                rows = conn.execute(proj_query).fetchall()
 
                 conn.close()
-                engine.dispose()
             except Exception as e:
                 logging.warning(e)
                 logging.warning("I am unable to connect to the database")
@@ -109,13 +132,14 @@ class WmataApiConn(BaseApiConn):
                 columns.append(c)
 
             numrow = 0
-            total_rows = rows.rowcount
+            total_rows = len(rows)
             logging.info("  Total rows: {}".format(total_rows))
 
-            #Get the rail stations once (no option to only get closest ones provided by wmata)
-            wmata_headers = self._get_wmata_headers()
-            railResponse = requests.get("https://api.wmata.com/Rail.svc/json/jStations", headers=wmata_headers)
-            self.railStations = railResponse.json()['Stations']
+            #Get all the rail stations and bus stops once and index them by
+            #location, instead of asking wmata for the stops near each project
+            self.railStations = self._get_wmata_json(WMATA_RAIL_STATIONS_URL, 'Stations')
+            self.busStops = self._get_wmata_json(WMATA_BUS_STOPS_URL, 'Stops')
+            stop_index = self._build_stop_index(self.railStations, self.busStops)
 
             #for every project, get nearby stations and walking distance
             for idx, row in enumerate(rows):
@@ -130,17 +154,20 @@ class WmataApiConn(BaseApiConn):
                     
                 if lat != None and lon != None:
                     logging.info("  Processing project {} of {}".format(numrow,total_rows))
+                    nearby = self._find_nearby_stops(stop_index, lat, lon, radius)
 
                     # find all metro stations within 0.5 miles
                     logging.info("  Starting processing rail stations for {}".format(project_details['nlihcid']))
-                    self._find_rail_stations(self.railStations,project_details,radius,sample=sample,db=db)
+                    self._find_rail_stations(nearby['rail'],project_details,radius,sample=sample,db=db)
                     logging.info("  Completed processing rail stations for project id {}".format(project_details['nlihcid']))
 
                     # find all bus stops within 0.5 miles
                     logging.info("  Starting processing bus stations for project id {}".format(project_details['nlihcid']))
-                    self._find_bus_stations(project_details, radius,sample=sample,db=db)
+                    self._find_bus_stations(nearby['bus'],project_details, radius,sample=sample,db=db)
                     logging.info("  Completed processing bus stations for project id {}".format(project_details['nlihcid']))
 
+            self._save_walking_distances()
+
             #Save the data
             if ( output_type == 'csv'):
                 self._array_to_csv(self.distHeader, self.distOutput, self.output_paths[u])
@@ -168,10 +195,7 @@ class WmataApiConn(BaseApiConn):
            """
         logging.info("Writing RAIL stops")
 
-        wmata_headers = self._get_wmata_headers()
-
-        railResponse = requests.get("https://api.wmata.com/Rail.svc/json/jStations", headers=wmata_headers)
-        railStations = railResponse.json()['Stations']
+        railStations = self._get_wmata_json(WMATA_RAIL_STATIONS_URL, 'Stations')
 
         for station in railStations:
             #delimit list of lines with colon
@@ -195,10 +219,7 @@ class WmataApiConn(BaseApiConn):
 
         logging.info("Writing BUS stops")
 
-        wmata_headers = self._get_wmata_headers()
-
-        response = requests.get('https://api.wmata.com/Bus.svc/json/jStops', headers=wmata_headers)
-        busStops = response.json()['Stops']
+        busStops = self._get_wmata_json(WMATA_BUS_STOPS_URL, 'Stops')
 
         for stop in busStops:
 
@@ -213,6 +234,24 @@ class WmataApiConn(BaseApiConn):
 
         return busStops
 
+    def _get_wmata_json(self, url, key):
+        """
+        Returns the <key> list of the json response of a wmata api url.
+        Raises an exception naming the url if wmata answers with an error
+        (e.g. 401 for a bad api key, 429 when over the rate limit) or
+        without the list, instead of failing later on a missing key.
+        """
+        response = requests.get(url, headers=self._get_wmata_headers())
+        if response.status_code != 200:
+            err = "An error occurred during request to {0}: status {1}: {2}"
+            raise Exception(err.format(url, response.status_code,
+                                       response.text[:200]))
+        try:
+            return response.json()[key]
+        except (ValueError, KeyError):
+            err = "The response from {0} has no '{1}': {2}"
+            raise Exception(err.format(url, key, response.text[:200]))
+
     def _get_meters(self,miles):
         self.miles = miles
         self.meters = miles*self.meters_per_mile
@@ -227,6 +266,63 @@ class WmataApiConn(BaseApiConn):
     def _set_mapbox_api_key(self, mapbox_api_key):
         self.mapbox_api_key = {'access_token':mapbox_api_key}
 
+    @staticmethod
+    def _distance_key(srcLat, srcLon, destLat, destLon):
+        """
+        Returns the walking distance cache key for a pair of locations. The
+        coordinates are rounded to 6 decimal places (about 10cm) so that
+        values read back from csv files or the database still match.
+        """
+        return '{:.6f},{:.6f};{:.6f},{:.6f}'.format(
+            float(srcLat), float(srcLon), float(destLat), float(destLon))
+
+    def _load_walking_distances(self, db='local_database'):
+        """
+        Loads every known walking distance from the walking distance cache
+        file into memory. The first time, when the cache is still empty, it
+        is seeded with the distances in the current wmata_dist table (which
+        were calculated before the cache existed).
+        """
+        self._distances = self._distance_cache.items()
+        logging.info("  Loaded {} cached walking distances".format(
+            len(self._distances)))
+        if self._distances:
+            return
+
+        try:
+            engine = dbtools.get_database_engine(db)
+            conn = engine.connect()
+            columnset = conn.execute('select column_name from INFORMATION_SCHEMA.COLUMNS where TABLE_NAME=\'wmata_dist\'')
+            columns = [c[0] for c in columnset]
+
+            if ( 'building_lat' in columns and 'building_lon' in columns and 'stop_or_station_lat' in columns and 'stop_or_station_lon' in columns ):
+                proxy = conn.execute('select building_lat, building_lon, stop_or_station_lat, stop_or_station_lon, dist_in_miles from wmata_dist')
+                for x in proxy.fetchall():
+                    try:
+                        key = self._distance_key(x[0], x[1], x[2], x[3])
+                        meters = float(x[4])*self.meters_per_mile
+                    except (TypeError, ValueError):
+                        continue
+                    if key not in self._distances:
+                        self._distances[key] = meters
+                        self._new_distances[key] = meters
+            else:
+                logging.info("Couldn't find all columns")
+            conn.close()
+        except Exception as e:
+            logging.warning(e)
+            logging.warning("I am unable to read walking distances from the database")
+
+        self._save_walking_distances()
+
+    def _save_walking_distances(self):
+        """
+        Writes the walking distances found since the last save to the cache.
+        """
+        if self._new_distances:
+            self._distance_cache.set_many(self._new_distances)
+            self._new_distances = {}
+
     def _get_walking_distance(self, srcLat, srcLon, destLat, destLon,db='local_database'):
         """Returns the walking distance in meters between two locations
 
@@ -238,60 +334,32 @@ class WmataApiConn(BaseApiConn):
            mapbox_api_key - api key for mapbox REST services
            """
 
-        if self.use_cached_distance == True:
-            try:
-                #Configure the connection
-                engine = dbtools.get_database_engine(db)
-                conn = dbtools.get_database_connection(db)
-
-                #Pull columns to see if the database has updated columns in wmata_dist
-                columnset = conn.execute('select column_name from INFORMATION_SCHEMA.COLUMNS where TABLE_NAME=\'wmata_dist\'')
-                columns = []
-                for c in columnset:
-                    columns.append(c[0])
-
-                if ( 'building_lat' in columns and 'building_lon' in columns and 'stop_or_station_lat' in columns and 'stop_or_station_lon' in columns ):
-                #See if row exists
-                    proj_query = 'select * from wmata_dist where building_lat=\'' + str(srcLat) + '\' and building_lon=\'' + str(srcLon) + '\' and stop_or_station_lat=\''+ str(destLat) + '\' and stop_or_station_lon=\'' + str(destLon) + '\''
-                    proxy = conn.execute(proj_query)
-                    results = [dict(x) for x in proxy.fetchall()]
-
-                    if ( len(results) != 0 ):
-                        logging.info("  Found cached row!")
-                        walking_distance = results[0]['dist_in_miles']
-
-                        conn.close()
-                        engine.dispose()
-
-                        return float(walking_distance)*self.meters_per_mile
-                    else:
-                        logging.info("  Couldn't find cached row for {}".format(proj_query))
-                else:
-                    logging.info("Couldn't find all columns")
-
-                conn.close()
-                engine.dispose()
-            except Exception as e:
-                logging.warning(e)
-                traceback.print_exc(file=sys.stdout)
-                logging.warning("I am unable to connect to the database")
+        key = self._distance_key(srcLat, srcLon, destLat, destLon)
+        if self.use_cached_distance == True and key in self._distances:
+            return self._distances[key]
 
         distReqCoords = str(srcLon) + ',' + str(srcLat) + ';' + str(destLon) + ',' + str(destLat)
 
         mapbox_params = self.mapbox_api_key
 
         # according to documentation, this doesn't work in Python SDK so switched to using REST API
+        self._mapbox_limiter.acquire()
         walkDistResponse = requests.get("https://api.mapbox.com/directions/v5/mapbox/walking/" + distReqCoords,params=mapbox_params)
-        time.sleep(0.8)
         i = 0
         while "Too Many Requests" in str(walkDistResponse.json()) and i < 10:
+            self._mapbox_limiter.acquire()
             walkDistResponse = requests.get("https://api.mapbox.com/directions/v5/mapbox/walking/" + distReqCoords,params=mapbox_params)
             i = i + 1
-            time.sleep(0.8)
             if i == 10:
                 raise Exception('This is some exception to be defined later')
-        print("Return value: " ,walkDistResponse.json()['routes'][0]['legs'][0]['distance'])
-        return walkDistResponse.json()['routes'][0]['legs'][0]['distance']
+        distance = walkDistResponse.json()['routes'][0]['legs'][0]['distance']
+        logging.debug("  Walking distance: {}".format(distance))
+
+        self._distances[key] = distance
+        self._new_distances[key] = distance
+        if len(self._new_distances) >= WALKING_DISTANCE_BATCH_SIZE:
+            self._save_walking_distances()
+        return distance
 
 
     def _get_project_info(self,project,columns):
@@ -305,90 +373,84 @@ class WmataApiConn(BaseApiConn):
                 project_info['nlihcid'] = project[columns.index(column_name)]
         return project_info
 
-    def _find_rail_stations(self, railStations,project_details,radiusinmeters,sample=False,db='local_database'):
-        """Finds all the rail stations within a given distance from a given project.  Writes to the given CSV file.
+    def _build_stop_index(self, railStations, busStops):
+        """
+        Returns a GridIndex of all the rail stations and bus stops by
+        longitude/latitude, holding ('rail', station) or ('bus', stop) items.
+        """
+        stop_index = GridIndex(cell_size=0.01) #degrees, roughly 0.7 miles
+        for station in railStations:
+            stop_index.insert(float(station['Lon']), float(station['Lat']), ('rail', station))
+        for stop in busStops:
+            stop_index.insert(float(stop['Lon']), float(stop['Lat']), ('bus', stop))
+        return stop_index
 
-        Parameters:
-        railStations - json object containing all the wmata rail station information. WMATA does not provide a 'search
-                within radius' method so we have to calculate walking distance for all stops.
+    def _find_nearby_stops(self, stop_index, lat, lon, radiusinmeters):
+        """
+        Returns the rail stations and bus stops within radiusinmeters as the
+        crow flies, as a dict of 'rail' and 'bus' lists of
+        (crow_distance_in_miles, station_or_stop). Only these need a walking
+        distance.
+        """
+        nearby = {'rail': [], 'bus': []}
+        lat = float(lat)
+        lon = float(lon)
+        lon_extent, lat_extent = degree_extents(
+            lat, radiusinmeters / self.meters_per_mile)
+        for typ, stop in stop_index.candidates(lon, lat, lon_extent, lat_extent):
+            crow_distance = haversine(lat, lon, stop['Lat'], stop['Lon'])
+            if crow_distance < (radiusinmeters / self.meters_per_mile):
+                nearby[typ].append((crow_distance, stop))
+        return nearby
+
+    def _find_rail_stations(self, nearbyStations,project_details,radiusinmeters,sample=False,db='local_database'):
+        """Calculates the walking distance to the rail stations near a given project, keeping those within the radius.
 
+        Parameters:
+        nearbyStations - list of (crow_distance, station) from _find_nearby_stops, where station is
+                the json of the wmata rail station information.
         project_details - dictionary containing lat, lon and nlihcid
         radiusinmeters - radius in meteres
-        distCsvWriter - csvWriter for distance
-        mapbox_api_key - api key for mapbox REST services
         """
 
         lat = project_details['lat']
         lon = project_details['lon']
         nlihc_id = project_details['nlihcid']
 
-        for idx, station in enumerate(railStations):
+        for crow_distance, station in nearbyStations:
             try:
-                crow_distance = self._haversine(lat, lon, station['Lat'], station['Lon'])
-
-                if crow_distance < (radiusinmeters / self.meters_per_mile):
-                    walkDist = self._get_walking_distance(lat, lon, str(station['Lat']), str(station['Lon']),db=db)
-                    walkDistMiles = walkDist / self.meters_per_mile
-                    logging.info("crow: {}. walking: {}".format(crow_distance,walkDistMiles))
-                    if walkDist <=radiusinmeters:
-                        self.distOutput.append([nlihc_id, 'rail', station['Code'], "{0:.2f}".format(walkDistMiles),crow_distance, lat,lon,str(station['Lat']),str(station['Lon'])])
-
-                else:
-                    logging.info("crow: {}. {} is not close enough to calculate walking distance. ".format(crow_distance,station['Code']))
-            
+                walkDist = self._get_walking_distance(lat, lon, str(station['Lat']), str(station['Lon']),db=db)
+                walkDistMiles = walkDist / self.meters_per_mile
+                logging.info("crow: {}. walking: {}".format(crow_distance,walkDistMiles))
+                if walkDist <=radiusinmeters:
+                    self.distOutput.append([nlihc_id, 'rail', station['Code'], "{0:.2f}".format(walkDistMiles),crow_distance, lat,lon,str(station['Lat']),str(station['Lon'])])
+
             except Exception as e:
                 #Main error encountered was 'Null' values for project lat/lon. Returning null value
                 logging.warning("Error calculating for {}".format(nlihc_id))
                 self.distOutput.append([nlihc_id, 'rail', station['Code'], "Null", "Null", lat,lon,str(station['Lat']),str(station['Lon'])])
 
-    def _haversine(self, lat1, lon1, lat2,lon2):
-        """
-        Calculate the great circle distance between two points
-        on the earth (specified in decimal degrees)
-        """
-        from math import radians, cos, sin, asin, sqrt
-
-        # convert decimal degrees to radians
-        original_coords = (lat1,lon1,lat2,lon2) #for debugging
-        lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-
-        # haversine formula
-        dlon = lon2 - lon1
-        dlat = lat2 - lat1
-        a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-        c = 2 * asin(sqrt(a))
-        r = 3956 # Radius of earth in miles
-        d = c * r
-        #print("Haversine for {} = {}".format(original_coords,d))
-        return c * r
-
+    def _find_bus_stations(self, nearbyStops, project_details,radiusinmeters,sample=False,db='local_database'):
+        """Calculates the walking distance to the bus stops near a given project, keeping those within the radius.
 
-    def _find_bus_stations(self, project_details,radiusinmeters,sample=False,db='local_database'):
+        Parameters:
+        nearbyStops - list of (crow_distance, stop) from _find_nearby_stops, where stop is
+                the json of the wmata bus stop information.
+        project_details - dictionary containing lat, lon and nlihcid
+        radiusinmeters - radius in meteres
+        """
         lat = project_details['lat']
         lon = project_details['lon']
         nlihc_id = project_details['nlihcid']
 
-        wmata_headers = self._get_wmata_headers()
-
-        params = {'Lat': lat,
-                  'Lon' : lon,
-                  'Radius':str(radiusinmeters)}
-        response = requests.get('https://api.wmata.com/Bus.svc/json/jStops', params=params, headers=wmata_headers)
-        data = response.json()
-
-        for idx, stop in enumerate(data['Stops']):
+        for crow_distance, stop in nearbyStops:
             try:
-                crow_distance = self._haversine(lat, lon, stop['Lat'], stop['Lon'])
-
-                if crow_distance < (radiusinmeters / self.meters_per_mile):
-                    walkDist = self._get_walking_distance(lat, lon, str(stop['Lat']), str(stop['Lon']),db=db)
-                    walkDistMiles = walkDist / self.meters_per_mile
-                    logging.info("crow: {}. walking: {}".format(crow_distance,walkDistMiles))
-                    if walkDist <= radiusinmeters: #within 0.5 miles walking
-                        self.distOutput.append([nlihc_id, 'bus', stop['StopID'], "{0:.2f}".format(walkDistMiles),crow_distance,lat,lon,str(stop['Lat']),str(stop['Lon'])])
+                walkDist = self._get_walking_distance(lat, lon, str(stop['Lat']), str(stop['Lon']),db=db)
+                walkDistMiles = walkDist / self.meters_per_mile
+                logging.info("crow: {}. walking: {}".format(crow_distance,walkDistMiles))
+                if walkDist <= radiusinmeters: #within 0.5 miles walking
+                    self.distOutput.append([nlihc_id, 'bus', stop['StopID'], "{0:.2f}".format(walkDistMiles),crow_distance,lat,lon,str(stop['Lat']),str(stop['Lon'])])
 
-                else:
-                    logging.info("crow: {}. {} is not close enough to calculate walking distance. ".format(crow_distance,station['Code']))
             except Exception as e:
                 #Main error encountered was 'Null' values for project lat/lon. Returning null value
                 logging.warning("Error calculating for {}".format(nlihc_id))
@@ -0,0 +1,184 @@
+##########################################################################
+# Summary
+##########################################################################
+'''
+Small persistent key/value cache backed by a SQLite file. Used to keep the
+results of slow lookups (e.g. MAR api calls) between runs of our scripts.
+'''
+
+##########################################################################
+# Imports & Configuration
+##########################################################################
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+cache_folder = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                            os.pardir, os.pardir, os.pardir,
+                                            'data', 'interim'))
+
+# number of hits to remember before writing their access times to the file
+ACCESS_FLUSH_SIZE = 100
+
+
+##########################################################################
+# Classes
+##########################################################################
+class PersistentCache(object):
+    """
+    Dictionary-like cache stored in a SQLite file. Values must be json
+    serializable.
+
+    Entries older than ttl seconds are treated as missing, and once the
+    cache holds more than max_entries the least recently used entries are
+    evicted. The file can be shared between processes; each process opens
+    its own connection on first use.
+
+    Hits don't write to the file: their access times are kept in memory
+    and written together with the next set, before an eviction, or once
+    ACCESS_FLUSH_SIZE of them have piled up. Access times that are never
+    flushed only make the least recently used order a little less exact.
+    """
+
+    def __init__(self, path, ttl=None, max_entries=None):
+        """
+        :param path: path of the SQLite file, created if missing
+        :type path: str
+
+        :param ttl: seconds an entry stays valid, None to never expire
+        :type ttl: int
+
+        :param max_entries: maximum number of entries to keep, None for no
+        limit
+        :type max_entries: int
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._writes_since_evict = 0
+        self._accessed = {}
+
+    def _connection(self):
+        # connections can't be shared with a forked child, so reopen if the
+        # process id changed since the connection was made
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)),
+                        exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30,
+                                         check_same_thread=False)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS cache ("
+                               "key TEXT PRIMARY KEY, value TEXT, "
+                               "created REAL, accessed REAL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed "
+                               "ON cache (accessed)")
+            self._conn.commit()
+            self._pid = os.getpid()
+        return self._conn
+
+    def _is_expired(self, created, now):
+        return self.ttl is not None and now - created > self.ttl
+
+    def get(self, key, default=None):
+        """
+        Returns the cached value for key, or default if it is missing or
+        has expired.
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT value, created FROM cache "
+                               "WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return default
+            if self._is_expired(row[1], now):
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                conn.commit()
+                return default
+            self._accessed[key] = now
+            if len(self._accessed) >= ACCESS_FLUSH_SIZE:
+                self._flush_accessed(conn)
+                conn.commit()
+        return json.loads(row[0])
+
+    def _flush_accessed(self, conn):
+        # writes the access times of the hits since the last flush, without
+        # committing so it can share the caller's transaction
+        if self._accessed:
+            conn.executemany("UPDATE cache SET accessed = ? WHERE key = ?",
+                             [(accessed, key) for key, accessed
+                              in self._accessed.items()])
+            self._accessed = {}
+
+    def set(self, key, value):
+        """
+        Stores value under key, replacing any existing entry.
+        """
+        self.set_many({key: value})
+
+    def set_many(self, items):
+        """
+        Stores every key, value pair of the items dict in one transaction.
+        """
+        now = time.time()
+        rows = [(key, json.dumps(value), now, now)
+                for key, value in items.items()]
+        with self._lock:
+            conn = self._connection()
+            self._flush_accessed(conn)
+            conn.executemany("INSERT OR REPLACE INTO cache "
+                             "(key, value, created, accessed) "
+                             "VALUES (?, ?, ?, ?)", rows)
+            conn.commit()
+            self._writes_since_evict += len(rows)
+            # counting rows on every write is wasteful for big caches, so
+            # only check the size limit every so often
+            if self.max_entries is not None and \
+                    self._writes_since_evict >= max(1, self.max_entries // 100):
+                self._evict(conn)
+                self._writes_since_evict = 0
+
+    def items(self):
+        """
+        Returns a dict of every unexpired entry in the cache.
+        """
+        now = time.time()
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT key, value, created FROM cache").fetchall()
+        return {key: json.loads(value) for key, value, created in rows
+                if not self._is_expired(created, now)}
+
+    def _evict(self, conn):
+        if self.ttl is not None:
+            conn.execute("DELETE FROM cache WHERE created < ?",
+                         (time.time() - self.ttl,))
+        count = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            logging.info("  evicting {} entries from {}".format(excess,
+                                                                self.path))
+            conn.execute("DELETE FROM cache WHERE key IN (SELECT key FROM "
+                         "cache ORDER BY accessed LIMIT ?)", (excess,))
+        conn.commit()
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM cache")
+            conn.commit()
+            self._accessed = {}
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._connection().execute(
+                "SELECT COUNT(*) FROM cache").fetchone()[0]
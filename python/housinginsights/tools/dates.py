@@ -0,0 +1,119 @@
+##########################################################################
+# Summary
+##########################################################################
+'''
+Fast date parsing for columns that hold the same date format on every row.
+
+dateutil can read almost anything but is slow, and our large tables (crime,
+building_permits) have a date in every row. DateParser works out which
+fixed strptime format a column uses from its first values, parses with that
+format, only falls back to dateutil for values that don't fit it, and
+remembers the results for repeated raw strings.
+'''
+
+##########################################################################
+# Imports & Configuration
+##########################################################################
+from datetime import datetime
+from functools import lru_cache
+
+import dateutil.parser as dateparser
+
+# Formats tried when inferring the format of a column, in order. Only
+# month-first formats are listed so the results match
+# dateparser.parse(value, dayfirst=False, yearfirst=False).
+DATE_FORMATS = [
+    '%Y-%m-%d',
+    '%Y-%m-%dT%H:%M:%S.%fZ',
+    '%Y-%m-%dT%H:%M:%SZ',
+    '%Y-%m-%dT%H:%M:%S',
+    '%Y-%m-%dT%H:%M:%S%z',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d %H:%M:%S.%f',
+    '%m/%d/%Y',
+    '%m/%d/%Y %H:%M',
+    '%m/%d/%Y %H:%M:%S',
+    '%m/%d/%Y %I:%M:%S %p',
+    '%m-%d-%Y',
+    '%Y/%m/%d',
+    '%Y/%m/%d %H:%M:%S',
+    '%Y%m%d'
+]
+
+
+##########################################################################
+# Classes
+##########################################################################
+class DateParser(object):
+    """
+    Parses the values of one date column. Use one instance per column, since
+    the format is inferred from the values it is given.
+
+    The first sample_size values narrow down the list of candidate formats
+    to the ones that parse all of them; after that only the first remaining
+    format is tried before falling back to dateutil.
+    """
+
+    def __init__(self, formats=DATE_FORMATS, sample_size=20, cache_size=4096):
+        """
+        :param formats: candidate strptime formats, in order of preference
+        :type formats: list
+
+        :param sample_size: number of values used to infer the format
+        :type sample_size: int
+
+        :param cache_size: number of distinct raw strings to remember, None
+        for no limit
+        :type cache_size: int
+        """
+        self._candidates = list(formats)
+        self._samples_left = sample_size
+        self.format = self._candidates[0] if self._candidates else None
+        self.fallback_count = 0
+        self._parse = lru_cache(maxsize=cache_size)(self._parse_uncached)
+
+    def _sample(self, value):
+        remaining = []
+        for fmt in self._candidates:
+            try:
+                datetime.strptime(value, fmt)
+                remaining.append(fmt)
+            except ValueError:
+                pass
+        # an odd value that matches none of the formats shouldn't throw away
+        # the ones that fit everything else
+        if remaining:
+            self._candidates = remaining
+            self.format = remaining[0]
+        self._samples_left -= 1
+
+    def _parse_uncached(self, value):
+        if not isinstance(value, str):
+            raise TypeError("Expected a date string, got {!r}".format(value))
+        value = value.strip()
+        if self._samples_left > 0:
+            self._sample(value)
+        if self.format is not None:
+            try:
+                return datetime.strptime(value, self.format)
+            except ValueError:
+                pass
+        self.fallback_count += 1
+        return dateparser.parse(value, dayfirst=False, yearfirst=False)
+
+    def parse(self, value):
+        """
+        Returns value as a datetime. Raises ValueError (or TypeError for
+        non-strings) if it can't be read as a date.
+        """
+        return self._parse(value)
+
+    def format_date(self, value, output_format='%Y-%m-%d'):
+        """
+        Returns value reformatted with output_format, by default the
+        YYYY-MM-DD format expected by the database.
+        """
+        return datetime.strftime(self._parse(value), output_format)
+
+    def cache_info(self):
+        return self._parse.cache_info()
@@ -15,22 +15,42 @@ import csv
 import json
 import os
 import logging
+import threading
 import time
 #import docker
 
 secrets_filepath = os.path.join(os.path.dirname(__file__), '../secrets.json')
 
+# Default connection pool settings. Any of these can be overridden per
+# database in secrets.json, e.g. "docker_database": {"connect_str": ...,
+# "pool_size": 10}, or by passing them to get_database_engine.
+POOL_OPTIONS = {
+    'pool_size': 5,         # connections kept open
+    'max_overflow': 10,     # extra connections allowed when all are in use
+    'pool_timeout': 30,     # seconds to wait for a connection
+    'pool_recycle': 3600    # seconds before a connection is replaced
+}
+
+_engines = {}           # database_choice: engine, for this process only
+_engines_pid = None
+_inherited_engines = []
+_engines_lock = threading.Lock()
+
 
 ##########################################################################
 # Functions
 ##########################################################################
+def _get_database_secrets(database_choice):
+    with open(secrets_filepath) as fh:
+        secrets = json.load(fh)
+    return secrets[database_choice]
+
+
 def get_connect_str(database_choice):
     """
     Loads the secrets json file to retrieve the connection string
     """
-    with open(secrets_filepath) as fh:
-        secrets = json.load(fh)
-    return secrets[database_choice]['connect_str']
+    return _get_database_secrets(database_choice)['connect_str']
 
 
 def get_database_connection(database_choice):
@@ -41,12 +61,24 @@ def get_database_connection(database_choice):
     '''
 
     # Connect to the database
-    connection_string = get_connect_str(database_choice)
-    engine = create_engine(connection_string)
+    engine = get_database_engine(database_choice)
     database_connection = engine.connect()
     return database_connection
 
-def get_database_engine(database_choice):
+def _check_process():
+    '''
+    Pooled connections can't be shared with a forked worker process. If this
+    is a new process, start a fresh set of engines. The parent's engines are
+    kept referenced but never used or disposed here - closing their
+    connections from the child would close them for the parent too.
+    '''
+    global _engines_pid
+    if _engines_pid != os.getpid():
+        _inherited_engines.extend(_engines.values())
+        _engines.clear()
+        _engines_pid = os.getpid()
+
+def get_database_engine(database_choice, **pool_options):
     '''
     engines are the way to connect to the database. 
 
@@ -56,12 +88,27 @@ def get_database_engine(database_choice):
     conn = engine.connect()
     conn.execute('SELECT * from manifest')
     conn.close()
+
+    The engine for each database_choice is created once per process and
+    shared, so connections come from its pool instead of being set up each
+    time. Don't dispose of it when you are done; just close the connections.
+    pool_options (see POOL_OPTIONS) only apply when the engine is created.
     '''
-    
-    # Connect to the database
-    connection_string = get_connect_str(database_choice)
+    with _engines_lock:
+        _check_process()
+        engine = _engines.get(database_choice)
+    if engine is not None:
+        return engine
+
+    # Connect to the database. This is done without holding the lock so a
+    # slow or failing connection doesn't hold up threads using other engines
+    database_secrets = _get_database_secrets(database_choice)
+    connection_string = database_secrets['connect_str']
+    options = {key: database_secrets.get(key, value)
+               for key, value in POOL_OPTIONS.items()}
+    options.update(pool_options)
     try:
-        engine = create_engine(connection_string)
+        engine = create_engine(connection_string, **options)
 
         #test out the engine to make sure it is valid
         conn = engine.connect()
@@ -73,18 +120,59 @@ def get_database_engine(database_choice):
         time.sleep(5)
         raise e
 
+    with _engines_lock:
+        _check_process()
+        existing = _engines.get(database_choice)
+        if existing is None:
+            _engines[database_choice] = engine
+    if existing is not None:
+        # another thread created one first; share it and drop ours
+        engine.dispose()
+        return existing
     return engine
+
+def get_pool_status(database_choice=None):
+    '''
+    Returns connection pool metrics for the engines created in this process,
+    as a dict of database_choice: {'size', 'checked_in', 'checked_out',
+    'overflow'}, or just the metrics of the given database_choice.
+    '''
+    with _engines_lock:
+        _check_process()
+        engines = dict(_engines)
+
+    status = {}
+    for choice, engine in engines.items():
+        pool = engine.pool
+        status[choice] = {
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': pool.overflow()
+        }
+    if database_choice is not None:
+        return status.get(database_choice)
+    return status
+
+def dispose_engines():
+    '''
+    Closes all pooled connections of this process's engines, e.g. before
+    dropping the database.
+    '''
+    with _engines_lock:
+        _check_process()
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
     
 def get_database_session(database_choice):
     # Connect to the database
-    connection_string = get_connect_str(database_choice)
-    engine = create_engine(connection_string)
+    engine = get_database_engine(database_choice)
     Session = sessionmaker(bind=engine)
     session = Session()
     return session
 
 def get_psycopg2_cursor(database_choice):
-    connection_string = get_connect_str(database_choice)
-    engine = create_engine(connection_string)
+    engine = get_database_engine(database_choice)
     cursor = engine.raw_connection().cursor()
     return cursor
@@ -0,0 +1,127 @@
+##########################################################################
+# Summary
+##########################################################################
+'''
+Reference data about DC geography shared by the cleaners: the census tract
+crosswalk, the set of DC census tracts, and the standard ward and
+neighborhood cluster names.
+
+The crosswalk is read the first time it is needed and then kept for the
+life of the process. A pickled copy is saved in data/interim so later runs
+can skip parsing the csv; it is rebuilt whenever the csv changes.
+'''
+
+##########################################################################
+# Imports & Configuration
+##########################################################################
+from csv import DictReader
+import logging
+import os
+import pickle
+import threading
+from types import MappingProxyType
+
+from housinginsights.tools.cache import cache_folder
+
+CROSSWALK_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                              os.pardir, 'config',
+                                              'crosswalks',
+                                              'DC_census_tract_crosswalk.csv'))
+PICKLE_PATH = os.path.join(cache_folder, 'geography.pickle')
+
+_lock = threading.Lock()
+_reference = None
+
+
+##########################################################################
+# Functions
+##########################################################################
+def _source_stamp(path):
+    stat = os.stat(path)
+    return (stat.st_mtime, stat.st_size)
+
+
+def _read_crosswalk(path):
+    """
+    Flattens the crosswalk so that every potential name of a census tract
+    (e.g. '11001000100', '000100', '1', 'Tract 1') can be translated to its
+    standard format.
+    """
+    mapping = {}
+    tracts = set()
+    with open(path, 'r', newline='', encoding='latin-1') as f:
+        for row in DictReader(f):
+            tracts.add(row['census_tract'])
+            for value in row.values():
+                mapping[value] = row['census_tract']
+    return {'census_mapping': mapping, 'dc_tracts': tracts}
+
+
+def _load(path=CROSSWALK_PATH, pickle_path=PICKLE_PATH):
+    stamp = _source_stamp(path)
+    try:
+        with open(pickle_path, 'rb') as f:
+            cached = pickle.load(f)
+        if cached.get('stamp') == stamp and cached.get('path') == path:
+            return cached['data']
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError,
+            KeyError, TypeError):
+        pass
+
+    data = _read_crosswalk(path)
+    try:
+        os.makedirs(os.path.dirname(pickle_path), exist_ok=True)
+        temp_path = '{}.{}.tmp'.format(pickle_path, os.getpid())
+        with open(temp_path, 'wb') as f:
+            pickle.dump({'path': path, 'stamp': stamp, 'data': data}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, pickle_path)
+    except OSError as e:
+        logging.warning("  Unable to save {}: {}".format(pickle_path, e))
+    return data
+
+
+def _get_reference():
+    global _reference
+    if _reference is None:
+        with _lock:
+            if _reference is None:
+                data = _load()
+                _reference = {
+                    'census_mapping': MappingProxyType(data['census_mapping']),
+                    'dc_tracts': frozenset(data['dc_tracts'])
+                }
+    return _reference
+
+
+def census_tract_mapping():
+    """
+    Returns a read-only dict of every known name of a DC census tract to its
+    standard 11 digit format, e.g. 'Tract 1' -> '11001000100'.
+    """
+    return _get_reference()['census_mapping']
+
+
+def dc_census_tracts():
+    """
+    Returns the frozenset of DC census tracts in the standard 11 digit
+    format.
+    """
+    return _get_reference()['dc_tracts']
+
+
+def ward_name(ward):
+    """
+    Standardizes a ward to 'Ward #', e.g. '8' or 'WARD 8' -> 'Ward 8'.
+    """
+    ward = str(ward)
+    if ward.isnumeric():  # add text if only number
+        return "Ward " + ward
+    return ward.lower().capitalize()  # make sure text is 'Ward #'
+
+
+def cluster_name(cluster):
+    """
+    Standardizes a neighborhood cluster number to 'Cluster #'.
+    """
+    return 'Cluster ' + str(cluster)
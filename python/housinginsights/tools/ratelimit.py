@@ -0,0 +1,55 @@
+##########################################################################
+# Summary
+##########################################################################
+'''
+Rate limiting for code that calls external apis from several threads.
+'''
+
+##########################################################################
+# Imports & Configuration
+##########################################################################
+import threading
+import time
+
+
+##########################################################################
+# Classes
+##########################################################################
+class RateLimiter(object):
+    """
+    Token bucket shared by all the threads making calls to one service.
+    Each call to acquire() takes a token, waiting if necessary, so no more
+    than `rate` calls per second are made on average, with bursts of up to
+    `burst` calls.
+    """
+
+    def __init__(self, rate, burst=None):
+        """
+        :param rate: average number of calls allowed per second
+        :type rate: float
+
+        :param burst: number of calls that can be made back to back,
+        defaults to rate
+        :type burst: float
+        """
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Blocks until a call is allowed.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst,
+                               self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            # take the token now even if it isn't there yet; the debt makes
+            # later callers wait their turn behind this one
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
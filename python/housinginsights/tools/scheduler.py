@@ -0,0 +1,192 @@
+##########################################################################
+# Summary
+##########################################################################
+'''
+Runs the downloads of get_api_data.py concurrently.
+
+Each task is one unique_data_id (or one step of a source, like splitting the
+DC Housing file into project and subsidy files). Tasks run on a pool of
+threads as soon as the tasks they depend on have finished, with a cap on how
+many run at once against the same host so we don't hammer any one api.
+'''
+
+##########################################################################
+# Imports & Configuration
+##########################################################################
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import logging
+
+
+##########################################################################
+# Classes
+##########################################################################
+class DependencyError(Exception):
+    """
+    Recorded as the error of a task that was not run because a task it
+    depends on failed.
+    """
+    pass
+
+
+class DownloadScheduler(object):
+    """
+    Schedules named tasks on a thread pool, respecting dependencies between
+    tasks and a per-host concurrency cap.
+
+    Tasks are started in the order they were added whenever their
+    dependencies are done and their host has a free slot. A task whose
+    dependency failed is not run.
+    """
+
+    def __init__(self, max_workers=4, host_limits=None, default_host_limit=2):
+        """
+        :param max_workers: number of tasks run at the same time
+        :type max_workers: int
+
+        :param host_limits: maximum number of concurrent tasks per host,
+        e.g. {'api.census.gov': 4}
+        :type host_limits: dict
+
+        :param default_host_limit: limit for hosts not in host_limits
+        :type default_host_limit: int
+        """
+        self.max_workers = max_workers
+        self.host_limits = dict(host_limits or {})
+        self.default_host_limit = default_host_limit
+        self._tasks = OrderedDict()
+
+    def add(self, name, fn, host=None, depends_on=()):
+        """
+        Adds a task. fn is called with no arguments.
+
+        :param name: unique name of the task, usually the unique_data_id
+        :type name: str
+
+        :param fn: the function to run
+        :type fn: callable
+
+        :param host: the host the task downloads from, None for no cap
+        :type host: str
+
+        :param depends_on: names of the tasks that must succeed first
+        :type depends_on: list
+        """
+        if name in self._tasks:
+            raise ValueError("Task '{}' was already added".format(name))
+        self._tasks[name] = {'fn': fn, 'host': host,
+                             'depends_on': list(depends_on)}
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def _host_limit(self, host):
+        if host is None:
+            return None
+        return max(1, self.host_limits.get(host, self.default_host_limit))
+
+    def _check_graph(self):
+        """
+        Raises ValueError if a task depends on a task that wasn't added or
+        if the dependencies form a cycle.
+        """
+        for name, task in self._tasks.items():
+            for dependency in task['depends_on']:
+                if dependency not in self._tasks:
+                    raise ValueError("Task '{}' depends on unknown task '{}'"
+                                     .format(name, dependency))
+
+        done = set()
+        visiting = set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError("Dependency cycle through task '{}'"
+                                 .format(name))
+            visiting.add(name)
+            for dependency in self._tasks[name]['depends_on']:
+                visit(dependency)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self._tasks:
+            visit(name)
+
+    def run(self, stop_on_error=False):
+        """
+        Runs all the tasks and waits for them to finish.
+
+        :param stop_on_error: if True, no new tasks are started once one
+        fails, and the first error is raised after the running tasks finish
+        :type stop_on_error: bool
+
+        :return: dict of the name of every task that failed or was skipped
+        to its exception; empty if everything succeeded
+        """
+        self._check_graph()
+
+        pending = OrderedDict(self._tasks)
+        succeeded = set()
+        errors = OrderedDict()
+        running = {}                # future: name
+        host_counts = {}
+        first_error = None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                # skip anything downstream of a failure
+                for name in list(pending):
+                    failed = [d for d in pending[name]['depends_on']
+                              if d in errors]
+                    if failed:
+                        del pending[name]
+                        errors[name] = DependencyError(
+                            "Skipped because '{}' failed".format(failed[0]))
+                        logging.warning("  Skipping '{}': {}".format(
+                            name, errors[name]))
+
+                if first_error is None:
+                    for name in list(pending):
+                        if len(running) >= self.max_workers:
+                            break
+                        task = pending[name]
+                        if not all(d in succeeded
+                                   for d in task['depends_on']):
+                            continue
+                        host = task['host']
+                        limit = self._host_limit(host)
+                        if limit is not None and \
+                                host_counts.get(host, 0) >= limit:
+                            continue
+                        del pending[name]
+                        host_counts[host] = host_counts.get(host, 0) + 1
+                        logging.info("  Starting '{}'".format(name))
+                        running[executor.submit(task['fn'])] = name
+                elif not running:
+                    break
+
+                if not running:
+                    # everything left was skipped above
+                    continue
+
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    host = self._tasks[name]['host']
+                    host_counts[host] -= 1
+                    try:
+                        future.result()
+                        succeeded.add(name)
+                        logging.info("  Finished '{}'".format(name))
+                    except Exception as e:
+                        errors[name] = e
+                        logging.warning('  The request for "{0}" failed. '
+                                        'Error: {1}'.format(name, e))
+                        if stop_on_error and first_error is None:
+                            first_error = e
+
+        if first_error is not None:
+            raise first_error
+        return errors
@@ -0,0 +1,104 @@
+##########################################################################
+# Summary
+##########################################################################
+'''
+Helpers for fast nearby-point lookups: distance functions and a simple
+uniform grid index that can be used in all of the project folders.
+'''
+
+##########################################################################
+# Imports & Configuration
+##########################################################################
+from collections import defaultdict
+from math import radians, degrees, cos, sin, asin, sqrt, floor
+
+EARTH_RADIUS_MILES = 3956
+EARTH_RADIUS_METERS = 6371008.8
+# widens degree_extents a little so rounding never drops a point that
+# haversine puts right on the edge of the circle
+EXTENT_PADDING = 1e-9
+
+
+##########################################################################
+# Functions
+##########################################################################
+def haversine(lat1, lon1, lat2, lon2, radius=EARTH_RADIUS_MILES):
+    """
+    Calculate the great circle distance between two points on the earth
+    (specified in decimal degrees). By default the result is in miles; pass
+    radius=EARTH_RADIUS_METERS to get meters.
+    """
+    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
+
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
+    c = 2 * asin(sqrt(a))
+    return c * radius
+
+
+def degree_extents(latitude, distance, radius=EARTH_RADIUS_MILES):
+    """
+    Returns the (longitude, latitude) span in degrees of the smallest box
+    around a point at the given latitude that holds everything within
+    distance of it, as measured by haversine with the same radius. distance
+    is in the units of radius, so miles by default.
+    """
+    angle = distance / radius
+    lat_extent = degrees(angle) + EXTENT_PADDING
+    # the widest part of the circle is a little poleward of the point; cos
+    # is floored so the box stays finite near the poles
+    ratio = sin(angle) / max(cos(radians(latitude)), 1e-6)
+    lon_extent = 180.0 if ratio >= 1 else degrees(asin(ratio)) + EXTENT_PADDING
+    return lon_extent, lat_extent
+
+
+##########################################################################
+# Classes
+##########################################################################
+class GridIndex(object):
+    """
+    Buckets points into square cells so that the points near a location can
+    be found by only looking at the surrounding cells. Works for any planar
+    x/y coordinates (e.g. state plane meters, or lon/lat degrees over an
+    area as small as DC).
+    """
+
+    def __init__(self, cell_size):
+        """
+        :param cell_size: width of a grid cell in coordinate units. Queries
+        are cheapest when this is close to the typical search radius.
+        :type cell_size: float
+        """
+        self.cell_size = float(cell_size)
+        self._cells = defaultdict(list)
+        self._count = 0
+
+    def _cell(self, x, y):
+        return (int(floor(x / self.cell_size)), int(floor(y / self.cell_size)))
+
+    def insert(self, x, y, item):
+        """
+        Adds item at the x, y location.
+        """
+        self._cells[self._cell(x, y)].append(item)
+        self._count += 1
+
+    def candidates(self, x, y, x_extent, y_extent=None):
+        """
+        Yields every item in the cells overlapping the box of x_extent by
+        y_extent (defaults to x_extent) around x, y. Callers still need to
+        check the exact distance of each candidate.
+        """
+        if y_extent is None:
+            y_extent = x_extent
+        min_col, min_row = self._cell(x - x_extent, y - y_extent)
+        max_col, max_row = self._cell(x + x_extent, y + y_extent)
+        for col in range(min_col, max_col + 1):
+            for row in range(min_row, max_row + 1):
+                cell = self._cells.get((col, row))
+                if cell:
+                    yield from cell
+
+    def __len__(self):
+        return self._count
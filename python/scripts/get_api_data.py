@@ -27,20 +27,33 @@ logging.getLogger().addHandler(logging.StreamHandler())
 #TODO is this import necessary?
 from housinginsights.config.base import HousingInsightsConfig
 from housinginsights.ingestion.Manifest import Manifest
+from housinginsights.tools.scheduler import DownloadScheduler
 
+# Number of downloads run at the same time, overall and against any one host
+MAX_WORKERS = 6
+HOST_LIMITS = {
+    'opendata.arcgis.com': 4,
+    'api.census.gov': 4
+}
+DEFAULT_HOST_LIMIT = 2
 
-def get_multiple_api_sources(unique_data_ids = None,sample=False, output_type = 'csv', db=None, debug=False, module_list = None):
+
+def get_multiple_api_sources(unique_data_ids = None,sample=False, output_type = 'csv', db=None, debug=False, module_list = None, max_workers=MAX_WORKERS):
     '''
-    This method takes a list of unique_data_ids and calls the 'get_data' method on each ApiConn class in the /sources folder
+    This method takes a list of unique_data_ids and runs the downloads of each ApiConn class in the /sources folder
     By passing a list with one id, you can download (or test) just one API at a time. 
     Passing 'None' to unique_data_ids will run all get_data methods. 
 
+    The downloads of every class are split into tasks (see BaseApiConn.download_tasks) that are run
+    concurrently by a DownloadScheduler, at most HOST_LIMITS at a time against the same host.
+
     sample: when possible, download just a few lines (for faster testing)
     output_type: either 'csv' or 'stdout'
     db: the database choice, such as 'docker_database', as identified in the secrets.json. 
     debug: if True exceptions will be raised. if False, they will be printed but processing will continue. 
     module_list: in addition to the unique_data_ids (which are passed directly to the ApiConn.get_data() method), you can choose to 
                  only run listed modules. 
+    max_workers: number of downloads run at the same time. 
 
     '''
 
@@ -58,6 +71,10 @@ def get_multiple_api_sources(unique_data_ids = None,sample=False, output_type =
     if module_list is None:
         module_list = list(modules.keys())
 
+    scheduler = DownloadScheduler(max_workers=max_workers,
+                                  host_limits=HOST_LIMITS,
+                                  default_host_limit=DEFAULT_HOST_LIMIT)
+
     for m in module_list:
         try:
             module_name = API_FOLDER + '.' + m
@@ -67,10 +84,12 @@ def get_multiple_api_sources(unique_data_ids = None,sample=False, output_type =
             api_class = getattr(module, class_name)
 
             api_instance = api_class()
-            api_method = getattr(api_instance, 'get_data') #Every class should have a get_data method! 
 
-            #Get the data
-            api_method(unique_data_ids, sample, output_type, db=db)
+            #Every class should have a get_data method, which download_tasks splits up
+            tasks = api_instance.download_tasks(unique_data_ids, sample, output_type, db=db)
+            for name, fn, depends_on in tasks:
+                scheduler.add(name, fn, host=api_instance.host,
+                              depends_on=depends_on)
 
         except Exception as e:
             logging.warning('The request for "{0}" failed. Error: {1}'.format(m,e))
@@ -78,6 +97,9 @@ def get_multiple_api_sources(unique_data_ids = None,sample=False, output_type =
             if debug:
                 raise e
 
+    #Get the data
+    scheduler.run(stop_on_error=debug)
+
     # update the manifest
     manifest = Manifest(os.path.abspath(os.path.join(
         python_filepath, 'scripts', 'manifest.csv')))
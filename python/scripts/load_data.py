@@ -19,10 +19,6 @@ from housinginsights.ingestion.LoadData import LoadData, main
 # configuration: see /logs/example-logging.py for usage examples
 logging_path = os.path.abspath(os.path.join(PYTHON_PATH, "logs"))
 logging_filename = os.path.abspath(os.path.join(logging_path, "ingestion.log"))
-logging.basicConfig(filename=logging_filename, level=logging.INFO)
-
-# Pushes everything from the logger to the command line output as well.
-logging.getLogger().addHandler(logging.StreamHandler())
 
 
 ##########################
@@ -41,34 +37,61 @@ parser.add_argument('-s', '--sample', help='load with sample data',
 parser.add_argument('--update-only', nargs='+',
                     help='only update tables with these unique_data_id '
                          'values')
+parser.add_argument('--workers', type=int, default=1,
+                    help='number of processes used to clean data files in '
+                         'parallel')
+parser.add_argument('--stream', action='store_true',
+                    help='stream cleaned rows straight into the database '
+                         'instead of writing temp PSV files first; not '
+                         'supported with --workers')
+parser.add_argument('--local-mar', action='store_true',
+                    help='geocode from the downloaded mar.csv extract where '
+                         'possible instead of the MAR api; the extract has no '
+                         'project image or street view urls')
 parser.add_argument('--manual', help='Ignore all other arguments and use'
                     'what is hard coded here, for debugging/testing purposes',
                     action='store_true')
 
-arguments = parser.parse_args()
-
-
-#Normally you won't use this section - this is only for debugging/testing
-if arguments.manual:
-    print("Using manual settings")
-    #Initialization
-    scripts_path = os.path.abspath(os.path.join(PYTHON_PATH, 'scripts'))
-    meta_path = os.path.abspath(os.path.join(scripts_path, 'meta.json'))
-    manifest_path = os.path.abspath(os.path.join(scripts_path, 'manifest.csv'))
-    database_choice = 'docker_with_local_python'
-    keep_temp_files = True
-    drop_tables = True
-    loader = LoadData(database_choice=database_choice, meta_path=meta_path,
-                      manifest_path=manifest_path, keep_temp_files=keep_temp_files,
-                      drop_tables=drop_tables)
-
-    #Do stuff
-    api_folder_path = os.path.abspath(os.path.join(PYTHON_PATH, os.pardir, 'data/raw/apis'))
-    print(api_folder_path)
-
-    loader.make_manifest(api_folder_path)
-
-#typically we use the approach that is coded into LoadData.py
-else:
-    # Let the main method handle it
-    main(arguments)
\ No newline at end of file
+
+def parse_args(args=None):
+    arguments = parser.parse_args(args)
+    if arguments.stream and arguments.workers > 1:
+        parser.error('--stream can only be used with --workers 1')
+    return arguments
+
+
+def run(arguments):
+    #Normally you won't use this section - this is only for debugging/testing
+    if arguments.manual:
+        print("Using manual settings")
+        #Initialization
+        scripts_path = os.path.abspath(os.path.join(PYTHON_PATH, 'scripts'))
+        meta_path = os.path.abspath(os.path.join(scripts_path, 'meta.json'))
+        manifest_path = os.path.abspath(os.path.join(scripts_path, 'manifest.csv'))
+        database_choice = 'docker_with_local_python'
+        keep_temp_files = True
+        drop_tables = True
+        loader = LoadData(database_choice=database_choice, meta_path=meta_path,
+                          manifest_path=manifest_path, keep_temp_files=keep_temp_files,
+                          drop_tables=drop_tables, workers=arguments.workers,
+                          stream_load=arguments.stream,
+                          local_mar=arguments.local_mar)
+
+        #Do stuff
+        api_folder_path = os.path.abspath(os.path.join(PYTHON_PATH, os.pardir, 'data/raw/apis'))
+        print(api_folder_path)
+
+        loader.make_manifest(api_folder_path)
+
+    #typically we use the approach that is coded into LoadData.py
+    else:
+        # Let the main method handle it
+        main(arguments)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(filename=logging_filename, level=logging.INFO)
+    # Pushes everything from the logger to the command line output as well.
+    logging.getLogger().addHandler(logging.StreamHandler())
+
+    run(parse_args())
@@ -0,0 +1,96 @@
+import unittest
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+# setup some useful absolute paths
+
+PYTHON_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir))
+# add to python system path
+sys.path.append(PYTHON_PATH)
+
+from housinginsights.tools import cache as cache_module
+from housinginsights.tools.cache import PersistentCache
+
+
+class PersistentCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, 'test_cache.sqlite')
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_get_and_set(self):
+        cache = PersistentCache(self.path)
+        self.assertIsNone(cache.get('missing'))
+        cache.set('aid:68416', {'Table1': [{'ADDRESS_ID': 68416}]})
+        self.assertEqual(cache.get('aid:68416')['Table1'][0]['ADDRESS_ID'],
+                         68416)
+
+        # values persist for a new cache object using the same file
+        reopened = PersistentCache(self.path)
+        self.assertTrue('aid:68416' in reopened)
+        self.assertEqual(len(reopened), 1)
+
+    def test_ttl(self):
+        cache = PersistentCache(self.path, ttl=0.01)
+        cache.set('key', 'value')
+        time.sleep(0.05)
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual(cache.items(), {})
+
+    def test_max_entries_evicts_least_recently_used(self):
+        cache = PersistentCache(self.path, max_entries=3)
+        for key in ['a', 'b', 'c']:
+            cache.set(key, key)
+            time.sleep(0.01)
+        cache.get('a')
+        cache.set('d', 'd')
+
+        self.assertEqual(len(cache), 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'a')
+        self.assertEqual(cache.get('d'), 'd')
+
+    def accessed(self, key):
+        conn = sqlite3.connect(self.path)
+        try:
+            return conn.execute("SELECT accessed FROM cache WHERE key = ?",
+                                (key,)).fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_hits_dont_write(self):
+        cache = PersistentCache(self.path)
+        cache.set('a', 'a')
+        written = self.accessed('a')
+        conn = cache._connection()
+        changes = conn.total_changes
+        time.sleep(0.01)
+        for i in range(cache_module.ACCESS_FLUSH_SIZE - 1):
+            self.assertEqual(cache.get('a'), 'a')
+        self.assertEqual(conn.total_changes, changes)
+        self.assertEqual(self.accessed('a'), written)
+
+        # the access time is written with the next set
+        cache.set('b', 'b')
+        self.assertGreater(self.accessed('a'), written)
+
+    def test_hits_flushed_in_batches(self):
+        cache = PersistentCache(self.path)
+        keys = [str(i) for i in range(cache_module.ACCESS_FLUSH_SIZE)]
+        cache.set_many({key: key for key in keys})
+        written = self.accessed(keys[0])
+        time.sleep(0.01)
+        for key in keys:
+            cache.get(key)
+        self.assertGreater(self.accessed(keys[0]), written)
+        self.assertGreater(self.accessed(keys[-1]), written)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+import unittest
+from unittest import mock
+import os
+import sys
+import threading
+
+# setup some useful absolute paths
+
+PYTHON_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir))
+# add to python system path
+sys.path.append(PYTHON_PATH)
+
+from housinginsights.sources.cama import (CamaApiConn, MarApiConn_2,
+                                          ZoneUnitCounts)
+
+
+class ZoneUnitCountsTestCase(unittest.TestCase):
+    def setUp(self):
+        zones = {'anc': 'ANC 8A', 'census_tract': '007401',
+                 'neighborhood_cluster': 'Cluster 28', 'ward': 'Ward 8',
+                 'zip': '20020'}
+        self.zones_by_ssl = {
+            '5946||0072': zones,
+            '5946||0073': dict(zones, anc='ANC 8B'),
+            '0123|E|0045': {'Warning': 'No data'}
+        }
+
+    def test_count_units(self):
+        properties = [('5946||0072', 4, 6), ('5946||0072', 1, 2),
+                      ('5946||0073', 2, 0), ('0123|E|0045', 9, 9),
+                      ('9999||0001', 9, 9)]
+        counts = CamaApiConn.count_units(properties, self.zones_by_ssl)
+        anc = counts.rows('anc')
+        self.assertEqual([(row['zone'], row['housing_unit_count'],
+                           row['bedroom_unit_count']) for row in anc],
+                         [('ANC 8A', 5, 8), ('ANC 8B', 2, 0)])
+        self.assertEqual(counts.rows('ward')[0]['housing_unit_count'], 7)
+
+    def test_merge(self):
+        first = CamaApiConn.count_units([('5946||0072', 4, 6)],
+                                        self.zones_by_ssl)
+        second = CamaApiConn.count_units([('5946||0072', 1, 2),
+                                          ('5946||0073', 2, 0)],
+                                         self.zones_by_ssl)
+        merged = ZoneUnitCounts().merge(first).merge(second)
+        self.assertEqual(len(merged), 6)
+        zip_row = merged.rows('zip')[0]
+        self.assertEqual(list(zip_row.items()),
+                         [('zone_type', 'zip'), ('zone', '20020'),
+                          ('housing_unit_count', 7),
+                          ('bedroom_unit_count', 8)])
+
+
+class FakeResponse(object):
+    def __init__(self, data, status_code=200):
+        self.data = data
+        self.status_code = status_code
+
+    def json(self):
+        return self.data
+
+
+def mar_response(ward):
+    return FakeResponse({'returnDataset': {'Table1': [{
+        'ANC': 'ANC 8A', 'CENSUS_TRACT': '007401',
+        'CLUSTER_': 'Cluster 28', 'WARD': ward, 'ZIPCODE': '20020'}]}})
+
+
+class FakeMar(object):
+    """
+    Replaces MarApiConn_2.get; every SSL gets the zones in `wards`, and the
+    first `failures[square]` requests for a square fail.
+    """
+
+    def __init__(self, wards, failures=None):
+        self.wards = wards
+        self.failures = dict(failures or {})
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def get(self, urlpath, params=None, **kwargs):
+        square = params['Square']
+        with self._lock:
+            self.requests.append((square, params['Lot'], params['Suffix']))
+            if self.failures.get(square, 0) > 0:
+                self.failures[square] -= 1
+                return FakeResponse({}, status_code=503)
+        return mar_response(self.wards[square])
+
+
+class MarLookupTestCase(unittest.TestCase):
+    def setUp(self):
+        self.sleep = mock.patch('housinginsights.sources.cama.time.sleep')
+        self.sleeps = self.sleep.start()
+        self.addCleanup(self.sleep.stop)
+        self.cama = CamaApiConn(max_workers=4, requests_per_second=1000,
+                                retries=3)
+
+    def patch_mar(self, fake):
+        patcher = mock.patch.object(MarApiConn_2, 'get',
+                                    lambda api, *args, **kwargs:
+                                    fake.get(*args, **kwargs))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_retry_until_success(self):
+        fake = FakeMar({'5946': 'Ward 8'}, failures={'5946': 2})
+        self.patch_mar(fake)
+        zones = self.cama._lookup_zones(('5946', '0072', ' '))
+        self.assertEqual(zones['ward'], 'Ward 8')
+        self.assertEqual(len(fake.requests), 3)
+        self.assertEqual([c[0][0] for c in self.sleeps.call_args_list],
+                         [2, 4])
+
+    def test_retries_exhausted(self):
+        fake = FakeMar({'5946': 'Ward 8'}, failures={'5946': 3})
+        self.patch_mar(fake)
+        with self.assertRaisesRegex(Exception, 'status 503'):
+            self.cama._lookup_zones(('5946', '0072', ' '))
+        self.assertEqual(len(fake.requests), 3)
+        self.assertEqual(self.sleeps.call_count, 2)
+
+    def test_failed_keys_left_out(self):
+        fake = FakeMar({'5946': 'Ward 8', '0123': 'Ward 1'},
+                       failures={'0123': 3})
+        self.patch_mar(fake)
+        keys = [('5946', '0072', ' '), ('0123', '0045', 'E')]
+        zones = self.cama._lookup_all_zones(keys)
+        self.assertEqual(list(zones), [('5946', '0072', ' ')])
+
+    def test_each_ssl_looked_up_once(self):
+        fake = FakeMar({'5946': 'Ward 8', '0123': 'Ward 1'})
+        self.patch_mar(fake)
+
+        def feature(ssl, units, bedrooms):
+            return {'properties': {'SSL': ssl, 'AYB': 1950,
+                                   'NUM_UNITS': units, 'BEDRM': bedrooms}}
+        cama_data = {'features': [feature('5946    0072', 2, 3),
+                                  feature('5946    0072', 1, 1),
+                                  feature('59460072', 1, 2),
+                                  feature('0123E   0045', 4, 4)]}
+        with mock.patch.object(CamaApiConn, 'get',
+                               return_value=FakeResponse(cama_data)):
+            data = self.cama.get_data()
+
+        self.assertEqual(sorted(fake.requests),
+                         [('0123', '0045', 'E'), ('5946', '0072', ' ')])
+        wards = {row['zone']: (row['housing_unit_count'],
+                               row['bedroom_unit_count'])
+                 for row in data['ward']}
+        self.assertEqual(wards, {'Ward 8': (4, 6), 'Ward 1': (4, 4)})
+
+
+if __name__ == '__main__':
+    unittest.main()
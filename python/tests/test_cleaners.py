@@ -0,0 +1,50 @@
+import unittest
+import os
+import sys
+
+# setup some useful absolute paths
+
+PYTHON_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir))
+# add to python system path
+sys.path.append(PYTHON_PATH)
+
+from housinginsights.ingestion.Cleaners import BuildingPermitsCleaner
+
+
+class CleaningPlanTestCase(unittest.TestCase):
+    def setUp(self):
+        self.meta = {'building_permits': {'fields': [
+            {'source_name': 'ISSUE_DATE', 'sql_name': 'issue_date',
+             'type': 'date'},
+            {'source_name': 'WARD', 'sql_name': 'ward', 'type': 'text'},
+            {'source_name': 'NEIGHBORHOODCLUSTER',
+             'sql_name': 'neighborhood_cluster', 'type': 'text'},
+            {'source_name': 'DESC', 'sql_name': 'desc', 'type': 'text'}
+        ]}}
+        manifest_row = {'destination_table': 'building_permits'}
+        self.cleaner = BuildingPermitsCleaner(self.meta, manifest_row)
+
+    def test_plan(self):
+        plan = self.cleaner.plan
+        self.assertEqual(plan.date_fields, ('ISSUE_DATE',))
+        self.assertIs(plan.null_set(['', None]), plan.null_set(['', None]))
+        self.assertEqual(self.cleaner.convert_boolean('Y'), True)
+        self.assertEqual(self.cleaner.convert_boolean(''), 'Null')
+
+    def test_clean(self):
+        rows = [{'ISSUE_DATE': '2017-03-01T00:00:00.000Z', 'WARD': '8',
+                 'NEIGHBORHOODCLUSTER': '39', 'DESC': 'NONE'},
+                {'ISSUE_DATE': '', 'WARD': 'WARD 8',
+                 'NEIGHBORHOODCLUSTER': '', 'DESC': 'new\nroof'}]
+        first, second = [self.cleaner.clean(row) for row in rows]
+        self.assertEqual(first, {'ISSUE_DATE': '2017-03-01', 'WARD': 'Ward 8',
+                                 'NEIGHBORHOODCLUSTER': 'Cluster 39',
+                                 'DESC': 'Null'})
+        self.assertEqual(second['ISSUE_DATE'], 'Null')
+        self.assertEqual(second['WARD'], 'Ward 8')
+        self.assertEqual(second['NEIGHBORHOODCLUSTER'], 'Null')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+import os
+import sys
+import tempfile
+
+# setup some useful absolute paths
+
+PYTHON_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir))
+# add to python system path
+sys.path.append(PYTHON_PATH)
+
+from housinginsights.ingestion import DataReader, CSVWriter, CSVStream
+
+META = {
+    'crime': {
+        'cleaner': 'CrimeCleaner',
+        'fields': [
+            {'source_name': 'OBJECTID', 'sql_name': 'objectid',
+             'type': 'text', 'display_name': 'Object ID',
+             'display_text': ''},
+            {'source_name': 'unique_data_id', 'sql_name': 'unique_data_id',
+             'type': 'text', 'display_name': 'Unique data ID',
+             'display_text': ''}
+        ]
+    }
+}
+
+
+class ContentHashTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, 'crime_2017.csv')
+        self.write_data('OBJECTID\n1\n2\n')
+        self.manifest_row = {
+            'include_flag': 'use',
+            'destination_table': 'crime',
+            'unique_data_id': 'crime_2017',
+            'encoding': 'utf-8',
+            'local_folder': self.folder.name,
+            's3_folder': 'https://s3.amazonaws.com/housinginsights',
+            'filepath': 'crime_2017.csv'
+        }
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def write_data(self, data):
+        with open(self.path, 'w') as f:
+            f.write(data)
+
+    def reader(self, meta=META):
+        return DataReader(meta=meta, manifest_row=self.manifest_row,
+                          load_from='file')
+
+    def loaded_row(self, content_hash):
+        return {'status': 'loaded', 'content_hash': content_hash}
+
+    def test_unchanged_file_is_skipped(self):
+        content_hash = self.reader().content_hash()
+        reader = self.reader()
+        self.assertEqual(reader.content_hash(), content_hash)
+        self.assertTrue(reader.is_unchanged(self.loaded_row(content_hash)))
+        self.assertFalse(reader._check_include_flag(
+            self.loaded_row(content_hash)))
+
+    def test_changed_file_is_reloaded(self):
+        content_hash = self.reader().content_hash()
+        self.write_data('OBJECTID\n1\n2\n3\n')
+        reader = self.reader()
+        self.assertNotEqual(reader.content_hash(), content_hash)
+        self.assertFalse(reader.is_unchanged(self.loaded_row(content_hash)))
+        self.assertTrue(reader._check_include_flag(
+            self.loaded_row(content_hash)))
+
+    def test_changed_meta_is_reloaded(self):
+        content_hash = self.reader().content_hash()
+        meta = {'crime': dict(META['crime'], cleaner='GenericCleaner')}
+        self.assertNotEqual(self.reader(meta).content_hash(), content_hash)
+
+    def test_rows_loaded_without_hash(self):
+        reader = self.reader()
+        # loaded before hashes were recorded: skipped as before
+        self.assertFalse(reader.is_unchanged(self.loaded_row(None)))
+        self.assertFalse(reader._check_include_flag(self.loaded_row(None)))
+        self.assertTrue(reader._check_include_flag(
+            {'status': 'deleted', 'content_hash': None}))
+        self.assertTrue(reader._check_include_flag(None))
+
+
+class RowCountTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.manifest_row = {'destination_table': 'crime',
+                             'unique_data_id': 'crime_2017'}
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_row_counts(self):
+        rows = [{'OBJECTID': str(i)} for i in range(5)]
+
+        writer = CSVWriter(META, self.manifest_row, filename=os.path.join(
+            self.folder.name, 'temp_crime_2017.psv'))
+        for row in rows:
+            writer.write(dict(row))
+        writer.close()
+        self.assertEqual(writer.row_count, 5)
+
+        stream = CSVStream(META, self.manifest_row,
+                           rows=(dict(row) for row in rows))
+        while stream.read(10):
+            pass
+        self.assertEqual(stream.row_count, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
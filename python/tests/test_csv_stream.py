@@ -0,0 +1,124 @@
+import unittest
+import os
+import sys
+import tempfile
+
+# setup some useful absolute paths
+
+PYTHON_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir))
+# add to python system path
+sys.path.append(PYTHON_PATH)
+
+from housinginsights.ingestion import CSVWriter, CSVStream
+
+META = {
+    'crime': {
+        'cleaner': 'CrimeCleaner',
+        'fields': [
+            {'source_name': 'OBJECTID', 'sql_name': 'objectid',
+             'type': 'text', 'display_name': 'Object ID',
+             'display_text': ''},
+            {'source_name': 'OFFENSE', 'sql_name': 'offense',
+             'type': 'text', 'display_name': 'Offense', 'display_text': ''},
+            {'source_name': 'unique_data_id', 'sql_name': 'unique_data_id',
+             'type': 'text', 'display_name': 'Unique data ID',
+             'display_text': ''}
+        ]
+    }
+}
+
+MANIFEST_ROW = {'destination_table': 'crime', 'unique_data_id': 'crime_2017'}
+
+
+def crime_rows(count):
+    return [{'OBJECTID': str(i), 'OFFENSE': 'THEFT F/AUTO'}
+            for i in range(count)]
+
+
+class CSVStreamTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def expected(self, rows):
+        """
+        Returns what CSVWriter writes to disk for the rows.
+        """
+        filename = os.path.join(self.folder.name, 'temp_crime_2017.psv')
+        writer = CSVWriter(META, MANIFEST_ROW, filename=filename)
+        for row in rows:
+            writer.write(dict(row))
+        writer.close()
+        with open(filename, encoding='utf-8', newline='') as f:
+            return f.read()
+
+    def stream(self, rows, **kwargs):
+        return CSVStream(META, MANIFEST_ROW,
+                         rows=(dict(row) for row in rows), **kwargs)
+
+    def test_read_across_chunk_boundaries(self):
+        rows = crime_rows(50)
+        expected = self.expected(rows)
+        # sizes smaller, equal to and larger than a line
+        line_length = expected.index('\n') + 1
+        for size in [1, 7, line_length, line_length + 1, 8192]:
+            stream = self.stream(rows)
+            chunks = []
+            while True:
+                chunk = stream.read(size)
+                if not chunk:
+                    break
+                self.assertLessEqual(len(chunk), size)
+                chunks.append(chunk)
+            self.assertEqual(''.join(chunks), expected)
+            self.assertEqual(stream.row_count, 50)
+            self.assertEqual(stream.read(size), '')
+
+    def test_read_everything(self):
+        rows = crime_rows(5)
+        self.assertEqual(self.stream(rows).read(), self.expected(rows))
+        self.assertEqual(self.stream(rows).read(None), self.expected(rows))
+
+    def test_readline(self):
+        rows = crime_rows(20)
+        expected = self.expected(rows).splitlines(keepends=True)
+        stream = self.stream(rows)
+        # start mid-line so the following lines span several refills
+        first = stream.read(3)
+        lines = [first + stream.readline()]
+        while True:
+            line = stream.readline()
+            if not line:
+                break
+            lines.append(line)
+        self.assertEqual(lines, expected)
+        self.assertEqual(stream.row_count, 20)
+
+        stream = self.stream(rows)
+        self.assertEqual(stream.readline(4), expected[0][:4])
+        self.assertEqual(stream.readline(), expected[0][4:])
+
+    def test_empty(self):
+        stream = self.stream([])
+        self.assertEqual(stream.read(10), '')
+        self.assertEqual(stream.readline(), '')
+        self.assertEqual(stream.read(), '')
+        self.assertEqual(stream.row_count, 0)
+
+    def test_archive(self):
+        rows = crime_rows(10)
+        expected = self.expected(rows)
+        archive = os.path.join(self.folder.name, 'archive_crime_2017.psv')
+        stream = self.stream(rows, archive_filename=archive)
+        while stream.read(16):
+            pass
+        stream.close()
+        with open(archive, encoding='utf-8', newline='') as f:
+            self.assertEqual(f.read(), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+import os
+import sys
+
+# setup some useful absolute paths
+
+PYTHON_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir))
+# add to python system path
+sys.path.append(PYTHON_PATH)
+
+from housinginsights.tools.dates import DateParser
+
+
+class DateParserTestCase(unittest.TestCase):
+    def test_infers_format(self):
+        parser = DateParser(sample_size=3)
+        values = ['03/01/2017', '12/31/2016', '3/9/2017', '04/01/2017']
+        self.assertEqual([parser.format_date(value) for value in values],
+                         ['2017-03-01', '2016-12-31', '2017-03-09',
+                          '2017-04-01'])
+        self.assertEqual(parser.format, '%m/%d/%Y')
+        self.assertEqual(parser.fallback_count, 0)
+
+    def test_falls_back_for_outliers(self):
+        parser = DateParser(sample_size=2)
+        self.assertEqual(parser.format_date('2017-03-01T12:00:00.000Z'),
+                         '2017-03-01')
+        self.assertEqual(parser.format_date('2017-03-02T08:30:00.000Z'),
+                         '2017-03-02')
+        self.assertEqual(parser.format_date('March 3, 2017'), '2017-03-03')
+        self.assertEqual(parser.fallback_count, 1)
+        with self.assertRaises(ValueError):
+            parser.parse('not a date')
+
+    def test_memoizes(self):
+        parser = DateParser()
+        for _ in range(3):
+            parser.format_date('2017-03-01')
+        self.assertEqual(parser.cache_info().hits, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
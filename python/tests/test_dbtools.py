@@ -0,0 +1,92 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+from unittest import mock
+
+from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+
+# setup some useful absolute paths
+
+PYTHON_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir))
+# add to python system path
+sys.path.append(PYTHON_PATH)
+
+from housinginsights.tools import dbtools
+
+
+class EngineRegistryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        secrets_path = os.path.join(self.folder.name, 'secrets.json')
+        db_path = os.path.join(self.folder.name, 'test.db')
+        with open(secrets_path, 'w') as f:
+            json.dump({'test_database': {
+                'connect_str': 'sqlite:///{}'.format(db_path),
+                'pool_size': 2}}, f)
+        self._secrets_filepath = dbtools.secrets_filepath
+        dbtools.secrets_filepath = secrets_path
+
+    def tearDown(self):
+        dbtools.dispose_engines()
+        dbtools.secrets_filepath = self._secrets_filepath
+        self.folder.cleanup()
+
+    def test_engine_is_shared(self):
+        engine = dbtools.get_database_engine('test_database',
+                                             poolclass=QueuePool)
+        self.assertIs(dbtools.get_database_engine('test_database'), engine)
+
+        conn = engine.connect()
+        status = dbtools.get_pool_status('test_database')
+        self.assertEqual(status['size'], 2)
+        self.assertEqual(status['checked_out'], 1)
+        conn.close()
+        self.assertEqual(
+            dbtools.get_pool_status()['test_database']['checked_out'], 0)
+
+    def test_new_process_gets_new_engine(self):
+        engine = dbtools.get_database_engine('test_database',
+                                             poolclass=QueuePool)
+        # pretend this is a forked worker
+        dbtools._engines_pid = -1
+        child_engine = dbtools.get_database_engine('test_database',
+                                                   poolclass=QueuePool)
+        self.assertIsNot(child_engine, engine)
+        self.assertIn(engine, dbtools._inherited_engines)
+
+    def test_connects_without_lock(self):
+        def create(*args, **kwargs):
+            self.assertFalse(dbtools._engines_lock.locked())
+            return create_engine(*args, **kwargs)
+
+        with mock.patch.object(dbtools, 'create_engine', create):
+            engine = dbtools.get_database_engine('test_database',
+                                                 poolclass=QueuePool)
+        self.assertIs(dbtools._engines['test_database'], engine)
+
+    def test_concurrent_creation_shares_first_engine(self):
+        first = create_engine('sqlite://')
+        created = []
+
+        def create(*args, **kwargs):
+            # another thread finishes creating its engine while this one
+            # is still connecting
+            dbtools._engines['test_database'] = first
+            engine = create_engine(*args, **kwargs)
+            created.append(engine)
+            return engine
+
+        with mock.patch.object(dbtools, 'create_engine', create):
+            engine = dbtools.get_database_engine('test_database',
+                                                 poolclass=QueuePool)
+        self.assertIs(engine, first)
+        self.assertIs(dbtools.get_database_engine('test_database'), first)
+        self.assertEqual(len(created), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
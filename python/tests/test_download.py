@@ -0,0 +1,156 @@
+import unittest
+import hashlib
+import os
+import sys
+import tempfile
+
+# setup some useful absolute paths
+
+PYTHON_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir))
+# add to python system path
+sys.path.append(PYTHON_PATH)
+
+from housinginsights.sources import base
+from housinginsights.sources.base import BaseApiConn
+from housinginsights.tools.cache import PersistentCache
+
+DATA = b'id,name\n' + b''.join('{},row {}\n'.format(i, i).encode()
+                               for i in range(1000))
+
+
+class FakeResponse(object):
+    def __init__(self, content, status_code=200, fail_after=None,
+                 headers=None):
+        self.content = content
+        self.status_code = status_code
+        self.fail_after = fail_after
+        self.headers = headers or {}
+        self.closed = False
+
+    def iter_content(self, chunk_size=1):
+        for index, start in enumerate(range(0, len(self.content), 100)):
+            if self.fail_after is not None and index == self.fail_after:
+                raise IOError('connection reset')
+            yield self.content[start:start + 100]
+
+    def close(self):
+        self.closed = True
+
+
+class FakeApiConn(BaseApiConn):
+    def __init__(self, *responses):
+        super().__init__('http://example.com')
+        self.responses = list(responses)
+
+    def get(self, urlpath, params=None, **kwargs):
+        self.kwargs = kwargs
+        self.response = self.responses.pop(0)
+        return self.response
+
+
+class ConditionalDownloadTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self._metadata = base.download_metadata
+        base.download_metadata = PersistentCache(
+            os.path.join(self.folder.name, 'downloads.sqlite'))
+
+    def tearDown(self):
+        base.download_metadata = self._metadata
+        self.folder.cleanup()
+
+    def path(self, day):
+        return os.path.join(self.folder.name, day, 'crime_2013.csv')
+
+    def test_download(self):
+        conn = FakeApiConn(FakeResponse(DATA))
+        self.assertTrue(conn.download_if_changed('crime_2013', 'crime.csv',
+                                                 self.path('day1')))
+
+        self.assertTrue(conn.kwargs['stream'])
+        self.assertTrue(conn.response.closed)
+        with open(self.path('day1'), 'rb') as f:
+            self.assertEqual(f.read(), DATA)
+        self.assertEqual(base.download_metadata.get('crime_2013')['checksum'],
+                         hashlib.sha256(DATA).hexdigest())
+        self.assertEqual(os.listdir(os.path.dirname(self.path('day1'))),
+                         ['crime_2013.csv'])
+
+    def test_failed_download_keeps_old_file(self):
+        os.makedirs(os.path.dirname(self.path('day1')))
+        with open(self.path('day1'), 'wb') as f:
+            f.write(b'old')
+
+        conn = FakeApiConn(FakeResponse(DATA, fail_after=3))
+        with self.assertRaises(IOError):
+            conn.download_if_changed('crime_2013', 'crime.csv',
+                                     self.path('day1'))
+
+        with open(self.path('day1'), 'rb') as f:
+            self.assertEqual(f.read(), b'old')
+        self.assertEqual(os.listdir(os.path.dirname(self.path('day1'))),
+                         ['crime_2013.csv'])
+        self.assertIsNone(base.download_metadata.get('crime_2013'))
+
+    def test_error_status(self):
+        conn = FakeApiConn(FakeResponse(b'', status_code=500))
+        with self.assertRaises(Exception):
+            conn.download_if_changed('crime_2013', 'crime.csv',
+                                     self.path('day1'))
+        self.assertFalse(os.path.exists(self.path('day1')))
+        self.assertTrue(conn.response.closed)
+
+    def test_not_modified(self):
+        conn = FakeApiConn(FakeResponse(DATA, headers={'ETag': '"v1"'}),
+                           FakeResponse(b'', status_code=304))
+        self.assertTrue(conn.download_if_changed('crime_2013', 'crime.csv',
+                                                 self.path('day1')))
+        self.assertEqual(conn.kwargs['headers'], {})
+
+        self.assertFalse(conn.download_if_changed('crime_2013', 'crime.csv',
+                                                  self.path('day2')))
+        self.assertEqual(conn.kwargs['headers'], {'If-None-Match': '"v1"'})
+        self.assertFalse(os.path.exists(self.path('day2')))
+
+    def test_same_checksum(self):
+        conn = FakeApiConn(FakeResponse(DATA), FakeResponse(DATA),
+                           FakeResponse(DATA + b'1000,row 1000\n'))
+        self.assertTrue(conn.download_if_changed('crime_2013', 'crime.csv',
+                                                 self.path('day1')))
+        self.assertFalse(conn.download_if_changed('crime_2013', 'crime.csv',
+                                                  self.path('day2')))
+        self.assertFalse(os.path.exists(self.path('day2')))
+        self.assertTrue(conn.download_if_changed('crime_2013', 'crime.csv',
+                                                 self.path('day3')))
+
+    def test_missing_previous_file(self):
+        conn = FakeApiConn(FakeResponse(DATA, headers={'ETag': '"v1"'}),
+                           FakeResponse(DATA, headers={'ETag': '"v1"'}))
+        conn.download_if_changed('crime_2013', 'crime.csv', self.path('day1'))
+        os.remove(self.path('day1'))
+
+        self.assertTrue(conn.download_if_changed('crime_2013', 'crime.csv',
+                                                 self.path('day2')))
+        self.assertEqual(conn.kwargs['headers'], {})
+
+    def test_get_if_changed(self):
+        params = {'get': 'NAME'}
+        conn = FakeApiConn(FakeResponse(DATA), FakeResponse(DATA),
+                           FakeResponse(DATA))
+        result = conn.get_if_changed('acs5_2015', '2015/acs5', params)
+        conn.create_directory_if_missing(self.path('day1'))
+        with open(self.path('day1'), 'wb') as f:
+            f.write(result.content)
+        conn.record_download('acs5_2015', '2015/acs5', params, result,
+                             self.path('day1'))
+
+        self.assertIsNone(conn.get_if_changed('acs5_2015', '2015/acs5',
+                                              params))
+        # a different request isn't compared with the last one
+        self.assertIsNotNone(conn.get_if_changed('acs5_2015', '2015/acs5',
+                                                 {'get': 'NAME,B01003_001E'}))
+
+
+if __name__ == '__main__':
+    unittest.main()
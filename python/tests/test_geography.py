@@ -0,0 +1,42 @@
+import unittest
+import os
+import sys
+import tempfile
+
+# setup some useful absolute paths
+
+PYTHON_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir))
+# add to python system path
+sys.path.append(PYTHON_PATH)
+
+from housinginsights.tools import geography
+
+
+class GeographyTestCase(unittest.TestCase):
+    def test_reference_data(self):
+        mapping = geography.census_tract_mapping()
+        self.assertEqual(mapping['Tract 1'], '11001000100')
+        self.assertEqual(mapping['000201'], '11001000201')
+        self.assertIn('11001000100', geography.dc_census_tracts())
+        self.assertNotIn('24031700101', geography.dc_census_tracts())
+        self.assertIs(mapping, geography.census_tract_mapping())
+        with self.assertRaises(TypeError):
+            mapping['Tract 1'] = None
+
+    def test_pickle_cache(self):
+        with tempfile.TemporaryDirectory() as folder:
+            pickle_path = os.path.join(folder, 'geography.pickle')
+            data = geography._load(pickle_path=pickle_path)
+            self.assertTrue(os.path.isfile(pickle_path))
+            self.assertEqual(geography._load(pickle_path=pickle_path), data)
+            self.assertEqual(len(data['dc_tracts']), 179)
+
+    def test_names(self):
+        self.assertEqual(geography.ward_name('8'), 'Ward 8')
+        self.assertEqual(geography.ward_name('WARD 8'), 'Ward 8')
+        self.assertEqual(geography.cluster_name(39), 'Cluster 39')
+
+
+if __name__ == '__main__':
+    unittest.main()
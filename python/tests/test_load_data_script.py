@@ -0,0 +1,59 @@
+import unittest
+import importlib.util
+import os
+import sys
+from unittest.mock import patch
+
+# setup some useful absolute paths
+
+PYTHON_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir))
+# add to python system path
+sys.path.append(PYTHON_PATH)
+
+# scripts/ isn't a package, so load the script by its path
+spec = importlib.util.spec_from_file_location(
+    'load_data_script', os.path.join(PYTHON_PATH, 'scripts', 'load_data.py'))
+load_data_script = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(load_data_script)
+
+
+class LoadDataScriptTestCase(unittest.TestCase):
+    def run_script(self, *args):
+        """
+        Runs scripts/load_data.py with the args, returning the keyword
+        arguments LoadData was created with.
+        """
+        arguments = load_data_script.parse_args(list(args))
+        # --manual creates its LoadData in the script, the rest in main()
+        target = load_data_script if arguments.manual else \
+            sys.modules['housinginsights.ingestion.LoadData']
+        with patch.object(target, 'LoadData') as loader, \
+                patch('builtins.print'):
+            load_data_script.run(arguments)
+        return loader.call_args[1]
+
+    def test_defaults(self):
+        kwargs = self.run_script('local')
+        self.assertEqual(kwargs['database_choice'], 'local_database')
+        self.assertEqual(kwargs['workers'], 1)
+        self.assertFalse(kwargs['stream_load'])
+        self.assertFalse(kwargs['local_mar'])
+
+    def test_local_mar(self):
+        self.assertTrue(self.run_script('local', '--local-mar')['local_mar'])
+
+    def test_stream(self):
+        kwargs = self.run_script('local', '--stream')
+        self.assertTrue(kwargs['stream_load'])
+        self.assertTrue(self.run_script('local', '--manual',
+                                        '--stream')['stream_load'])
+
+    def test_stream_with_workers_rejected(self):
+        with patch('sys.stderr'), self.assertRaises(SystemExit):
+            load_data_script.parse_args(['local', '--stream', '--workers',
+                                         '2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,192 @@
+import unittest
+import io
+import os
+import sys
+import tempfile
+
+# setup some useful absolute paths
+
+PYTHON_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir))
+# add to python system path
+sys.path.append(PYTHON_PATH)
+
+from housinginsights.ingestion import HISql
+from housinginsights.ingestion.LoadData import LoadData
+
+
+def field(source_name, sql_name, required_in_source=True):
+    return {'source_name': source_name, 'sql_name': sql_name, 'type': 'text',
+            'required_in_source': required_in_source,
+            'display_name': sql_name, 'display_text': ''}
+
+
+# not tables the rollups are refreshed for, since there is no database
+META = {
+    'permits': {
+        'cleaner': 'BuildingPermitsCleaner',
+        'fields': [field('ISSUE_DATE', 'issue_date'),
+                   field('WARD', 'ward'),
+                   field('NEIGHBORHOODCLUSTER', 'neighborhood_cluster'),
+                   field('DESC', 'desc'),
+                   field('unique_data_id', 'unique_data_id', False)]
+    },
+    'zone_facts': {
+        'cleaner': 'GenericCleaner',
+        'fields': [field('zone', 'zone'),
+                   field('value', 'value'),
+                   field('unique_data_id', 'unique_data_id', False)]
+    }
+}
+
+BUILDING_PERMITS = 'ISSUE_DATE,WARD,NEIGHBORHOODCLUSTER,DESC\n' + ''.join(
+    '2017-03-{:02d}T00:00:00.000Z,{},{},NONE\n'.format(i % 28 + 1, i % 8 + 1,
+                                                       i % 39 + 1)
+    for i in range(200))
+ZONE_FACTS = 'zone,value\n' + ''.join('Ward {},{}\n'.format(i, i * 10)
+                                     for i in range(1, 9))
+
+FILES = [('permits', 'building_permits_2016', BUILDING_PERMITS),
+         ('permits', 'building_permits_2017',
+          ''.join(BUILDING_PERMITS.splitlines(True)[:21])),
+         ('zone_facts', 'zone_facts_2017', ZONE_FACTS)]
+
+
+class FakeSql(object):
+    """
+    Stands in for HISql: nothing has been loaded before.
+    """
+    def __init__(self, manifest_row, filename):
+        self.unique_data_id = manifest_row['unique_data_id']
+        self.filename = filename
+        self.merge_keys = None
+        self.content_hash = None
+        self.replace_existing = False
+        self.row_count = None
+
+    def get_sql_manifest_row(self):
+        return None
+
+
+class RecordingLoadData(LoadData):
+    """
+    LoadData that records the clean PSV of each file instead of copying it
+    into a database.
+    """
+    def __init__(self, manifest_rows, temp_folder, workers):
+        # skips LoadData.__init__, which connects to the database
+        self.meta = META
+        self.manifest_rows = manifest_rows
+        self.temp_folder = temp_folder
+        self.workers = workers
+        self.engine = None
+        self._stream_load = False
+        self._local_mar = False
+        self._keep_temp_files = True
+        self._failed_table_count = 0
+        self.loaded = {}
+
+    def _get_temp_filepath(self, manifest_row):
+        return os.path.join(self.temp_folder, 'temp_{}.psv'.format(
+            manifest_row['unique_data_id']))
+
+    def _configure_db_interface(self, manifest_row, temp_filepath):
+        return FakeSql(manifest_row, temp_filepath)
+
+    def _update_database(self, sql_interface, data_file=None):
+        with open(sql_interface.filename, encoding='utf-8') as f:
+            self.loaded[sql_interface.unique_data_id] = (
+                f.read(), sql_interface.row_count)
+
+
+class WorkersTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.manifest_rows = []
+        for table, uid, data in FILES:
+            with open(os.path.join(self.folder.name, uid + '.csv'), 'w') as f:
+                f.write(data)
+            self.manifest_rows.append({
+                'include_flag': 'use', 'destination_table': table,
+                'unique_data_id': uid, 'update_method': 'api',
+                'encoding': 'utf-8', 'local_folder': self.folder.name,
+                's3_folder': 'https://s3.amazonaws.com/housinginsights',
+                'filepath': uid + '.csv'})
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def load(self, workers):
+        temp_folder = os.path.join(self.folder.name, str(workers))
+        os.makedirs(temp_folder)
+        loader = RecordingLoadData(self.manifest_rows, temp_folder, workers)
+        loader._process_data_files(manifest_rows=self.manifest_rows)
+        self.assertEqual(loader._failed_table_count, 0)
+        return loader.loaded
+
+    def test_workers_match_single_process(self):
+        serial = self.load(workers=1)
+        parallel = self.load(workers=2)
+
+        self.assertEqual(sorted(serial), [uid for table, uid, data in FILES])
+        self.assertEqual(parallel, serial)
+        self.assertEqual(serial['building_permits_2016'][1], 200)
+        self.assertIn('Cluster 39', serial['building_permits_2016'][0])
+
+
+class FakeCursor(object):
+    def __init__(self, statements):
+        self.statements = statements
+
+    def execute(self, statement, params=None):
+        self.statements.append((statement, params))
+
+    def copy_from(self, data_file, table, **kwargs):
+        self.statements.append(('COPY {}'.format(table), data_file.read()))
+
+
+class FakeConnection(object):
+    def __init__(self):
+        self.statements = []
+        self.connection = self
+
+    def set_client_encoding(self, encoding):
+        pass
+
+    def cursor(self):
+        return FakeCursor(self.statements)
+
+    def commit(self):
+        self.statements.append(('COMMIT', None))
+
+
+class ReplaceExistingTestCase(unittest.TestCase):
+    def copy(self, replace_existing):
+        manifest_row = {'destination_table': 'zone_facts',
+                        'unique_data_id': 'zone_facts_2017',
+                        'update_method': 'api'}
+        sql_interface = HISql(META, manifest_row, engine=None)
+        sql_interface.replace_existing = replace_existing
+        # the manifest row is written with the same connection
+        sql_interface.update_manifest_row = lambda conn, status: \
+            conn.statements.append(('MANIFEST', status))
+
+        conn = FakeConnection()
+        sql_interface._copy_from_file(conn=conn, data_file=io.StringIO(
+            'Ward 1|10|zone_facts_2017\n'))
+        return [statement for statement, params in conn.statements]
+
+    def test_old_rows_replaced_in_load_transaction(self):
+        statements = self.copy(replace_existing=True)
+        self.assertEqual(statements[0], "DELETE FROM zone_facts WHERE "
+                                        "unique_data_id = %(uid)s;")
+        self.assertEqual(statements[1:], ['COPY zone_facts', 'MANIFEST',
+                                          'COMMIT'])
+
+    def test_new_file(self):
+        self.assertEqual(self.copy(replace_existing=False),
+                         ['COPY zone_facts', 'MANIFEST', 'COMMIT'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+import os
+import sys
+import tempfile
+from csv import DictWriter
+
+# setup some useful absolute paths
+
+PYTHON_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir))
+# add to python system path
+sys.path.append(PYTHON_PATH)
+
+from housinginsights.ingestion.Manifest import Manifest
+
+FIELDS = ['include_flag', 'destination_table', 'unique_data_id',
+          'data_date', 'filepath']
+
+
+class ManifestTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, 'manifest.csv')
+        self.write_manifest([
+            ['use', 'crime', 'crime_2016', '12/31/2016', 'crime_2016.csv'],
+            ['use', 'crime', 'crime_2017', '2017-06-06', 'crime_2017.csv'],
+            ['skip', 'crime', 'crime_2015', '', 'crime_2015.csv'],
+            ['use', 'project', 'prescat_project', '1/1/2017', 'project.csv']
+        ])
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def write_manifest(self, rows):
+        with open(self.path, 'w', newline='') as f:
+            writer = DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(dict(zip(FIELDS, row)))
+
+    def test_lookups(self):
+        manifest = Manifest(self.path)
+        self.assertEqual(len(manifest), 4)
+        row = manifest.get_manifest_row('crime_2016')
+        self.assertEqual(row['data_date'], '2016-12-31')
+        self.assertIsNone(manifest.get_manifest_row('crime_2015'))
+        self.assertIsNone(manifest.get_manifest_row('missing'))
+        self.assertEqual(
+            [r['unique_data_id'] for r in
+             manifest.rows(include_flag='use', destination_table='crime')],
+            ['crime_2016', 'crime_2017'])
+        self.assertEqual(list(manifest)[2]['data_date'], 'Null')
+
+        # rows handed out are copies
+        row['data_date'] = 'changed'
+        self.assertEqual(manifest.get_manifest_row('crime_2016')['data_date'],
+                         '2016-12-31')
+
+    def test_filtered_rows(self):
+        manifest = Manifest(self.path)
+        uids = lambda rows: [r['unique_data_id'] for r in rows]
+        self.assertEqual(uids(manifest.rows(include_flag='use')),
+                         ['crime_2016', 'crime_2017', 'prescat_project'])
+        self.assertEqual(uids(manifest.rows(include_flag='skip')),
+                         ['crime_2015'])
+        self.assertEqual(uids(manifest.rows(destination_table='crime')),
+                         ['crime_2016', 'crime_2017', 'crime_2015'])
+        self.assertEqual(uids(manifest.rows(destination_table='missing')), [])
+        self.assertEqual(uids(manifest.rows()), uids(manifest))
+        self.assertEqual(sorted(manifest.unique_ids),
+                         ['crime_2016', 'crime_2017', 'prescat_project'])
+
+    def test_reloads_when_file_changes(self):
+        manifest = Manifest(self.path)
+        self.assertIsNotNone(manifest.get_manifest_row('crime_2017'))
+        self.write_manifest([
+            ['use', 'crime', 'crime_2018', '2018-01-01', 'crime_2018.csv']
+        ])
+        os.utime(self.path, ns=(0, 0))
+        self.assertIsNone(manifest.get_manifest_row('crime_2017'))
+        self.assertIsNotNone(manifest.get_manifest_row('crime_2018'))
+
+    def test_duplicate_ids(self):
+        self.write_manifest([
+            ['use', 'crime', 'crime_2016', '2016-12-31', 'a.csv'],
+            ['skip', 'crime', 'crime_2016', '2016-12-31', 'b.csv']
+        ])
+        with self.assertRaises(ValueError):
+            Manifest(self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
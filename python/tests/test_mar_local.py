@@ -0,0 +1,91 @@
+import unittest
+import os
+import sys
+
+# setup some useful absolute paths
+
+PYTHON_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir))
+# add to python system path
+sys.path.append(PYTHON_PATH)
+
+from housinginsights.ingestion import Cleaners
+from housinginsights.sources.mar import MarApiConn
+from housinginsights.sources.mar_local import LocalMarConn
+
+MAR_PATH = os.path.join(os.path.dirname(__file__), 'test_data',
+                        'mar_sample.csv')
+
+
+class LocalMarConnTestCase(unittest.TestCase):
+    def setUp(self):
+        self.mar = LocalMarConn(path=MAR_PATH)
+
+    def test_load(self):
+        self.assertEqual(len(self.mar), 4)
+
+    def test_reverse_lat_lng_geocode(self):
+        result = self.mar.reverse_lat_lng_geocode('38.84456326',
+                                                  '-76.98799165')
+        # nearest first, only addresses within 200 meters
+        self.assertEqual(len(result['Table1']), 2)
+        self.assertEqual(result['Table1'][0]['ADDRESS_ID'], 68416)
+        self.assertEqual(result['Table1'][0]['distance'], 0)
+        self.assertEqual(result['Table1'][1]['ADDRESS_ID'], 294865)
+
+    def test_reverse_geocode(self):
+        result = self.mar.reverse_geocode('401042.46', '130751.44')
+        self.assertEqual(result['Table1'][0]['FULLADDRESS'],
+                         "1309 ALABAMA AVENUE SE")
+        self.assertEqual(result['Table1'][0]['XCOORD'], 401042.46)
+
+        result = self.mar.reverse_geocode('0', '0')
+        self.assertEqual(result['Table1'], [])
+
+    def test_reverse_address_id(self):
+        result = self.mar.reverse_address_id(231167)
+        loc_object = result['returnDataset']['Table1'][0]
+        self.assertEqual(loc_object['FULLADDRESS'], '1210 LAMONT STREET NW')
+        self.assertEqual(loc_object['WARD'], 'Ward 1')
+
+        result = self.mar.reverse_address_id('999')
+        self.assertFalse('Table1' in result['returnDataset'])
+
+    def test_find_location(self):
+        result = self.mar.find_location('1210  lamont street nw')
+        table = result['returnDataset']['Table1']
+        self.assertEqual(table[0]['ADDRESS_ID'], 231167)
+
+        result = self.mar.find_location('8512 Wagon Wheel Rd')
+        self.assertIsNone(result['returnDataset'])
+
+    def test_fallback(self):
+        class FakeApi(object):
+            def find_location(self, location, output_type, output_file):
+                return 'from api'
+
+        mar = LocalMarConn(path=MAR_PATH, fallback=FakeApi())
+        self.assertEqual(mar.find_location('8512 Wagon Wheel Rd'), 'from api')
+
+
+class GetMarApiTestCase(unittest.TestCase):
+    def setUp(self):
+        self._find_latest_mar_csv = Cleaners.find_latest_mar_csv
+        Cleaners.find_latest_mar_csv = lambda: MAR_PATH
+
+    def tearDown(self):
+        Cleaners.find_latest_mar_csv = self._find_latest_mar_csv
+        Cleaners.use_local_mar(False)
+
+    def test_local_mar_is_opt_in(self):
+        Cleaners.use_local_mar(False)
+        self.assertNotIsInstance(Cleaners.get_mar_api(), LocalMarConn)
+
+        Cleaners.use_local_mar(True)
+        mar_api = Cleaners.get_mar_api()
+        self.assertIsInstance(mar_api, LocalMarConn)
+        self.assertIsInstance(mar_api.fallback, MarApiConn)
+
+
+if __name__ == '__main__':
+    unittest.main()
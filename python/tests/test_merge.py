@@ -0,0 +1,133 @@
+import unittest
+import io
+import json
+import os
+import sys
+import tempfile
+
+# setup some useful absolute paths
+
+PYTHON_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir))
+# add to python system path
+sys.path.append(PYTHON_PATH)
+
+from housinginsights.ingestion import HISql, TableWritingError, \
+    get_merge_keys
+from housinginsights.ingestion.functions import load_meta_data
+
+META = {
+    'crime': {
+        'cleaner': 'CrimeCleaner',
+        'natural_key': ['objectid'],
+        'fields': [
+            {'source_name': 'OBJECTID', 'sql_name': 'objectid',
+             'type': 'text', 'display_name': 'Object ID',
+             'display_text': ''},
+            {'source_name': 'OFFENSE', 'sql_name': 'offense',
+             'type': 'text', 'display_name': 'Offense', 'display_text': ''},
+            {'source_name': 'unique_data_id', 'sql_name': 'unique_data_id',
+             'type': 'text', 'display_name': 'Unique data ID',
+             'display_text': ''}
+        ]
+    }
+}
+
+
+class RecordingCursor(object):
+    rowcount = 0
+
+    def __init__(self, key_counts=(1, 0, 1)):
+        # (rows, rows with a NULL key, distinct keys) of the staging table
+        self.key_counts = key_counts
+        self.statements = []
+
+    def execute(self, statement, params=None):
+        self.statements.append((statement, params))
+
+    def fetchone(self):
+        return self.key_counts
+
+    def copy_from(self, data_file, table, **kwargs):
+        self.statements.append(('COPY {}'.format(table), data_file.read()))
+
+
+def manifest_row(update_method):
+    return {'destination_table': 'crime', 'unique_data_id': 'crime_2017',
+            'update_method': update_method}
+
+
+class MergeKeysTestCase(unittest.TestCase):
+    def test_get_merge_keys(self):
+        self.assertEqual(get_merge_keys(META, manifest_row('merge')),
+                         ['objectid'])
+        self.assertIsNone(get_merge_keys(META, manifest_row('api')))
+
+        meta = {'crime': dict(META['crime'])}
+        del meta['crime']['natural_key']
+        self.assertIsNone(get_merge_keys(meta, manifest_row('merge')))
+
+    def test_meta_natural_key_is_validated(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'meta.json')
+            with open(path, 'w') as f:
+                json.dump(META, f)
+            self.assertEqual(load_meta_data(path)['crime']['natural_key'],
+                             ['objectid'])
+
+            meta = {'crime': dict(META['crime'], natural_key=['ccn'])}
+            with open(path, 'w') as f:
+                json.dump(meta, f)
+            with self.assertRaises(ValueError):
+                load_meta_data(path)
+
+
+class MergeFromFileTestCase(unittest.TestCase):
+    def merge(self, cursor, data='1|THEFT|crime_2017\n'):
+        sql_interface = HISql(META, manifest_row('merge'), engine=None)
+        sql_interface._merge_from_file(cursor=cursor,
+                                       data_file=io.StringIO(data))
+
+    def test_merge_statements(self):
+        cursor = RecordingCursor()
+        data = '1|THEFT|crime_2017\n'
+        self.merge(cursor, data)
+
+        statements = [statement for statement, params in cursor.statements]
+        self.assertIn("CREATE UNIQUE INDEX IF NOT EXISTS crime_natural_key "
+                      "ON crime (unique_data_id,objectid)", statements[0])
+        self.assertIn("CREATE TEMP TABLE crime_staging (LIKE crime)",
+                      statements[1])
+        self.assertEqual(cursor.statements[2], ('COPY crime_staging', data))
+        self.assertIn("FILTER (WHERE unique_data_id IS NULL OR objectid IS "
+                      "NULL)", statements[3])
+
+        # vanished keys of this file only are deleted
+        self.assertTrue(statements[4].startswith("DELETE FROM crime"))
+        self.assertIn("s.objectid = t.objectid", statements[4])
+        self.assertEqual(cursor.statements[4][1], {'uid': 'crime_2017'})
+
+        # only rows with changed values are updated
+        self.assertIn("ON CONFLICT (unique_data_id,objectid) DO UPDATE SET "
+                      "offense = EXCLUDED.offense WHERE (crime.offense) IS "
+                      "DISTINCT FROM (EXCLUDED.offense)", statements[5])
+
+    def test_null_keys_rejected(self):
+        cursor = RecordingCursor(key_counts=(3, 1, 2))
+        with self.assertRaises(TableWritingError):
+            self.merge(cursor)
+        # nothing is merged into the table
+        self.assertEqual(len(cursor.statements), 4)
+
+    def test_duplicate_keys_rejected(self):
+        cursor = RecordingCursor(key_counts=(5, 0, 3))
+        with self.assertLogs(level='WARNING') as logs, \
+                self.assertRaises(TableWritingError):
+            self.merge(cursor)
+        self.assertIn("2 of 5 rows of crime_2017 repeat a key",
+                      logs.output[0])
+        self.assertEqual(len(cursor.statements), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import os
+import random
+import sys
+
+# setup some useful absolute paths
+
+PYTHON_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir))
+# add to python system path
+sys.path.append(PYTHON_PATH)
+# the api is deployed on its own, so its modules aren't in a package
+sys.path.append(os.path.join(PYTHON_PATH, 'api'))
+
+from point_index import PointIndex
+from housinginsights.tools.spatial import haversine
+
+
+def brute_force(rows, latitude, longitude, dist):
+    found = [(haversine(latitude, longitude, float(row['latitude']),
+                        float(row['longitude'])), row['id'])
+             for row in rows if row['latitude'] is not None]
+    return sorted(x for x in found if x[0] <= dist)
+
+
+class PointIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(20170801)
+        # spread over DC and a little beyond, some on cell boundaries
+        self.rows = [{'id': i,
+                      'latitude': str(38.80 + rng.random() * 0.2),
+                      'longitude': str(-77.12 + rng.random() * 0.2)}
+                     for i in range(500)]
+        self.rows += [{'id': 500, 'latitude': '38.9', 'longitude': '-77.03'},
+                      {'id': 501, 'latitude': None, 'longitude': None}]
+        self.index = PointIndex(self.rows)
+        self.points = [(38.9, -77.03), (38.8123, -77.1199),
+                       (38.95, -76.95), (39.2, -77.0)]
+
+    def ids(self, found):
+        return [(round(d, 9), row['id']) for d, row in found]
+
+    def expected(self, latitude, longitude, dist):
+        return [(round(d, 9), i)
+                for d, i in brute_force(self.rows, latitude, longitude, dist)]
+
+    def test_within(self):
+        for latitude, longitude in self.points:
+            for dist in [0, 0.1, 0.5, 1, 3]:
+                self.assertEqual(
+                    sorted(self.ids(self.index.within(latitude, longitude,
+                                                      dist))),
+                    self.expected(latitude, longitude, dist))
+
+    def test_within_where(self):
+        even = self.index.within(38.9, -77.03, 2,
+                                 where=lambda row: row['id'] % 2 == 0)
+        self.assertEqual(sorted(self.ids(even)),
+                         [x for x in self.expected(38.9, -77.03, 2)
+                          if x[1] % 2 == 0])
+
+    def test_nearest(self):
+        for latitude, longitude in self.points:
+            for k, max_dist in [(1, 0.5), (5, 0.5), (10, 3), (600, 20)]:
+                found = self.ids(self.index.nearest(latitude, longitude, k,
+                                                    max_dist))
+                expected = self.expected(latitude, longitude, max_dist)[:k]
+                self.assertEqual([d for d, i in found],
+                                 [d for d, i in expected])
+
+    def test_empty(self):
+        index = PointIndex([])
+        self.assertEqual(index.within(38.9, -77.03, 1), [])
+        self.assertEqual(index.nearest(38.9, -77.03, 5, 1), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
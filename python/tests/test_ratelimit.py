@@ -0,0 +1,100 @@
+import unittest
+from unittest import mock
+import os
+import sys
+
+# setup some useful absolute paths
+
+PYTHON_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir))
+# add to python system path
+sys.path.append(PYTHON_PATH)
+
+from housinginsights.tools.ratelimit import RateLimiter
+
+
+class FakeClock(object):
+    """
+    Stands in for the time module; sleeping just moves the clock forward.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class RateLimiterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch('housinginsights.tools.ratelimit.time',
+                             self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_does_not_wait(self):
+        limiter = RateLimiter(rate=5)
+        for _ in range(5):
+            limiter.acquire()
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_waits_once_burst_is_spent(self):
+        limiter = RateLimiter(rate=4, burst=2)
+        for _ in range(3):
+            limiter.acquire()
+        self.assertEqual(self.clock.sleeps, [0.25])
+
+    def test_average_rate(self):
+        limiter = RateLimiter(rate=10, burst=1)
+        start = self.clock.now
+        for _ in range(101):
+            limiter.acquire()
+        self.assertAlmostEqual(self.clock.now - start, 10.0)
+        for seconds in self.clock.sleeps:
+            self.assertAlmostEqual(seconds, 0.1)
+
+    def test_refill_is_capped_at_burst(self):
+        limiter = RateLimiter(rate=2, burst=3)
+        for _ in range(3):
+            limiter.acquire()
+        # idle long enough to refill many times over; only burst is kept
+        self.clock.advance(60)
+        for _ in range(3):
+            limiter.acquire()
+        self.assertEqual(self.clock.sleeps, [])
+        limiter.acquire()
+        self.assertEqual(self.clock.sleeps, [0.5])
+
+    def test_partial_refill(self):
+        limiter = RateLimiter(rate=2, burst=2)
+        limiter.acquire()
+        limiter.acquire()
+        self.clock.advance(0.5)
+        limiter.acquire()
+        self.assertEqual(self.clock.sleeps, [])
+        limiter.acquire()
+        self.assertEqual(self.clock.sleeps, [0.5])
+
+    def test_debt_queues_callers(self):
+        # callers that arrive together while the bucket is empty each wait
+        # one interval longer than the caller before them
+        limiter = RateLimiter(rate=2, burst=1)
+        limiter.acquire()
+        waits = []
+        for _ in range(3):
+            with mock.patch.object(self.clock, 'sleep', waits.append):
+                limiter.acquire()
+        self.assertEqual(waits, [0.5, 1.0, 1.5])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+import unittest
+import json
+import os
+import sys
+
+# setup some useful absolute paths
+
+PYTHON_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir))
+# add to python system path
+sys.path.append(PYTHON_PATH)
+# the api is deployed on its own, so its modules aren't in a package
+sys.path.append(os.path.join(PYTHON_PATH, 'api'))
+
+import raw_tables
+
+ROWS = [('crime_2016', str(i), {'unique_data_id': 'crime_2016',
+                                'objectid': str(i)}) for i in range(10, 14)] \
+    + [('crime_2017', str(i), {'unique_data_id': 'crime_2017',
+                               'objectid': str(i)}) for i in range(10, 13)]
+
+
+class FakeCursor(object):
+    """
+    Named cursor over ROWS that answers raw_query's keyset conditions.
+    """
+    def __init__(self, conn, name):
+        self.conn = conn
+        self.name = name
+        self.itersize = None
+        self.rows = []
+
+    def execute(self, q, params):
+        self.conn.queries.append((q, params))
+        rows = sorted(ROWS)
+        if 'after_0' in params:
+            after = (params['after_0'], params['after_1'])
+            rows = [row for row in rows if row[:2] > after]
+        if 'limit' in params:
+            rows = rows[:params['limit']]
+        self.rows = rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def close(self):
+        pass
+
+
+class FakeConnection(object):
+    def __init__(self):
+        self.queries = []
+        self.cursors = []
+        self.closed = False
+
+    def cursor(self, name=None):
+        cursor = FakeCursor(self, name)
+        self.cursors.append(cursor)
+        return cursor
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class FakeEngine(object):
+    def __init__(self):
+        self.connections = []
+
+    def raw_connection(self):
+        conn = FakeConnection()
+        self.connections.append(conn)
+        return conn
+
+
+KEY = ['unique_data_id', 'objectid']
+
+
+class RawQueryTestCase(unittest.TestCase):
+    def test_keyset_query(self):
+        q, params = raw_tables.raw_query('crime', KEY,
+                                         after=['crime_2016', '13'], limit=3)
+        self.assertEqual(
+            q, 'SELECT t.unique_data_id, t.objectid, row_to_json(t) '
+               'FROM crime AS t '
+               'WHERE (t.unique_data_id, t.objectid) > '
+               '(%(after_0)s, %(after_1)s) '
+               'ORDER BY t.unique_data_id, t.objectid LIMIT %(limit)s')
+        self.assertEqual(params, {'after_0': 'crime_2016', 'after_1': '13',
+                                  'limit': 3})
+
+    def test_no_key(self):
+        q, params = raw_tables.raw_query('census', None, limit=3)
+        self.assertEqual(q, 'SELECT row_to_json(t) FROM census AS t '
+                            'LIMIT %(limit)s')
+        with self.assertRaises(ValueError):
+            raw_tables.raw_query('census', None, after=['x'])
+
+    def test_parse_after(self):
+        after = raw_tables.format_after(('crime_2016', '13'))
+        self.assertEqual(raw_tables.parse_after(after, KEY),
+                         ['crime_2016', '13'])
+        for bad in ['(0,1)', '["crime_2016"]', '{"a": 1}']:
+            with self.assertRaises(ValueError):
+                raw_tables.parse_after(bad, KEY)
+
+
+class RawRowsTestCase(unittest.TestCase):
+    def test_paging(self):
+        engine = FakeEngine()
+        items = []
+        after = None
+        pages = 0
+        while True:
+            rows = raw_tables.raw_rows(engine, 'crime', KEY, after=after,
+                                       limit=3)
+            page, next_key = raw_tables.page(rows, 3)
+            items.extend(page)
+            pages += 1
+            if next_key is None:
+                break
+            after = raw_tables.parse_after(next_key, KEY)
+
+        self.assertEqual(items, [row[2] for row in sorted(ROWS)])
+        self.assertEqual(pages, 3)
+        for conn in engine.connections:
+            self.assertEqual(conn.cursors[0].name, 'raw_crime')
+            self.assertEqual(conn.cursors[0].itersize,
+                             raw_tables.RAW_FETCH_SIZE)
+            self.assertTrue(conn.closed)
+
+    def test_unkeyed_table_has_one_page(self):
+        rows = raw_tables.raw_rows(FakeEngine(), 'crime', None, limit=3)
+        page, next_key = raw_tables.page(rows, 3)
+        self.assertEqual(len(page), 3)
+        self.assertIsNone(next_key)
+
+    def test_ndjson(self):
+        engine = FakeEngine()
+        rows = raw_tables.raw_rows(engine, 'crime', KEY,
+                                   after=['crime_2017', '10'])
+        lines = list(raw_tables.ndjson(rows))
+        self.assertTrue(all(line.endswith('\n') for line in lines))
+        self.assertEqual([json.loads(line) for line in lines],
+                         [row[2] for row in sorted(ROWS)[-2:]])
+        self.assertNotIn('limit', engine.connections[0].queries[0][1])
+        self.assertTrue(engine.connections[0].closed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+import os
+import sys
+from datetime import datetime
+
+# setup some useful absolute paths
+
+PYTHON_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir))
+# add to python system path
+sys.path.append(PYTHON_PATH)
+# the api is deployed on its own, so its modules aren't in a package
+sys.path.append(os.path.join(PYTHON_PATH, 'api'))
+
+from response_cache import ResponseCache
+
+
+class FakeEngine(object):
+    """
+    Returns the manifest load dates of load_dates from every query.
+    """
+    def __init__(self, load_dates):
+        self.load_dates = load_dates
+        self.queries = 0
+
+    def connect(self):
+        return self
+
+    def execute(self, q):
+        self.queries += 1
+        return self
+
+    def fetchall(self):
+        return list(self.load_dates.items())
+
+    def close(self):
+        pass
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = FakeEngine({'crime': datetime(2017, 7, 1),
+                                  'project': datetime(2017, 7, 2)})
+
+    def test_lru_eviction(self):
+        cache = ResponseCache(self.engine, max_entries=2)
+        cache.set('a', ['crime'], 'A')
+        cache.set('b', ['crime'], 'B')
+        # 'a' is now the most recently used
+        self.assertEqual(cache.get('a', ['crime']), 'A')
+        cache.set('c', ['crime'], 'C')
+
+        self.assertIsNone(cache.get('b', ['crime']))
+        self.assertEqual(cache.get('a', ['crime']), 'A')
+        self.assertEqual(cache.get('c', ['crime']), 'C')
+
+    def test_ttl(self):
+        cache = ResponseCache(self.engine, ttl=60)
+        cache.set('a', ['crime'], 'A')
+        self.assertEqual(cache.get('a', ['crime']), 'A')
+
+        created, stamp, response = cache._entries['a']
+        cache._entries['a'] = (created - 61, stamp, response)
+        self.assertIsNone(cache.get('a', ['crime']))
+        self.assertNotIn('a', cache._entries)
+
+    def test_invalidated_by_load_date(self):
+        cache = ResponseCache(self.engine, poll_seconds=0)
+        cache.set('crime', ['crime'], 'crime')
+        cache.set('project', ['project'], 'project')
+        cache.set('all', None, 'all')
+
+        self.engine.load_dates['crime'] = datetime(2017, 8, 1)
+        self.assertIsNone(cache.get('crime', ['crime']))
+        self.assertEqual(cache.get('project', ['project']), 'project')
+        # depends on every table
+        self.assertIsNone(cache.get('all', None))
+
+    def test_stamp(self):
+        cache = ResponseCache(self.engine)
+        self.assertEqual(cache.stamp(['crime', 'census']),
+                         (datetime(2017, 7, 1), None))
+        # the latest load of any table
+        self.assertEqual(cache.stamp(), datetime(2017, 7, 2))
+
+    def test_load_dates_polling(self):
+        cache = ResponseCache(self.engine, poll_seconds=60)
+        cache.set('crime', ['crime'], 'crime')
+        self.engine.load_dates['crime'] = datetime(2017, 8, 1)
+        # not re-checked until poll_seconds have passed
+        self.assertEqual(cache.get('crime', ['crime']), 'crime')
+        self.assertEqual(self.engine.queries, 1)
+
+        cache._load_dates_checked -= 61
+        self.assertIsNone(cache.get('crime', ['crime']))
+        self.assertEqual(self.engine.queries, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
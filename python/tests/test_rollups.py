@@ -0,0 +1,140 @@
+import unittest
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import create_engine
+
+# setup some useful absolute paths
+
+PYTHON_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir))
+# add to python system path
+sys.path.append(PYTHON_PATH)
+
+from housinginsights.ingestion.functions import load_meta_data
+from housinginsights.ingestion.rollups import rollup_groupings, \
+    refresh_file_rollups, delete_file_rollups, ROLLUP_SOURCES, ROLLUP_TABLE
+
+
+class RollupsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.meta = load_meta_data(os.path.join(PYTHON_PATH, 'scripts',
+                                                'meta.json'))
+
+    def test_rollup_groupings(self):
+        self.assertEqual(rollup_groupings(self.meta, 'crime'),
+                         ['ward', 'neighborhood_cluster', 'anc',
+                          'census_tract'])
+        self.assertEqual(rollup_groupings(self.meta, 'building_permits'),
+                         ['ward', 'neighborhood_cluster', 'anc', 'zip'])
+
+    def test_sources_match_meta(self):
+        for table_name, source in ROLLUP_SOURCES.items():
+            sql_names = [field['sql_name']
+                         for field in self.meta[table_name]['fields']]
+            self.assertIn(source['date_field'], sql_names)
+
+
+class RollupCountsTestCase(unittest.TestCase):
+    """
+    The api filters the raw tables on [first_day, end_day), and the rollups
+    must give the same counts for any such range.
+    """
+    def setUp(self):
+        self.meta = load_meta_data(os.path.join(PYTHON_PATH, 'scripts',
+                                                'meta.json'))
+        self.engine = create_engine('sqlite://')
+        self.engine.execute("CREATE TABLE crime (offense text, ward text, "
+                            "neighborhood_cluster text, anc text, "
+                            "census_tract text, report_date timestamp, "
+                            "unique_data_id text)")
+        start = datetime(2017, 1, 30, 0, 0)
+        rows = []
+        for i in range(200):
+            # every few hours over several days, including midnight
+            report_date = start + timedelta(hours=5 * i)
+            rows.append(('THEFT' if i % 3 else 'ROBBERY',
+                         'Ward {}'.format(i % 4), 'Cluster 1', '1A',
+                         '000100', report_date.strftime('%Y-%m-%d %H:%M:%S'),
+                         'crime_2017' if i % 2 else 'crime_2016'))
+        self.engine.execute("INSERT INTO crime VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            rows)
+        for uid in ['crime_2016', 'crime_2017']:
+            with self.engine.begin() as conn:
+                self.assertTrue(refresh_file_rollups(conn, self.meta,
+                                                     'crime', uid))
+
+    def raw_counts(self, first_day, end_day, additional_wheres=''):
+        proxy = self.engine.execute(
+            "SELECT ward, count(*) FROM crime "
+            "WHERE report_date >= ? AND report_date < ? {} "
+            "GROUP BY ward".format(additional_wheres),
+            (str(first_day), str(end_day)))
+        return dict(proxy.fetchall())
+
+    def rollup_counts(self, first_day, end_day, filter_name='all'):
+        proxy = self.engine.execute(
+            "SELECT zone, sum(records) FROM {} "
+            "WHERE source_table = 'crime' AND filter_name = ? "
+            "AND grouping = 'ward' AND day >= ? AND day < ? "
+            "GROUP BY zone".format(ROLLUP_TABLE),
+            (filter_name, str(first_day), str(end_day)))
+        return dict(proxy.fetchall())
+
+    def test_counts_match_raw_table(self):
+        ranges = [(date(2017, 1, 30), date(2017, 2, 1)),
+                  (date(2017, 1, 31), date(2017, 2, 2)),
+                  (date(2017, 2, 3), date(2017, 2, 4)),
+                  (date(2017, 1, 1), date(2017, 3, 1))]
+        for first_day, end_day in ranges:
+            raw = self.raw_counts(first_day, end_day)
+            self.assertTrue(raw)
+            self.assertEqual(self.rollup_counts(first_day, end_day), raw)
+
+            filters = ROLLUP_SOURCES['crime']['filters']
+            self.assertEqual(
+                self.rollup_counts(first_day, end_day, 'violent'),
+                self.raw_counts(first_day, end_day, filters['violent']))
+
+    def test_reload_replaces_only_its_file(self):
+        before = self.rollup_counts(date(2017, 1, 1), date(2017, 3, 1))
+        self.engine.execute("DELETE FROM crime WHERE unique_data_id = "
+                            "'crime_2017' AND ward = 'Ward 1'")
+        with self.engine.begin() as conn:
+            refresh_file_rollups(conn, self.meta, 'crime', 'crime_2017')
+
+        after = self.rollup_counts(date(2017, 1, 1), date(2017, 3, 1))
+        self.assertEqual(after, self.raw_counts(date(2017, 1, 1),
+                                                date(2017, 3, 1)))
+        # every Ward 1 row is in crime_2017, every Ward 0 row in crime_2016
+        self.assertIn('Ward 1', before)
+        self.assertNotIn('Ward 1', after)
+        self.assertEqual(after['Ward 0'], before['Ward 0'])
+
+    def test_rolled_back_with_the_load(self):
+        before = self.rollup_counts(date(2017, 1, 1), date(2017, 3, 1))
+        conn = self.engine.connect()
+        trans = conn.begin()
+        conn.execute("DELETE FROM crime WHERE unique_data_id = 'crime_2016'")
+        refresh_file_rollups(conn, self.meta, 'crime', 'crime_2016')
+        trans.rollback()
+        conn.close()
+        self.assertEqual(self.rollup_counts(date(2017, 1, 1),
+                                            date(2017, 3, 1)), before)
+
+    def test_delete_file_rollups(self):
+        with self.engine.begin() as conn:
+            delete_file_rollups(conn, 'crime', 'crime_2016')
+        proxy = self.engine.execute("SELECT DISTINCT unique_data_id FROM "
+                                    "{}".format(ROLLUP_TABLE))
+        self.assertEqual([x[0] for x in proxy.fetchall()], ['crime_2017'])
+
+    def test_tables_without_rollups(self):
+        with self.engine.begin() as conn:
+            self.assertFalse(refresh_file_rollups(conn, self.meta, 'project',
+                                                  'prescat_project'))
+
+
+if __name__ == '__main__':
+    unittest.main()
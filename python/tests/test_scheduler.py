@@ -0,0 +1,102 @@
+import unittest
+import os
+import sys
+import threading
+import time
+
+# setup some useful absolute paths
+
+PYTHON_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir))
+# add to python system path
+sys.path.append(PYTHON_PATH)
+
+from housinginsights.tools.scheduler import DownloadScheduler, \
+    DependencyError
+
+
+class ConcurrencyCounter(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = 0
+        self.peak = 0
+
+    def task(self, log=None, name=None):
+        def run():
+            with self.lock:
+                self.current += 1
+                self.peak = max(self.peak, self.current)
+            time.sleep(0.02)
+            with self.lock:
+                self.current -= 1
+                if log is not None:
+                    log.append(name)
+        return run
+
+
+class DownloadSchedulerTestCase(unittest.TestCase):
+    def test_dependencies_run_first(self):
+        log = []
+        counter = ConcurrencyCounter()
+        scheduler = DownloadScheduler(max_workers=4)
+        scheduler.add('split', counter.task(log, 'split'),
+                      depends_on=['download'])
+        scheduler.add('download', counter.task(log, 'download'))
+        scheduler.add('other', counter.task(log, 'other'))
+
+        self.assertEqual(scheduler.run(), {})
+        self.assertLess(log.index('download'), log.index('split'))
+        self.assertEqual(len(log), 3)
+
+    def test_host_limit(self):
+        counter = ConcurrencyCounter()
+        scheduler = DownloadScheduler(max_workers=8,
+                                      host_limits={'a.com': 2})
+        for i in range(6):
+            scheduler.add(str(i), counter.task(), host='a.com')
+        scheduler.run()
+        self.assertEqual(counter.peak, 2)
+
+    def test_failure_skips_dependents(self):
+        log = []
+        counter = ConcurrencyCounter()
+
+        def fail():
+            raise IOError('404')
+
+        scheduler = DownloadScheduler()
+        scheduler.add('download', fail)
+        scheduler.add('split', counter.task(log, 'split'),
+                      depends_on=['download'])
+        scheduler.add('other', counter.task(log, 'other'))
+
+        errors = scheduler.run()
+        self.assertIsInstance(errors['download'], IOError)
+        self.assertIsInstance(errors['split'], DependencyError)
+        self.assertEqual(log, ['other'])
+
+    def test_stop_on_error(self):
+        def fail():
+            raise IOError('404')
+
+        scheduler = DownloadScheduler(max_workers=1)
+        scheduler.add('download', fail)
+        scheduler.add('other', lambda: None)
+        with self.assertRaises(IOError):
+            scheduler.run(stop_on_error=True)
+
+    def test_invalid_graph(self):
+        scheduler = DownloadScheduler()
+        scheduler.add('a', lambda: None, depends_on=['b'])
+        scheduler.add('b', lambda: None, depends_on=['a'])
+        with self.assertRaises(ValueError):
+            scheduler.run()
+
+        scheduler = DownloadScheduler()
+        scheduler.add('a', lambda: None, depends_on=['missing'])
+        with self.assertRaises(ValueError):
+            scheduler.run()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import math
+import os
+import sys
+
+# setup some useful absolute paths
+
+PYTHON_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir))
+# add to python system path
+sys.path.append(PYTHON_PATH)
+
+from housinginsights.tools.spatial import GridIndex, haversine, \
+    degree_extents, EARTH_RADIUS_MILES, EARTH_RADIUS_METERS
+
+
+def destination(latitude, longitude, bearing, distance, radius):
+    """
+    Returns the (latitude, longitude) reached by going distance along the
+    bearing (in degrees) from the point, on a sphere of the given radius.
+    """
+    angle = distance / radius
+    lat1 = math.radians(latitude)
+    bearing = math.radians(bearing)
+    lat2 = math.asin(math.sin(lat1) * math.cos(angle) +
+                     math.cos(lat1) * math.sin(angle) * math.cos(bearing))
+    dlon = math.atan2(math.sin(bearing) * math.sin(angle) * math.cos(lat1),
+                      math.cos(angle) - math.sin(lat1) * math.sin(lat2))
+    return math.degrees(lat2), longitude + math.degrees(dlon)
+
+
+class DegreeExtentsTestCase(unittest.TestCase):
+    def test_circle_inside_box(self):
+        # every point on the circle haversine measures is inside the box
+        for distance, radius in [(0.5, EARTH_RADIUS_MILES),
+                                 (200, EARTH_RADIUS_METERS)]:
+            for latitude in [0.0, 38.9, 70.0]:
+                lon_extent, lat_extent = degree_extents(latitude, distance,
+                                                        radius)
+                for tenths in range(3600):
+                    lat, lon = destination(latitude, -77.0, tenths / 10,
+                                           distance, radius)
+                    self.assertLessEqual(abs(lat - latitude), lat_extent)
+                    self.assertLessEqual(abs(lon + 77.0), lon_extent)
+
+    def test_box_is_tight(self):
+        lon_extent, lat_extent = degree_extents(38.9, 0.5)
+        lat, lon = destination(38.9, -77.0, 0, 0.5, EARTH_RADIUS_MILES)
+        self.assertAlmostEqual(lat - 38.9, lat_extent, places=8)
+
+
+class GridIndexTestCase(unittest.TestCase):
+    def test_stops_on_the_edge_are_candidates(self):
+        # stops just inside half a mile due north and south, and due east
+        lat, lon = 38.9, -77.03
+        index = GridIndex(cell_size=0.01)
+        stops = [destination(lat, lon, bearing, 0.4999, EARTH_RADIUS_MILES)
+                 for bearing in [0, 90, 180]]
+        for stop_lat, stop_lon in stops:
+            index.insert(stop_lon, stop_lat, (stop_lat, stop_lon))
+
+        lon_extent, lat_extent = degree_extents(lat, 0.5)
+        found = [stop for stop in index.candidates(lon, lat, lon_extent,
+                                                   lat_extent)
+                 if haversine(lat, lon, stop[0], stop[1]) < 0.5]
+        self.assertEqual(sorted(found), sorted(stops))
+
+
+if __name__ == '__main__':
+    unittest.main()